@@ -4,9 +4,15 @@ import database
 from datetime import datetime, timedelta
 import pandas as pd
 import json
+import altair as alt
 
 st.set_page_config(page_title="AI Mechanic", layout="wide")
 
+# Chat tab: messages rendered per page, and how many are kept for display at all
+# (the prompt context is bounded separately by logic.ConversationMemory)
+CHAT_PAGE_SIZE = 20
+CHAT_HISTORY_LIMIT = 200
+
 def display_formatted_report(report_data):
     """Display a formatted and colored report"""
     if isinstance(report_data, dict) and 'accident_risk' in report_data:
@@ -246,6 +252,10 @@ if "three_recent_trips" not in st.session_state:
     st.session_state.three_recent_trips = [{"date": datetime.now().date(), "km": 0, "road": []}]*3
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "chat_memory" not in st.session_state:
+    st.session_state.chat_memory = logic.ConversationMemory()
+if "chat_visible" not in st.session_state:
+    st.session_state.chat_visible = CHAT_PAGE_SIZE
 if "parts_replaced" not in st.session_state:
     st.session_state.parts_replaced = []
 if "parts_dates" not in st.session_state:
@@ -277,7 +287,7 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-tab1, tab2 = st.tabs([" Diagnostic & Report", " AI Mechanic Chat"])
+tab1, tab2, tab3 = st.tabs([" Diagnostic & Report", " AI Mechanic Chat", " What-If Simulator"])
 
 # --- TAB 1: FORM WITH TRIP DATA COLLECTION ---
 with tab1:
@@ -553,10 +563,17 @@ with tab2:
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
     
-    # Display chat history
-    for message in st.session_state.chat_history:
+    # Display chat history - only the newest page(s), older messages on demand
+    hidden = max(0, len(st.session_state.chat_history) - st.session_state.chat_visible)
+    if hidden:
+        if st.button(f"⬆️ Show earlier messages ({hidden} hidden)", key="chat_show_earlier"):
+            st.session_state.chat_visible += CHAT_PAGE_SIZE
+            st.rerun()
+    for message in st.session_state.chat_history[hidden:]:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            if message.get("timing"):
+                st.caption(f"⏱️ First token {message['timing']['ttft_ms']:.0f} ms · total {message['timing']['total_ms']:.0f} ms")
     
     # Photo upload
     with st.expander(" Upload Vehicle Photo (Optional)", expanded=False):
@@ -574,6 +591,8 @@ with tab2:
     with col_clear:
         if st.button(" Clear Chat", use_container_width=True, key="clear_chat_btn"):
             st.session_state.chat_history = []
+            st.session_state.chat_memory.clear()
+            st.session_state.chat_visible = CHAT_PAGE_SIZE
             st.rerun()
     
     # Chat input - allows sending by pressing Enter
@@ -584,44 +603,105 @@ with tab2:
     
     # Process message when user sends it
     if user_query:
+        new_messages = []
+        
         # Add greeting only for the first message (when chat history is empty)
         if len(st.session_state.chat_history) == 0:
-            st.session_state.chat_history.append({
+            new_messages.append({
                 "role": "assistant",
                 "content": "👋 Hello! I'm your AI Mechanic. I'm here to help with any vehicle maintenance, repair, or automotive questions. What can I help you with today?"
             })
         
         # Add user message to chat
-        st.session_state.chat_history.append({
+        new_messages.append({
             "role": "user",
             "content": user_query
         })
+        st.session_state.chat_history.extend(new_messages)
+        for message in new_messages:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+        
+        vehicle_context = f"{st.session_state.vehicle_data.get('model', 'Vehicle')} in {st.session_state.vehicle_data.get('city', 'Location')}"
+        reply = {"role": "assistant"}
+        
+        with st.chat_message("assistant"):
+            # Check if a photo is currently uploaded
+            if photo:
+                # Photo analysis mode - analyze the image and provide report
+                analysis = {}
+                with st.spinner(" AI Mechanic is thinking..."):
+                    try:
+                        reply["content"] = logic.analyze_vision_chat(photo, user_query, vehicle_context, analysis)
+                    except Exception as e:
+                        reply["content"] = f"❌ Error: {str(e)[:200]}"
+                        analysis["error"] = True
+                st.markdown(reply["content"])
+                failed = analysis["error"]
+            else:
+                # Text-only chat mode - render tokens as they arrive
+                timing = {}
+                reply["content"] = st.write_stream(logic.stream_chat_with_mechanic(
+                    user_query, vehicle_context, timing, st.session_state.chat_memory
+                ))
+                failed = timing["error"]
+                if timing.get("ttft_ms") is not None:
+                    reply["timing"] = timing
+                    st.caption(f"⏱️ First token {timing['ttft_ms']:.0f} ms · total {timing['total_ms']:.0f} ms")
+        
+        # Add AI response to chat, and to the (bounded) conversation memory unless it is an error
+        st.session_state.chat_history.append(reply)
+        if not failed:
+            st.session_state.chat_memory.add_turn(user_query, reply["content"])
+        del st.session_state.chat_history[:-CHAT_HISTORY_LIMIT]
+
+# --- TAB 3: WHAT-IF RISK SIMULATOR (offline, no weather/LLM calls) ---
+with tab3:
+    st.subheader(" What-If Risk Simulator")
+    st.info("See how your accident risk changes as you drive further in different weather and on different roads. Runs instantly - no report or AI call needed.")
+    
+    vehicle = st.session_state.vehicle_data
+    sim_c1, sim_c2, sim_c3 = st.columns(3)
+    with sim_c1:
+        sim_odo = st.number_input("Current Odometer (km)", min_value=0, step=500, value=int(vehicle.get("odo", 0)), key="sim_odo")
+    with sim_c2:
+        sim_service = st.number_input("Last Service (km)", min_value=0, step=500, value=int(vehicle.get("s_odo", 0)), key="sim_service_odo")
+    with sim_c3:
+        sim_km = st.slider("Drive up to (extra km)", 1000, 30000, 10000, step=1000, key="sim_km")
+    
+    sim_weather = st.multiselect("Weather", list(logic.WHAT_IF_WEATHER), default=list(logic.WHAT_IF_WEATHER), key="sim_weather")
+    sim_roads = st.multiselect("Road Mix", list(logic.WHAT_IF_ROADS), default=list(logic.WHAT_IF_ROADS), key="sim_roads")
+    
+    if sim_weather and sim_roads:
+        simulation = logic.simulate_risk(
+            vehicle.get("v_type", "Petrol/Diesel Car"), sim_odo, sim_service, vehicle.get("fuel_type"),
+            st.session_state.get("parts_replaced"), distances=range(0, sim_km + 1, max(100, sim_km // 50)),
+            weather_scenarios=sim_weather, road_mixes=sim_roads
+        )
+        frame = logic.what_if_frame(simulation)
+        frame["scenario"] = frame["weather"] + " · " + frame["roads"]
+        
+        # Risk surface: one row per weather/road scenario, extra km along the x axis
+        st.altair_chart(
+            alt.Chart(frame).mark_rect().encode(
+                x=alt.X("extra_km:O", title="Extra km driven", axis=alt.Axis(labelOverlap=True)),
+                y=alt.Y("scenario:N", title=None),
+                color=alt.Color("score:Q", title="Risk", scale=alt.Scale(domain=[0, 100], scheme="redyellowgreen", reverse=True)),
+                tooltip=["odometer", "weather", "roads", "score", "level"]
+            ),
+            use_container_width=True
+        )
         
-        # Get AI response
-        with st.spinner(" AI Mechanic is thinking..."):
-            try:
-                vehicle_context = f"{st.session_state.vehicle_data.get('model', 'Vehicle')} in {st.session_state.vehicle_data.get('city', 'Location')}"
-                
-                # Check if a photo is currently uploaded
-                if photo:
-                    # Photo analysis mode - analyze the image and provide report
-                    response = logic.analyze_vision_chat(photo, user_query, vehicle_context)
-                else:
-                    # Text-only chat mode
-                    response = logic.chat_with_mechanic(user_query, vehicle_context)
-                
-                # Add AI response to chat
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-            except Exception as e:
-                error_msg = f"❌ Error: {str(e)[:200]}"
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": error_msg
-                })
-        
-        # Display the updated chat
-        st.rerun()
+        worst = frame.loc[frame["score"].idxmax()]
+        st.metric("Worst case", worst["level"], int(worst["score"]))
+        st.caption(f"{worst['weather']} on {worst['roads']} roads at {int(worst['odometer']):,} km")
+        
+        # Maintenance that falls due along the way
+        due_rows = [
+            {"Odometer (km)": int(odo), "Parts due": ", ".join(parts), "Cost (LKR)": int(cost)}
+            for odo, parts, cost in zip(simulation["odometer"], simulation["due_parts"], simulation["due_cost_lkr"])
+        ]
+        st.write("**Maintenance due along the way:**")
+        st.dataframe(pd.DataFrame(due_rows).drop_duplicates(subset=["Parts due"]), hide_index=True, use_container_width=True)
+    else:
+        st.warning("Pick at least one weather condition and one road mix")
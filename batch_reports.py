@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Headless batch report generation for a whole fleet
+
+Usage:
+    python batch_reports.py fleet.csv [--out batch_reports] [--workers 8] [--formats json csv pdf]
+    python batch_reports.py users.jsonl --offline --stub-weather-ms 100 --stub-llm-ms 400
+
+The fleet file is CSV or JSONL with one vehicle per row/line. Columns mirror the app's
+vehicle_data: vehicle_id, v_type, model, m_year, odo, district, city, s_odo, a_odo, fuel_type,
+plus optional parts_replaced (JSON list or "a;b"), parts_mileage (JSON object), notes and
+trips (JSON list of {"date", "km", "road": [...]}). JSONL lines exported from the users
+collection ({"user_id", "vehicle_data", "trips_data"}) are accepted as they are.
+
+Finished vehicles are appended to <out>/checkpoint.jsonl, so re-running the same command
+resumes where an interrupted run stopped (failed vehicles are retried).
+--offline swaps the weather API and the LLM for in-process stubs with fixed latencies;
+alternatively point WEATHER_API_URL / GROQ_API_BASE at local stub servers.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from types import SimpleNamespace
+
+import logic
+from latency import percentile
+
+EXPORT_FORMATS = ["json", "csv", "pdf"]
+STAGES = ["weather", "maintenance", "shops", "llm", "export", "report"]
+
+VEHICLE_DEFAULTS = {
+    "v_type": "Petrol/Diesel Car", "model": "", "m_year": 2018, "odo": 0, "district": "Colombo",
+    "city": "", "s_odo": 0, "a_odo": 0, "fuel_type": ""
+}
+
+
+# --- FLEET FILE ---
+def _parse_json_field(value, default):
+    """CSV cells hold JSON (or ';'-separated lists); JSONL values are already decoded"""
+    if value is None or value == "":
+        return default
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return [item.strip() for item in value.split(";") if item.strip()] if isinstance(default, list) else default
+
+
+def normalize_vehicle(record, index):
+    """One fleet row (flat or a users-collection document) -> report arguments"""
+    if isinstance(record.get("vehicle_data"), dict):
+        record = {
+            **record["vehicle_data"],
+            "vehicle_id": record.get("user_id"),
+            "trips": record.get("trips_data", [])
+        }
+
+    vehicle = {key: record.get(key) if record.get(key) not in (None, "") else default
+               for key, default in VEHICLE_DEFAULTS.items()}
+    for key in ["m_year", "odo", "s_odo", "a_odo"]:
+        vehicle[key] = int(float(vehicle[key]))
+    vehicle["city"] = vehicle["city"] or vehicle["district"]
+    vehicle["vehicle_id"] = str(record.get("vehicle_id") or record.get("user_id") or f"vehicle-{index + 1}")
+    vehicle["parts_replaced"] = _parse_json_field(record.get("parts_replaced"), [])
+    vehicle["parts_mileage"] = _parse_json_field(record.get("parts_mileage"), {})
+    vehicle["notes"] = record.get("notes") or record.get("additional_notes") or ""
+    # Same window as the app: the three most recent trips
+    trips = _parse_json_field(record.get("trips"), [])
+    vehicle["trips"] = [{"km": t.get("km", 0), "road": t.get("road", []), "date": str(t.get("date", ""))}
+                        for t in trips[-3:]]
+    return vehicle
+
+
+def load_fleet(path):
+    """Vehicles from a .csv or .jsonl fleet file"""
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    return [normalize_vehicle(record, i) for i, record in enumerate(records)]
+
+
+# --- CHECKPOINT ---
+class Checkpoint:
+    """Append-only JSONL log of processed vehicles; ids that completed are skipped on resume"""
+
+    def __init__(self, path, resume=True):
+        self.path = Path(path)
+        self.completed = set()
+        self._lock = threading.Lock()
+        if resume and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a killed run
+                    if entry.get("status") == "ok":
+                        self.completed.add(entry["vehicle_id"])
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def record(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            if entry.get("status") == "ok":
+                self.completed.add(entry["vehicle_id"])
+
+    def close(self):
+        self._file.close()
+
+
+# --- OFFLINE STUBS ---
+OFFLINE_CONDITIONS = ["Sunny", "Partly cloudy", "Light rain", "Heavy rain", "Mist"]
+
+def offline_weather(latency_s):
+    """Weather fetch stand-in: fixed latency, deterministic condition per city"""
+    def fetch(city):
+        time.sleep(latency_s)
+        seed = zlib.crc32(city.strip().lower().encode())
+        return {
+            "temp": str(24 + seed % 9),
+            "condition": OFFLINE_CONDITIONS[seed % len(OFFLINE_CONDITIONS)],
+            "humidity": str(60 + seed % 35),
+            "wind_speed": str(5 + seed % 20)
+        }
+    return fetch
+
+
+class OfflineChatModel:
+    """ChatGroq stand-in returning a fixed analysis after `latency_s`"""
+
+    analysis = {
+        "critical_issues": [],
+        "accident_risk_analysis": {"base_risk": 20, "critical_parts_impact": [], "total_estimated_risk": 30},
+        "maintenance_tips": ["Offline run - analysis generated without the LLM"],
+        "road_specific_warnings": [],
+        "weather_advisories": []
+    }
+
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+
+    def invoke(self, prompt):
+        time.sleep(self.latency_s)
+        return SimpleNamespace(content=json.dumps(self.analysis))
+
+
+def configure_services(args):
+    """Bound weather/LLM concurrency for the run and install the offline stubs if requested"""
+    current = logic.weather_cache
+    logic.weather_cache = logic.WeatherCache(
+        ttl=current.ttl, stale_ttl=current.stale_ttl, negative_ttl=current.negative_ttl,
+        fetch=offline_weather(args.stub_weather_ms / 1000) if args.offline else None,
+        max_concurrency=args.weather_concurrency
+    )
+    logic.llm_manager = logic.LLMClientManager(
+        max_concurrency=args.llm_concurrency,
+        max_retries=logic.llm_manager.max_retries,
+        client_factory=(lambda model, api_key: OfflineChatModel(args.stub_llm_ms / 1000)) if args.offline else None
+    )
+    if args.offline:
+        # Private in-memory cache, so stub analyses never reach the shared LLM_CACHE_SQLITE file
+        logic.llm_response_cache = logic.LLMResponseCache(max_entries=logic.llm_response_cache.max_entries)
+    # Every report fans out three stages onto the shared pipeline pool
+    if args.workers * 3 > logic.REPORT_PIPELINE_WORKERS:
+        logic._report_executor = ThreadPoolExecutor(max_workers=args.workers * 3, thread_name_prefix="report")
+
+
+# --- RUN ---
+def _safe_name(vehicle_id):
+    return re.sub(r"[^\w.-]", "_", vehicle_id)
+
+
+def generate_vehicle_report(vehicle, reports_dir, formats):
+    """Build and export one report; returns per-stage timings in ms"""
+    start = time.perf_counter()
+    report = logic.get_structured_report(
+        vehicle["v_type"], vehicle["model"], vehicle["m_year"], vehicle["odo"], vehicle["district"],
+        vehicle["city"], 0, vehicle["a_odo"], vehicle["s_odo"], vehicle["trips"],
+        vehicle["parts_replaced"], vehicle["notes"], vehicle["parts_mileage"], vehicle["fuel_type"] or None,
+        # Fleet ids that also appear in the telemetry get their live sensor anomalies scored
+        logic.dataset_handler.get_sensor_anomalies(vehicle["vehicle_id"])
+    )
+    timings = dict(report["metadata"]["timings_ms"])
+
+    export_start = time.perf_counter()
+    base = reports_dir / _safe_name(vehicle["vehicle_id"])
+    if "json" in formats:
+        base.with_suffix(".json").write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+    if "csv" in formats:
+        base.with_suffix(".csv").write_text(logic.generate_csv_report(report), encoding="utf-8")
+    if "pdf" in formats:
+        pdf = logic.generate_pdf_report(report)
+        if pdf is None:
+            raise RuntimeError("PDF export failed")
+        base.with_suffix(".pdf").write_bytes(pdf)
+    timings["export"] = round((time.perf_counter() - export_start) * 1000, 1)
+    timings["report"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+
+def summarize(results, elapsed, skipped):
+    """Throughput and p50/p95 latency per stage for the vehicles processed in this run"""
+    done = [r for r in results if r["status"] == "ok"]
+    summary = {
+        "processed": len(results),
+        "succeeded": len(done),
+        "failed": len(results) - len(done),
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 3),
+        "reports_per_s": round(len(done) / elapsed, 2) if elapsed and done else 0.0,
+        "stages_ms": {}
+    }
+    for stage in STAGES:
+        samples = [r["timings_ms"][stage] for r in done if stage in r["timings_ms"]]
+        if samples:
+            summary["stages_ms"][stage] = {
+                "p50": percentile(samples, 0.5),
+                "p95": percentile(samples, 0.95),
+                "max": max(samples)
+            }
+    return summary
+
+
+def run_batch(vehicles, out_dir, workers=8, formats=EXPORT_FORMATS, resume=True, progress=None):
+    """Generate reports for every vehicle not already in the checkpoint; returns the run summary"""
+    out_dir = Path(out_dir)
+    reports_dir = out_dir / "reports"
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(out_dir / "checkpoint.jsonl", resume=resume)
+    pending = [v for v in vehicles if v["vehicle_id"] not in checkpoint.completed]
+    skipped = len(vehicles) - len(pending)
+
+    def work(vehicle):
+        try:
+            entry = {"vehicle_id": vehicle["vehicle_id"], "status": "ok",
+                     "timings_ms": generate_vehicle_report(vehicle, reports_dir, formats)}
+        except Exception as e:
+            entry = {"vehicle_id": vehicle["vehicle_id"], "status": "error", "error": str(e)[:200], "timings_ms": {}}
+        entry["finished_at"] = time.time()
+        checkpoint.record(entry)
+        return entry
+
+    results = []
+    start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        for future in as_completed([pool.submit(work, v) for v in pending]):
+            results.append(future.result())
+            if progress:
+                progress(len(results), len(pending), results[-1])
+    finally:
+        # On Ctrl+C drop the queued vehicles; the ones in flight still reach the checkpoint
+        pool.shutdown(wait=True, cancel_futures=True)
+        checkpoint.close()
+
+    summary = summarize(results, time.perf_counter() - start, skipped)
+    (out_dir / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def print_summary(summary):
+    print(f"Batch reports: {summary['succeeded']} ok, {summary['failed']} failed, "
+          f"{summary['skipped']} already done | {summary['elapsed_s']:.2f} s | {summary['reports_per_s']:.2f} reports/s")
+    for stage, stats in summary["stages_ms"].items():
+        print(f"  {stage:<12} p50 {stats['p50']:9.1f} ms | p95 {stats['p95']:9.1f} ms | max {stats['max']:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fleet", help="Fleet file (.csv or .jsonl)")
+    parser.add_argument("--out", default="batch_reports", help="Output directory (reports, checkpoint, summary)")
+    parser.add_argument("--workers", type=int, default=8, help="Vehicles processed concurrently")
+    parser.add_argument("--llm-concurrency", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "4")))
+    parser.add_argument("--weather-concurrency", type=int, default=int(os.getenv("WEATHER_MAX_CONCURRENCY", "4")))
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=EXPORT_FORMATS)
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the checkpoint and regenerate everything")
+    parser.add_argument("--limit", type=int, help="Only the first N vehicles of the fleet file")
+    parser.add_argument("--offline", action="store_true", help="Use in-process weather and LLM stubs")
+    parser.add_argument("--stub-weather-ms", type=float, default=100)
+    parser.add_argument("--stub-llm-ms", type=float, default=400)
+    args = parser.parse_args()
+
+    vehicles = load_fleet(args.fleet)[:args.limit]
+    configure_services(args)
+    step = max(1, len(vehicles) // 10)
+
+    def progress(done, total, entry):
+        if entry["status"] != "ok":
+            print(f"  ! {entry['vehicle_id']}: {entry['error']}")
+        if done % step == 0 or done == total:
+            print(f"  {done}/{total} reports")
+
+    try:
+        summary = run_batch(vehicles, args.out, args.workers, args.formats, not args.no_resume, progress)
+    except KeyboardInterrupt:
+        print("Interrupted - run the same command again to resume from the checkpoint")
+        return
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the vehicle bot hot paths
+
+Usage:
+    python benchmarks.py db [--uri mongodb://localhost:27017] [--calls 200]
+    python benchmarks.py telemetry [--scale 100]
+    python benchmarks.py fleet [--sizes 10000 100000 1000000]
+    python benchmarks.py failure [--folds 5] [--batch-sizes 1 1000 1000000]
+    python benchmarks.py aggregates [--scales 1 10 100]
+    python benchmarks.py ingest [--scale 100] [--chunk-rows 50000]
+    python benchmarks.py index [--scales 10 100 1000]
+    python benchmarks.py anomaly [--vehicles 1000 10000 100000] [--rounds 20]
+    python benchmarks.py risk [--scenarios 1000000] [--scalar-max 100000]
+    python benchmarks.py events [--uri mongodb://localhost:27017] [--events 10000] [--calls 200]
+    python benchmarks.py writes [--uri mongodb://localhost:27017] [--calls 2000]
+
+Without --uri the database benchmarks run against mongomock as a local stand-in.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from latency import percentile
+
+
+def _timed(fn, calls):
+    """Run fn `calls` times and return per-call latencies in milliseconds"""
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    print(f"  {label:<32} mean {statistics.mean(samples):8.3f} ms | p50 {percentile(samples, 0.5):8.3f} ms | p95 {percentile(samples, 0.95):8.3f} ms")
+
+
+# --- DATABASE: per-call MongoClient vs pooled client registry ---
+def bench_db(args):
+    import pymongo
+    import database
+
+    if args.uri:
+        factory = pymongo.MongoClient
+    else:
+        import mongomock
+        factory = mongomock.MongoClient
+    uri = args.uri or "mongodb://localhost:27017"
+
+    database._client_factory = factory
+    database._mongo_uri = uri
+    database.get_or_create_user("Bench Model", "Bench City", "Colombo")
+    user_id = database.generate_user_id("Bench Model", "Bench City")
+
+    def legacy_get_user():
+        # Previous behaviour: new client + server_info() round trip on every call
+        client = factory(uri, serverSelectionTimeoutMS=5000, tlsAllowInvalidCertificates=True)
+        client.server_info()
+        client["vehicle_bot_db"]["users"].find_one({"user_id": user_id})
+        client.close()
+
+    def pooled_get_user():
+        database.get_user_by_id(user_id)
+
+    print(f"Database lookups ({args.calls} calls, {'mongod' if args.uri else 'mongomock'})")
+    _report("per-call MongoClient", _timed(legacy_get_user, args.calls))
+    _report("pooled client registry", _timed(pooled_get_user, args.calls))
+    database.reset_db_client()
+
+
+def _rss_mb():
+    """Current resident set size (falls back to peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# --- TELEMETRY: CSV parse vs columnar snapshot ---
+def _cold_load(mode, csv_path, queue):
+    """Runs in a fresh process so load time and resident memory are cold"""
+    import datasets
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    if mode == "csv":
+        df = datasets.pd.read_csv(csv_path)
+    elif mode == "typed csv":
+        df = datasets.typed_telemetry_frame(datasets.pd.read_csv(csv_path))
+    else:
+        df = datasets.load_telemetry_snapshot(datasets._snapshot_dir_for(csv_path))
+    # Touch every column so lazily mapped pages are counted
+    checksum = sum(float(df[col].iloc[-1]) for col in df.select_dtypes("number").columns)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, _rss_mb() - rss_before, df.memory_usage(deep=True).sum() / 1e6, len(df), checksum))
+
+
+def bench_telemetry(args):
+    import pandas as pd
+    import datasets
+
+    source = datasets.dataset_handler.base_path / "maintain_schdule.csv"
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "telemetry.csv")
+        df = pd.read_csv(source)
+        pd.concat([df] * args.scale, ignore_index=True).to_csv(csv_path, index=False)
+        datasets.build_telemetry_snapshot(csv_path)
+
+        ctx = multiprocessing.get_context("spawn")
+        print(f"Telemetry cold load ({len(df) * args.scale:,} rows, scale x{args.scale})")
+        for mode in ["csv", "typed csv", "snapshot"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_cold_load, args=(mode, csv_path, queue))
+            proc.start()
+            elapsed, rss_mb, frame_mb, rows, _ = queue.get()
+            proc.join()
+            print(f"  {mode:<12} load {elapsed * 1000:9.1f} ms | RSS +{rss_mb:8.1f} MB | frame {frame_mb:8.1f} MB")
+
+
+# --- FLEET: scalar recommendation loop vs broadcast interval matrix ---
+def _random_fleet(n, seed=7):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    service = rng.integers(0, 80000, n)
+    return pd.DataFrame({
+        "vehicle_type": rng.choice(["Petrol/Diesel Car", "Hybrid", "EV", "Motorbike", "Three-Wheeler"], n),
+        "fuel_type": rng.choice(["", "Petrol", "Diesel", "Hybrid", "Electric"], n),
+        "current_odo": service + rng.integers(0, 60000, n),
+        "service_odo": service
+    })
+
+
+def bench_fleet(args):
+    from datasets import dataset_handler
+
+    print("Fleet maintenance sweep")
+    for n in args.sizes:
+        fleet = _random_fleet(n)
+        start = time.perf_counter()
+        due = dataset_handler.get_fleet_maintenance_recommendations(fleet)
+        vectorized = time.perf_counter() - start
+        line = f"  {n:>9,} vehicles | vectorized {vectorized:8.3f} s ({n / vectorized:>12,.0f} veh/s, {len(due):,} due parts)"
+
+        if n <= args.scalar_max:
+            rows = fleet.to_dict("records")
+            start = time.perf_counter()
+            scalar = [
+                dataset_handler.get_maintenance_recommendations(r["vehicle_type"], r["current_odo"], r["service_odo"], r["fuel_type"])
+                for r in rows
+            ]
+            elapsed = time.perf_counter() - start
+            sample = slice(0, min(n, 2000))
+            assert dataset_handler.get_fleet_maintenance_recommendations(fleet.iloc[sample], as_lists=True) == scalar[sample]
+            line += f" | scalar {elapsed:8.3f} s ({n / elapsed:>10,.0f} veh/s)"
+        print(line)
+
+
+# --- FAILURE MODEL: held-out quality and batch scoring latency ---
+def _roc_auc(scores, y):
+    positives = y.sum()
+    negatives = len(y) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+    ranks = scores.argsort().argsort() + 1
+    return (ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives)
+
+
+def _average_precision(scores, y):
+    import numpy as np
+
+    if y.sum() == 0:
+        return float("nan")
+    hits = y[np.argsort(-scores)]
+    precision_at_k = hits.cumsum() / np.arange(1, hits.size + 1)
+    return float(precision_at_k[hits].mean())
+
+
+def bench_failure(args):
+    import numpy as np
+    import datasets
+
+    csv_path = datasets.dataset_handler.base_path / "maintain_schdule.csv"
+    df = datasets.dataset_handler.load_maintenance_schedule()
+
+    start = time.perf_counter()
+    model = datasets.load_failure_predictor(csv_path, retrain=True)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    datasets.load_failure_predictor(csv_path)
+    load_s = time.perf_counter() - start
+    print(f"Failure model ({len(df):,} readings): fit {fit_s * 1000:.1f} ms | load persisted {load_s * 1000:.1f} ms")
+
+    # Grouped cross-validation: whole vehicles are held out
+    vehicles, codes = np.unique(df["vehicle_id"].astype(str).to_numpy(), return_inverse=True)
+    fold_of_row = np.random.default_rng(1).permutation(len(vehicles))[codes] % args.folds
+    scores = np.zeros((len(df), len(model.targets)), dtype=np.float32)
+    flags = np.zeros_like(scores, dtype=bool)
+    for fold in range(args.folds):
+        held_out = fold_of_row == fold
+        fold_model = datasets.FailurePredictor.fit(df[~held_out])
+        scores[held_out] = fold_model.predict_proba(df[held_out])
+        flags[held_out] = scores[held_out] >= fold_model.thresholds
+
+    print(f"  held-out quality ({args.folds}-fold, split by vehicle)")
+    for i, target in enumerate(model.targets):
+        y = df[datasets.FAILURE_TARGETS[target]].to_numpy().astype(bool)
+        tp = (flags[:, i] & y).sum()
+        precision = tp / flags[:, i].sum() if flags[:, i].sum() else float("nan")
+        recall = tp / y.sum() if y.sum() else float("nan")
+        print(f"  {target:<8} positives {y.sum():4d} | ROC AUC {_roc_auc(scores[:, i], y):.3f} | "
+              f"AP {_average_precision(scores[:, i], y):.3f} | precision {precision:.3f} | recall {recall:.3f}")
+
+    print("  batch scoring latency")
+    features = df[datasets.FAILURE_FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+    rng = np.random.default_rng(7)
+    for n in args.batch_sizes:
+        batch = features[rng.integers(0, len(features), n)]
+        calls = max(3, min(1000, 1_000_000 // n))
+        samples = _timed(lambda: model.predict_proba(batch), calls)
+        per_vehicle_us = statistics.median(samples) * 1000 / n
+        print(f"  {n:>9,} vehicles | p50 {statistics.median(samples):9.3f} ms/batch | {per_vehicle_us:8.3f} us/vehicle")
+    reading = df.iloc[0][datasets.FAILURE_FEATURE_COLUMNS].to_dict()
+    _report("single reading (dict)", _timed(lambda: model.predict(reading), 200))
+
+
+# --- AGGREGATES: per-vehicle stats from the incremental store vs rescanning the frame ---
+def bench_aggregates(args):
+    import pandas as pd
+    import datasets
+
+    base = datasets.dataset_handler.load_maintenance_schedule()
+    reading = base.iloc[0][datasets.TELEMETRY_SENSOR_COLUMNS].to_dict()
+    print("Per-vehicle telemetry stats (one vehicle's mean/min/max/last)")
+    for scale in args.scales:
+        df = pd.concat([base] * scale, ignore_index=True)
+
+        def rescan():
+            rows = df[df["vehicle_id"] == "VEH0007"][datasets.TELEMETRY_SENSOR_COLUMNS]
+            return rows.mean(), rows.min(), rows.max(), rows.iloc[-1]
+
+        start = time.perf_counter()
+        store = datasets.TelemetryAggregateStore.from_frame(df)
+        seed_s = time.perf_counter() - start
+        print(f"  {len(df):>10,} readings (seed {seed_s * 1000:8.1f} ms)")
+        _report("full rescan", _timed(rescan, args.calls))
+        _report("aggregate store get()", _timed(lambda: store.get("VEH0007"), args.calls))
+        _report("aggregate store update()", _timed(lambda: store.update("VEH0007", reading), args.calls))
+
+
+# --- INGEST: whole-file load vs chunked streaming pipeline ---
+def _ingest_run(mode, csv_path, chunk_rows, queue):
+    """Runs in a fresh process so peak RSS belongs to this mode only"""
+    import datasets
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    if mode == "full load":
+        df = datasets.typed_telemetry_frame(datasets.pd.read_csv(csv_path))
+        datasets.TelemetryAggregateStore.from_frame(df)
+        rows = len(df)
+    else:
+        store = datasets.TelemetryAggregateStore()
+        rows = datasets.ingest_telemetry(datasets.read_telemetry_chunks(csv_path, chunk_rows), store)["rows"]
+    elapsed = time.perf_counter() - start
+    queue.put((rows, elapsed, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def bench_ingest(args):
+    import pandas as pd
+    import datasets
+
+    source = datasets.dataset_handler.base_path / "maintain_schdule.csv"
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "telemetry.csv")
+        df = pd.read_csv(source)
+        pd.concat([df] * args.scale, ignore_index=True).to_csv(csv_path, index=False)
+
+        ctx = multiprocessing.get_context("spawn")
+        print(f"Telemetry ingestion ({len(df) * args.scale:,} rows, {os.path.getsize(csv_path) / 1e6:.0f} MB CSV)")
+        for mode in ["full load", f"stream x{args.chunk_rows}"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_ingest_run, args=(mode, csv_path, args.chunk_rows, queue))
+            proc.start()
+            rows, elapsed, baseline, peak = queue.get()
+            proc.join()
+            print(f"  {mode:<16} {rows / elapsed:>10,.0f} rows/s | peak RSS {peak:8.1f} MB (+{peak - baseline:7.1f} MB over imports)")
+
+
+# --- INDEX: binary-searched range/threshold queries vs pandas boolean masks ---
+def bench_index(args):
+    import pandas as pd
+    import datasets
+
+    base = datasets.dataset_handler.load_maintenance_schedule()
+    span = base["timestamp"].max() - base["timestamp"].min() + pd.Timedelta(minutes=1)
+    print("Telemetry range/threshold queries (history extended in time by scale)")
+    for scale in args.scales:
+        # Each copy continues the history after the previous one
+        df = pd.concat([base.assign(timestamp=base["timestamp"] + span * k) for k in range(scale)], ignore_index=True)
+        start = time.perf_counter()
+        index = datasets.TelemetryIndex(df)
+        build_s = time.perf_counter() - start
+        week_start = index.latest - pd.Timedelta(days=7)
+        mid = df["timestamp"].min() + (index.latest - df["timestamp"].min()) / 2
+        window = (mid, mid + pd.Timedelta(days=2))
+
+        def mask_range():
+            return df[(df["vehicle_id"] == "VEH0007") & (df["timestamp"] >= window[0]) & (df["timestamp"] <= window[1])]
+
+        def mask_threshold():
+            return df[(df["brake_pad_wear_mm"] < 6.0) & (df["timestamp"] >= week_start)]
+
+        assert len(mask_range()) == len(index.readings("VEH0007", *window))
+        assert len(mask_threshold()) == len(index.where("brake_pad_wear_mm", "<", 6.0, start=week_start))
+        # (the asserts above also built the lazy column/time indexes, outside the timings)
+
+        print(f"  {len(df):>10,} rows (index build {build_s * 1000:8.1f} ms)")
+        _report("range: boolean mask", _timed(mask_range, args.calls))
+        _report("range: index", _timed(lambda: index.readings("VEH0007", *window), args.calls))
+        _report("threshold last week: mask", _timed(mask_threshold, args.calls))
+        _report("threshold last week: index", _timed(lambda: index.where("brake_pad_wear_mm", "<", 6.0, start=week_start), args.calls))
+
+
+# --- ANOMALY: streaming EWMA z-score detector throughput ---
+def bench_anomaly(args):
+    import numpy as np
+    import pandas as pd
+    import datasets
+
+    base = datasets.dataset_handler.load_maintenance_schedule()
+    rng = np.random.default_rng(3)
+    print("Sensor anomaly detector (one live reading per vehicle per chunk, single thread)")
+    for n in args.vehicles:
+        detector = datasets.SensorAnomalyDetector(capacity=n)
+        ids = np.array([f"VEH{i:07d}" for i in range(n)])
+        chunks = [
+            base.iloc[rng.integers(0, len(base), n)].assign(
+                vehicle_id=ids, timestamp=pd.Timestamp("2026-01-01") + pd.Timedelta(minutes=r)
+            )
+            for r in range(args.rounds)
+        ]
+        anomalies = 0
+        start = time.perf_counter()
+        for chunk in chunks:
+            anomalies += len(detector.update_batch(chunk))
+        elapsed = time.perf_counter() - start
+        readings = n * args.rounds
+        print(f"  {n:>8,} vehicles | {readings / elapsed:>12,.0f} readings/s | "
+              f"{elapsed / args.rounds * 1000:8.2f} ms per fleet sweep | {anomalies:,} anomalies")
+    reading = base.iloc[0].to_dict()
+    _report("single live reading update()", _timed(lambda: detector.update("VEH0000001", reading), 500))
+
+
+# --- RISK: scalar rule chain vs vectorised rule table ---
+def _random_risk_scenarios(n, seed=11):
+    import numpy as np
+    import logic
+
+    rng = np.random.default_rng(seed)
+    return {
+        "condition_flags": rng.integers(0, 1 << len(logic.CONDITION_FLAGS), n),
+        "road_mask": rng.integers(0, 1 << len(logic.ROAD_TYPES), n),
+        "part_counts": rng.integers(0, 1 << len(logic.PART_CATEGORIES), n),
+        "rain": rng.integers(0, 2, n),
+        "storm": rng.integers(0, 2, n),
+        "wind_speed": rng.integers(0, 80, n),
+        "temp": rng.integers(15, 42, n),
+        "anomaly_points": rng.integers(0, 30, n)
+    }
+
+
+def _decode_risk_scenario(scenarios, i):
+    """Scenario row -> calculate_accident_risk() arguments"""
+    import logic
+
+    flags, roads, parts = (int(scenarios[k][i]) for k in ["condition_flags", "road_mask", "part_counts"])
+    rain, storm = scenarios["rain"][i], scenarios["storm"][i]
+    condition = {(0, 0): "Clear", (1, 0): "light rain", (0, 1): "Thunderstorm", (1, 1): "Thunderstorm with heavy rain"}[rain, storm]
+    sample_parts = {"tyres": "Tyres", "brakes": "Brake Pads", "suspension": "Shock Absorbers",
+                    "electrical": "Battery", "oil": "Engine Oil", "other": "Spark Plugs"}
+    return (
+        {flag: bool(flags >> b & 1) for b, flag in enumerate(logic.CONDITION_FLAGS)},
+        {"condition": condition, "wind_speed": int(scenarios["wind_speed"][i]), "temp": int(scenarios["temp"][i])},
+        [road for b, road in enumerate(logic.ROAD_TYPES) if roads >> b & 1],
+        [sample_parts[c] for b, c in enumerate(logic.PART_CATEGORIES) if parts >> b & 1],
+        [{"sensor": "coolant_temp_c", "system": "cooling system", "value": 0, "expected": 0, "zscore": 0,
+          "risk_points": int(scenarios["anomaly_points"][i])}]
+    )
+
+
+def bench_risk(args):
+    import logic
+
+    n = args.scenarios
+    scenarios = _random_risk_scenarios(n)
+    print("Accident risk scoring")
+    start = time.perf_counter()
+    batch = logic.score_risk_batch(**scenarios)
+    elapsed = time.perf_counter() - start
+    print(f"  {n:>9,} scenarios | vectorized {elapsed:8.3f} s ({n / elapsed:>12,.0f} scenarios/s)")
+
+    m = min(n, args.scalar_max)
+    calls = [_decode_risk_scenario(scenarios, i) for i in range(m)]
+    start = time.perf_counter()
+    scalar = [logic.calculate_accident_risk(*call) for call in calls]
+    elapsed = time.perf_counter() - start
+    print(f"  {m:>9,} scenarios | scalar     {elapsed:8.3f} s ({m / elapsed:>12,.0f} scenarios/s)")
+    assert [r["score"] for r in scalar] == batch["score"][:m].tolist()
+    assert [r["level"] for r in scalar] == [logic.RISK_LEVELS[i][1] for i in batch["level"][:m]]
+
+
+# --- EVENTS: embedded history arrays vs append-only event collections ---
+def _use_database(uri):
+    """Point database.py at a local mongod, or at mongomock when no URI is given"""
+    import pymongo
+    import database
+
+    if uri:
+        database._client_factory = pymongo.MongoClient
+    else:
+        import mongomock
+        database._client_factory = mongomock.MongoClient
+    database.reset_db_client()
+    database._mongo_uri = uri or "mongodb://localhost:27017"
+    return database
+
+
+def bench_events(args):
+    import bson
+
+    database = _use_database(args.uri)
+    db = database.get_db_client()[database.DB_NAME]
+    for name in ["users", "legacy_users", *database.EVENT_COLLECTIONS]:
+        db[name].drop()
+
+    user_id = database.get_or_create_user("Bench Model", "Bench City", "Colombo")["user_id"]
+    trip = {"km": 42, "road": ["City", "Mountain"], "date": "2026-01-20"}
+    change = {"timestamp": "2026-01-20T10:00:00", "field": "trip_added", "trip_data": trip, "changed_by": "trip_entry"}
+
+    # Seed both layouts with the same history, then time writes and reads at that size
+    legacy = db["legacy_users"]
+    legacy.insert_one({"user_id": user_id, "vehicle_data": {}, "trips_data": [trip] * args.events, "changes_log": [change] * args.events})
+    database.save_user_data(user_id, {}, [trip] * args.events, [])
+    database.get_event_collection("changes").insert_many([{"user_id": user_id, **change} for _ in range(args.events)])
+
+    def legacy_add():
+        legacy.update_one({"user_id": user_id}, {"$push": {"trips_data": trip, "changes_log": change}})
+
+    print(f"Trip history with {args.events:,} events per user ({'mongod' if args.uri else 'mongomock'})")
+    _report("embedded $push (trip+change)", _timed(legacy_add, args.calls))
+    _report("append-only insert (trip+change)", _timed(lambda: database.add_trip_data(user_id, trip), args.calls))
+    _report("embedded find_one (whole doc)", _timed(lambda: legacy.find_one({"user_id": user_id}), args.calls))
+    _report("user doc + newest trip page", _timed(
+        lambda: (database.get_user_by_id(user_id), database.get_trips(user_id)), args.calls
+    ))
+    page = database.get_trips(user_id)
+    _report("next trip page (keyset cursor)", _timed(lambda: database.get_trips(user_id, before=page["next"]), args.calls))
+    size = len(bson.encode(legacy.find_one({"user_id": user_id}))) / 1e6
+    print(f"  embedded user document: {size:.2f} MB (16 MB limit)")
+    database.reset_db_client()
+
+
+# --- WRITES: synchronous event inserts vs the write-behind buffer ---
+def bench_writes(args):
+    database = _use_database(args.uri)
+    user_id = database.get_or_create_user("Bench Model", "Bench City", "Colombo")["user_id"]
+    trip = {"km": 42, "road": ["City"], "date": "2026-01-20"}
+
+    print(f"add_trip_data caller latency ({args.calls} calls, {'mongod' if args.uri else 'mongomock'})")
+    database.WRITE_BEHIND_ENABLED = False
+    _report("synchronous insert", _timed(lambda: database.add_trip_data(user_id, trip), args.calls))
+    database.WRITE_BEHIND_ENABLED = True
+    _report("write-behind submit", _timed(lambda: database.add_trip_data(user_id, trip), args.calls))
+    start = time.perf_counter()
+    database.write_behind.flush()
+    print(f"  drained remaining backlog in {(time.perf_counter() - start) * 1000:.1f} ms")
+    metrics = database.write_behind.metrics()
+    print(f"  {metrics['written']:,} events in {metrics['flushes']} flushes (avg batch {metrics['avg_batch_size']:.0f}) | "
+          f"flush p50 {metrics['flush_ms_p50']:.2f} ms, p95 {metrics['flush_ms_p95']:.2f} ms | rejected {metrics['rejected']}")
+    database.reset_db_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    db = sub.add_parser("db", help="MongoDB client reuse")
+    db.add_argument("--uri", help="MongoDB URI of a local mongod (default: mongomock)")
+    db.add_argument("--calls", type=int, default=200)
+    db.set_defaults(func=bench_db)
+
+    telemetry = sub.add_parser("telemetry", help="CSV vs columnar snapshot cold load")
+    telemetry.add_argument("--scale", type=int, default=1, help="Replicate the telemetry rows N times")
+    telemetry.set_defaults(func=bench_telemetry)
+
+    fleet = sub.add_parser("fleet", help="Vectorized fleet maintenance recommendations")
+    fleet.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    fleet.add_argument("--scalar-max", type=int, default=100000, help="Largest fleet to also run through the scalar loop")
+    fleet.set_defaults(func=bench_fleet)
+
+    failure = sub.add_parser("failure", help="Failure model evaluation and scoring latency")
+    failure.add_argument("--folds", type=int, default=5)
+    failure.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 1000, 100000, 1000000])
+    failure.set_defaults(func=bench_failure)
+
+    aggregates = sub.add_parser("aggregates", help="Incremental per-vehicle aggregates vs full rescans")
+    aggregates.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    aggregates.add_argument("--calls", type=int, default=200)
+    aggregates.set_defaults(func=bench_aggregates)
+
+    ingest = sub.add_parser("ingest", help="Whole-file load vs chunked streaming ingestion")
+    ingest.add_argument("--scale", type=int, default=100, help="Replicate the telemetry rows N times")
+    ingest.add_argument("--chunk-rows", type=int, default=50000)
+    ingest.set_defaults(func=bench_ingest)
+
+    index = sub.add_parser("index", help="Time-indexed telemetry queries vs boolean masks")
+    index.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    index.add_argument("--calls", type=int, default=50)
+    index.set_defaults(func=bench_index)
+
+    anomaly = sub.add_parser("anomaly", help="Streaming sensor anomaly detection throughput")
+    anomaly.add_argument("--vehicles", type=int, nargs="+", default=[1000, 10000, 100000])
+    anomaly.add_argument("--rounds", type=int, default=20)
+    anomaly.set_defaults(func=bench_anomaly)
+
+    risk = sub.add_parser("risk", help="Scalar vs vectorised accident risk scoring")
+    risk.add_argument("--scenarios", type=int, default=1000000)
+    risk.add_argument("--scalar-max", type=int, default=100000, help="Scenarios to also run through the scalar function")
+    risk.set_defaults(func=bench_risk)
+
+    events = sub.add_parser("events", help="Embedded history arrays vs append-only event collections")
+    events.add_argument("--uri", help="MongoDB URI of a local mongod (default: mongomock)")
+    events.add_argument("--events", type=int, default=10000, help="History events per user")
+    events.add_argument("--calls", type=int, default=200)
+    events.set_defaults(func=bench_events)
+
+    writes = sub.add_parser("writes", help="Synchronous event inserts vs write-behind buffering")
+    writes.add_argument("--uri", help="MongoDB URI of a local mongod (default: mongomock)")
+    writes.add_argument("--calls", type=int, default=2000)
+    writes.set_defaults(func=bench_writes)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
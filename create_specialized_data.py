@@ -29,6 +29,7 @@ df_tuk.to_csv("data/tuk_maintenance.csv", index=False)
 # --- 3. UPDATED 2026 PRICE LIST (Adding Bike/Tuk Parts) ---
 # We append these to your existing parts database
 parts_data = {
+    "Vehicle_Type": ["Motor Bicycle"] * 4 + ["Three-Wheeler"] * 5,
     "Part_Name": [
         "Engine Oil (1L)", "Chain Sprocket Kit", "Brake Shoes (Rear)", "Spark Plug", # Bike Parts
         "Engine Oil (RE)", "CV Joint (Axle)", "Canvas Hood", "Clutch Cable", "Grease Nipple Service" # Tuk Parts
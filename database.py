@@ -1,12 +1,82 @@
 import os
+import time
+import atexit
+import threading
 import pymongo
+from pymongo import InsertOne, ReturnDocument
+from collections import deque
 import streamlit as st
 from dotenv import load_dotenv
 from datetime import datetime
 import hashlib
+from bson import ObjectId
+from latency import percentile
 
-# This function safely finds your connection string no matter where the app is running
-def get_db_client():
+DB_NAME = "vehicle_bot_db"
+
+# Append-only event collections (one document per trip / report / change, keyed by user_id)
+EVENT_COLLECTIONS = ["trips", "reports", "changes"]
+EVENT_PAGE_SIZE = int(os.getenv("EVENT_PAGE_SIZE", "50"))
+
+# Fields read back for a user profile (legacy embedded arrays are never fetched)
+USER_PROFILE_FIELDS = {
+    "_id": 0, "user_id": 1, "model": 1, "city": 1, "district": 1,
+    "created_date": 1, "last_updated": 1, "vehicle_data": 1
+}
+# Key stamped on session trip/report dicts once save_user_data() has stored them
+SAVED_ENTRY_KEY = "event_id"
+
+# vehicle_data field -> name used in the change log
+CHANGE_LOG_FIELDS = {"s_odo": "last_service_odometer", "a_odo": "last_alignment_odometer"}
+# User switcher list: served entirely from the users_by_created index (covered query)
+USER_LIST_FIELDS = {"_id": 0, "user_id": 1, "model": 1, "city": 1, "district": 1, "created_date": 1}
+
+# Every index the queries in this module rely on: collection -> [(keys, options)]
+SCHEMA_INDEXES = {
+    "users": [
+        ([("user_id", 1)], {"name": "user_id_unique", "unique": True}),
+        ([("created_date", -1), ("user_id", 1), ("model", 1), ("city", 1), ("district", 1)], {"name": "users_by_created"})
+    ],
+    **{
+        # _id breaks timestamp ties so pages are stable; the prefix serves plain (user_id, timestamp) queries
+        name: [([("user_id", 1), ("timestamp", -1), ("_id", -1)], {"name": "user_id_timestamp"})]
+        for name in EVENT_COLLECTIONS
+    }
+}
+
+# Write-behind buffer for event inserts: flush when this many are queued or this many seconds
+# have passed. With WRITE_BEHIND_MAX_BACKLOG events pending, writers block for up to
+# WRITE_BEHIND_SUBMIT_TIMEOUT seconds for room, then the write is refused (never dropped later)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1") == "1"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_BACKLOG = int(os.getenv("WRITE_BEHIND_MAX_BACKLOG", "50000"))
+WRITE_BEHIND_SUBMIT_TIMEOUT = float(os.getenv("WRITE_BEHIND_SUBMIT_TIMEOUT", "5"))
+
+# Connection pool settings (override through the environment)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+# Seconds between pings of a cached client; failures trigger a reconnect
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL", "30"))
+# Seconds to wait after a failed connection before trying again (callers get None meanwhile)
+MONGO_RETRY_BACKOFF = float(os.getenv("MONGO_RETRY_BACKOFF", "5"))
+
+# Process-wide client registry: one MongoClient (and its socket pool) per URI
+_client_factory = pymongo.MongoClient
+_clients = {}
+_clients_lock = threading.Lock()
+# URI -> time.monotonic() of its last failed connection attempt
+_connect_failures = {}
+_mongo_uri = None
+# ids of clients whose schema indexes have been created
+_indexed_clients = set()
+
+def get_mongo_uri():
+    """Find the MongoDB connection string (Streamlit secrets, then .env) once per process"""
+    global _mongo_uri
+    if _mongo_uri:
+        return _mongo_uri
+    
     mongo_uri = None
     
     # 1. Try to get URI from Streamlit Cloud Secrets first
@@ -21,24 +91,112 @@ def get_db_client():
     if not mongo_uri:
         load_dotenv()
         mongo_uri = os.getenv("MONGO_URI")
+    
+    _mongo_uri = mongo_uri
+    return mongo_uri
 
+def _create_client(mongo_uri):
+    """Open a new pooled client and verify the server is reachable"""
+    # We add 'tlsAllowInvalidCertificates' to help Streamlit Cloud bypass SSL hurdles
+    client = _client_factory(
+        mongo_uri,
+        serverSelectionTimeoutMS=5000,
+        tlsAllowInvalidCertificates=True,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE
+    )
+    # This line forces a connection check immediately
+    try:
+        client.admin.command("ping")
+    except Exception:
+        # Don't leak the client's pool and monitor threads on a failed attempt
+        client.close()
+        raise
+    return client
+
+def _is_healthy(client):
+    try:
+        client.admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+# This function safely finds your connection string no matter where the app is running
+def get_db_client():
+    """
+    Return the shared MongoClient for this process, reconnecting if it went stale
+    Pings and connects run outside the registry lock; a new client is only published if
+    no other thread got there first, and a failed connection is not retried for
+    MONGO_RETRY_BACKOFF seconds.
+    """
+    mongo_uri = get_mongo_uri()
     if not mongo_uri:
         # Silently fail - allow app to work with session state
         return None
-        
+    
+    with _clients_lock:
+        entry = _clients.get(mongo_uri)
+        failed_at = _connect_failures.get(mongo_uri)
+    
+    if entry:
+        if time.monotonic() - entry["checked_at"] < MONGO_HEALTH_CHECK_INTERVAL:
+            return entry["client"]
+        if _is_healthy(entry["client"]):
+            entry["checked_at"] = time.monotonic()
+            return entry["client"]
+        # Stale client - drop it (unless another thread already replaced it) and reconnect below
+        with _clients_lock:
+            current = _clients.get(mongo_uri)
+            if current is entry:
+                _clients.pop(mongo_uri)
+        if current is not entry and current is not None:
+            return current["client"]
+        try:
+            entry["client"].close()
+        except Exception:
+            pass
+    elif failed_at is not None and time.monotonic() - failed_at < MONGO_RETRY_BACKOFF:
+        return None
+    
     try:
-        # We add 'tlsAllowInvalidCertificates' to help Streamlit Cloud bypass SSL hurdles
-        client = pymongo.MongoClient(
-            mongo_uri, 
-            serverSelectionTimeoutMS=5000,
-            tlsAllowInvalidCertificates=True 
-        )
-        # This line forces a connection check immediately
-        client.server_info() 
-        return client
-    except Exception as e:
+        client = _create_client(mongo_uri)
+    except Exception:
         # Silently fail - allow app to work with session state
+        with _clients_lock:
+            _connect_failures[mongo_uri] = time.monotonic()
         return None
+    
+    with _clients_lock:
+        _connect_failures.pop(mongo_uri, None)
+        current = _clients.get(mongo_uri)
+        if current is None:
+            _clients[mongo_uri] = {"client": client, "checked_at": time.monotonic()}
+            return client
+    # Another thread connected first - keep its client
+    client.close()
+    return current["client"]
+
+def reset_db_client():
+    """Close every cached client (e.g. after a failover or in tests); the next call reconnects"""
+    global _mongo_uri
+    with _clients_lock:
+        for entry in _clients.values():
+            try:
+                entry["client"].close()
+            except Exception:
+                pass
+        _clients.clear()
+        _connect_failures.clear()
+        _indexed_clients.clear()
+        _mongo_uri = None
+
+def get_users_collection():
+    """Return the users collection on the shared client, or None when the DB is unavailable"""
+    client = get_db_client()
+    if not client:
+        return None
+    ensure_schema(client)
+    return client[DB_NAME]["users"]
 
 def generate_user_id(model, city):
     """Generate unique user ID from vehicle model and city"""
@@ -46,211 +204,458 @@ def generate_user_id(model, city):
     user_hash = hashlib.md5(user_identifier.encode()).hexdigest()[:12]
     return user_hash
 
-def get_or_create_user(model, city, district):
-    """Get user by model+city or create new user"""
+def ensure_schema(client):
+    """
+    Create every index in SCHEMA_INDEXES (idempotent - existing indexes are left alone)
+    Runs once per client; a failure (e.g. duplicate user_ids blocking the unique index) is
+    reported and the app carries on without that index
+    """
+    if id(client) in _indexed_clients:
+        return
+    db = client[DB_NAME]
+    for collection, indexes in SCHEMA_INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except pymongo.errors.PyMongoError as e:
+                print(f"⚠️ Could not create index {options['name']} on {collection}: {e}")
+    _indexed_clients.add(id(client))
+
+class WriteBehindBuffer:
+    """
+    Queue event inserts (trips, reports, change log) and write them from a background thread
+    with one unordered bulk_write per collection, so callers never wait on MongoDB
+    - flushes when batch_size events are queued or every flush_interval seconds
+    - each event gets its ObjectId when queued: insertion order survives batching, and a batch
+      retried after a connection error cannot insert duplicates
+    - backpressure: with max_backlog events pending, submit() waits up to submit_timeout seconds
+      for room and then refuses the whole write (returns False, logged); queued events are never dropped
+    - events the server rejects for any reason but a duplicate key are logged with their document
+      and kept in failed_events
+    - close() (registered with atexit) stops the thread and flushes what is left
+    """
+    
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_backlog=WRITE_BEHIND_MAX_BACKLOG, submit_timeout=WRITE_BEHIND_SUBMIT_TIMEOUT):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.submit_timeout = submit_timeout
+        self.failed_events = deque(maxlen=1000)
+        self._queue = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._flush_ms = deque(maxlen=200)
+        self._stats = {"queued": 0, "written": 0, "failed": 0, "rejected": 0, "flushes": 0, "last_batch_size": 0}
+    
+    def _has_room(self, count):
+        # A write larger than the whole backlog is let through once the buffer is empty
+        pending = len(self._queue) + self._in_flight
+        return pending + count <= self.max_backlog or pending == 0
+    
+    def submit(self, collection, docs):
+        """
+        Queue documents for `collection`; returns True once queued, or False if the backlog
+        stayed full for submit_timeout seconds (nothing from `docs` is queued then)
+        """
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            if not self._room.wait_for(lambda: self._has_room(len(docs)), self.submit_timeout):
+                self._stats["rejected"] += len(docs)
+                print(f"⚠️ Write-behind backlog full ({len(self._queue) + self._in_flight} events), "
+                      f"refused {len(docs)} {collection} events")
+                return False
+            for doc in docs:
+                doc.setdefault("_id", ObjectId())
+                self._queue.append((collection, doc))
+            self._stats["queued"] += len(docs)
+            if len(self._queue) >= self.batch_size:
+                self._wakeup.notify()
+        return True
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._queue) < self.batch_size and not self._closed:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+    
+    def _matches(self, item, collection, user_id):
+        return (collection is None or item[0] == collection) and (user_id is None or item[1].get("user_id") == user_id)
+    
+    def has_pending(self, collection=None, user_id=None):
+        """True while events for collection/user_id are queued, or a batch is being written"""
+        with self._lock:
+            return self._in_flight > 0 or any(self._matches(item, collection, user_id) for item in self._queue)
+    
+    def _take_batch(self, collection, user_id):
+        if collection is None and user_id is None:
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        batch, rest = [], deque()
+        for item in self._queue:
+            if len(batch) < self.batch_size and self._matches(item, collection, user_id):
+                batch.append(item)
+            else:
+                rest.append(item)
+        if batch:
+            self._queue.clear()
+            self._queue.extend(rest)
+        return batch
+    
+    def flush(self, collection=None, user_id=None):
+        """
+        Write what is queued so far; returns events written
+        Reads pass collection/user_id to store only that user's pending events (read-your-writes)
+        instead of draining everyone's backlog
+        """
+        written = 0
+        if (collection is not None or user_id is not None) and not self.has_pending(collection, user_id):
+            return written
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._take_batch(collection, user_id)
+                    self._in_flight = len(batch)
+                if not batch:
+                    return written
+                stored = self._write(batch)
+                with self._lock:
+                    if not stored:
+                        # Database unreachable - put the batch back in order and retry on the next tick
+                        self._queue.extendleft(reversed(batch))
+                    self._in_flight = 0
+                    self._room.notify_all()
+                if not stored:
+                    return written
+                written += len(batch)
+    
+    def _write(self, batch):
+        client = get_db_client()
+        if client is None:
+            return False
+        start = time.perf_counter()
+        by_collection = {}
+        for collection, doc in batch:
+            by_collection.setdefault(collection, []).append(doc)
+        failed = 0
+        try:
+            for collection, docs in by_collection.items():
+                try:
+                    client[DB_NAME][collection].bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+                except pymongo.errors.BulkWriteError as e:
+                    # Duplicate keys are events a retried batch already wrote; anything else will
+                    # fail again on retry (validation, size), so it is logged with its document
+                    for error in e.details.get("writeErrors", []):
+                        if error.get("code") == 11000:
+                            continue
+                        failed += 1
+                        doc = docs[error["index"]]
+                        self.failed_events.append((collection, doc, error.get("errmsg")))
+                        print(f"⚠️ Write-behind could not store {collection} event {doc}: {error.get('errmsg')}")
+        except pymongo.errors.PyMongoError:
+            return False
+        
+        with self._lock:
+            self._flush_ms.append((time.perf_counter() - start) * 1000)
+            self._stats["flushes"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["written"] += len(batch) - failed
+            self._stats["failed"] += failed
+        return True
+    
+    def metrics(self):
+        """Backlog, batch sizes and flush latency (ms) for dashboards and benchmarks"""
+        with self._lock:
+            latencies = sorted(self._flush_ms)
+            stats = dict(self._stats, backlog=len(self._queue))
+        stats["avg_batch_size"] = stats["written"] / stats["flushes"] if stats["flushes"] else 0
+        stats["flush_ms_p50"] = percentile(latencies, 0.5)
+        stats["flush_ms_p95"] = percentile(latencies, 0.95)
+        return stats
+    
+    def close(self):
+        """Stop the background thread and flush whatever is still queued"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+        self.flush()
+
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.close)
+
+def get_event_collection(name):
+    """Return one of the append-only event collections (trips, reports, changes), or None when the DB is unavailable"""
     client = get_db_client()
     if not client:
         return None
+    ensure_schema(client)
+    return client[DB_NAME][name]
+
+def _append_events(name, user_id, events, buffered=None):
+    """
+    Append events for a user, stamping user_id and (if missing) the current timestamp
+    With WRITE_BEHIND_ENABLED the insert is queued on write_behind instead of awaited,
+    unless buffered=False asks for a synchronous insert
+    """
+    collection = get_event_collection(name)
+    if collection is None:
+        return False
+    now = datetime.now().isoformat()
+    docs = [{"user_id": user_id, "timestamp": now, **event} for event in events]
+    if not docs:
+        return True
+    if buffered is None:
+        buffered = WRITE_BEHIND_ENABLED
+    if buffered:
+        return write_behind.submit(name, docs)
+    else:
+        try:
+            collection.insert_many(docs, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Duplicate keys are events that were already stored
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    return True
+
+def _log_change(user_id, change):
+    return _append_events("changes", user_id, [change])
+
+def get_events_page(name, user_id, limit=EVENT_PAGE_SIZE, before=None):
+    """
+    One page of a user's events, newest first
+    before: the "next" cursor of the previous page (keyset pagination - no skip scans)
+    Returns {"items": [...], "next": cursor or None}
+    """
+    collection = get_event_collection(name)
+    if collection is None:
+        return {"items": [], "next": None}
+    write_behind.flush(name, user_id)
+    
+    items = list(
+        collection.find(_page_query(user_id, before), {"user_id": 0})
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    return _page_result(items, limit)
+
+def _page_query(user_id, before):
+    query = {"user_id": user_id}
+    if before:
+        timestamp, last_id = before.rsplit("|", 1)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": ObjectId(last_id)}}
+        ]
+    return query
+
+def _page_result(items, limit):
+    """limit + 1 fetched items -> page dict with the cursor for the next page"""
+    more = len(items) > limit
+    items = items[:limit]
+    cursor = f"{items[-1]['timestamp']}|{items[-1]['_id']}" if more else None
+    return {"items": items, "next": cursor}
+
+def get_trips(user_id, limit=EVENT_PAGE_SIZE, before=None):
+    """Page of trips, newest first"""
+    return get_events_page("trips", user_id, limit, before)
+
+def get_reports(user_id, limit=EVENT_PAGE_SIZE, before=None):
+    """Page of generated reports, newest first"""
+    return get_events_page("reports", user_id, limit, before)
+
+def get_or_create_user(model, city, district):
+    """Get user by model+city or create new user"""
+    users = get_users_collection()
+    if users is None:
+        return None
     
     user_id = generate_user_id(model, city)
-    db = client["vehicle_bot_db"]
-    users = db["users"]
     
     # Try to find existing user
-    user = users.find_one({"user_id": user_id})
+    user = users.find_one({"user_id": user_id}, USER_PROFILE_FIELDS)
     
     if not user:
-        # Create new user
-        user = {
-            "user_id": user_id,
-            "model": model,
-            "city": city,
-            "district": district,
-            "created_date": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "vehicle_data": {},
-            "trips_data": [],
-            "history_log": [],
-            "changes_log": []
-        }
+        user = _new_user(user_id, model, city, district)
         users.insert_one(user)
+        user.pop("_id", None)
     
     return user
 
+def _new_user(user_id, model, city, district):
+    """New user document (trips, reports and changes live in their own collections)"""
+    return {
+        "user_id": user_id,
+        "model": model,
+        "city": city,
+        "district": district,
+        "created_date": datetime.now().isoformat(),
+        "last_updated": datetime.now().isoformat(),
+        "vehicle_data": {}
+    }
+
 def get_user_by_id(user_id):
     """Retrieve user data by user ID"""
-    client = get_db_client()
-    if not client:
+    users = get_users_collection()
+    if users is None:
         return None
     
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    return users.find_one({"user_id": user_id})
+    return users.find_one({"user_id": user_id}, USER_PROFILE_FIELDS)
 
 def save_user_data(user_id, vehicle_data, trips_data, history_log):
-    """Save complete user data to database"""
-    client = get_db_client()
-    if not client:
+    """
+    Save user data to database
+    trips_data / history_log are the session's lists of trip / report dicts. Each entry is
+    stamped with SAVED_ENTRY_KEY once it has been appended to its event collection, so
+    repeated saves (or a reset, trimmed list) only ever append the entries not stored yet
+    """
+    users = get_users_collection()
+    if users is None:
         return False
     
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
     users.update_one(
         {"user_id": user_id},
         {
             "$set": {
                 "vehicle_data": vehicle_data,
-                "trips_data": trips_data,
-                "history_log": history_log,
                 "last_updated": datetime.now().isoformat()
             }
         }
     )
+    for name, entries in [("trips", trips_data), ("reports", history_log)]:
+        pending, docs = _unsaved_entries(name, entries)
+        if docs and _append_events(name, user_id, docs):
+            _mark_saved(pending, docs)
     return True
 
-def update_service_odometer(user_id, new_service_odo):
-    """Update service odometer and track change"""
-    client = get_db_client()
-    if not client:
+def _unsaved_entries(name, entries):
+    """
+    Session entries that have no SAVED_ENTRY_KEY yet, and the event documents to store them as
+    Each document gets its _id up front, so a retried save is a duplicate-key no-op
+    """
+    pending = [entry for entry in entries if not entry.get(SAVED_ENTRY_KEY)]
+    docs = []
+    for entry in pending:
+        body = {key: value for key, value in entry.items() if key != SAVED_ENTRY_KEY}
+        docs.append({"_id": ObjectId(), **({"report": body} if name == "reports" else body)})
+    return pending, docs
+
+def _mark_saved(pending, docs):
+    """Stamp session entries with the _id they were stored under; later saves skip them"""
+    for entry, doc in zip(pending, docs):
+        entry[SAVED_ENTRY_KEY] = doc["_id"]
+
+def update_vehicle_fields(user_id, changes, changed_by="user_update"):
+    """
+    Set one or more vehicle_data fields and log every change with its previous value
+    changes: {field: new value}, e.g. {"s_odo": 52000, "a_odo": 50000}
+    All fields go in one atomic find_one_and_update that hands back the pre-update values,
+    so concurrent updates each log the value they actually replaced. The change events for
+    all fields are then inserted synchronously (not through write_behind) before returning.
+    The two writes are not one transaction: if that insert fails after the update, the
+    fields stay updated and the missing events are only reported on the console.
+    """
+    users = get_users_collection()
+    if users is None or not changes:
         return False
     
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
-    # Get current value
-    user = users.find_one({"user_id": user_id})
-    old_value = user["vehicle_data"].get("s_odo", 0) if user else 0
+    now = datetime.now().isoformat()
+    before = users.find_one_and_update(
+        {"user_id": user_id}, *_vehicle_fields_update(changes, now), return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return False
     
-    # Update and log change
-    users.update_one(
-        {"user_id": user_id},
+    events = _field_change_events(changes, before, changed_by, now)
+    try:
+        _append_events("changes", user_id, events, buffered=False)
+    except pymongo.errors.PyMongoError as e:
+        print(f"⚠️ Updated {user_id} but could not log the change {events}: {e}")
+    return True
+
+def _vehicle_fields_update(changes, now):
+    """$set for the changed vehicle_data fields, and the projection that reads back their old values"""
+    update = {"$set": {**{f"vehicle_data.{field}": value for field, value in changes.items()}, "last_updated": now}}
+    projection = {"_id": 0, **{f"vehicle_data.{field}": 1 for field in changes}}
+    return update, projection
+
+def _field_change_events(changes, before, changed_by, now):
+    old_values = before.get("vehicle_data") or {}
+    return [
         {
-            "$set": {"vehicle_data.s_odo": new_service_odo},
-            "$push": {
-                "changes_log": {
-                    "timestamp": datetime.now().isoformat(),
-                    "field": "last_service_odometer",
-                    "old_value": old_value,
-                    "new_value": new_service_odo,
-                    "changed_by": "user_update"
-                }
-            }
+            "timestamp": now,
+            "field": CHANGE_LOG_FIELDS.get(field, field),
+            "old_value": old_values.get(field, 0),
+            "new_value": value,
+            "changed_by": changed_by
         }
-    )
-    return True
+        for field, value in changes.items()
+    ]
+
+def update_service_odometer(user_id, new_service_odo):
+    """Update service odometer and track change"""
+    return update_vehicle_fields(user_id, {"s_odo": new_service_odo})
 
 def update_alignment_odometer(user_id, new_align_odo):
     """Update alignment odometer and track change"""
-    client = get_db_client()
-    if not client:
-        return False
-    
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
-    # Get current value
-    user = users.find_one({"user_id": user_id})
-    old_value = user["vehicle_data"].get("a_odo", 0) if user else 0
-    
-    # Update and log change
-    users.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {"vehicle_data.a_odo": new_align_odo},
-            "$push": {
-                "changes_log": {
-                    "timestamp": datetime.now().isoformat(),
-                    "field": "last_alignment_odometer",
-                    "old_value": old_value,
-                    "new_value": new_align_odo,
-                    "changed_by": "user_update"
-                }
-            }
-        }
-    )
-    return True
+    return update_vehicle_fields(user_id, {"a_odo": new_align_odo})
 
 def add_trip_data(user_id, trip):
     """Add trip and track change"""
-    client = get_db_client()
-    if not client:
+    if not _append_events("trips", user_id, [trip]):
         return False
-    
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
-    users.update_one(
-        {"user_id": user_id},
-        {
-            "$push": {
-                "trips_data": trip,
-                "changes_log": {
-                    "timestamp": datetime.now().isoformat(),
-                    "field": "trip_added",
-                    "trip_data": trip,
-                    "changed_by": "trip_entry"
-                }
-            }
-        }
-    )
+    _log_change(user_id, {"field": "trip_added", "trip_data": trip, "changed_by": "trip_entry"})
     return True
 
 def add_report(user_id, report_data):
     """Add report to history"""
-    client = get_db_client()
-    if not client:
+    if not _append_events("reports", user_id, [{"report": report_data}]):
         return False
-    
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
-    users.update_one(
-        {"user_id": user_id},
-        {
-            "$push": {
-                "history_log": report_data,
-                "changes_log": {
-                    "timestamp": datetime.now().isoformat(),
-                    "field": "report_generated",
-                    "report_type": report_data.get("type", "unknown"),
-                    "changed_by": "report_generation"
-                }
-            }
-        }
-    )
+    _log_change(user_id, {
+        "field": "report_generated",
+        "report_type": report_data.get("type", "unknown"),
+        "changed_by": "report_generation"
+    })
     return True
 
-def get_changes_log(user_id):
-    """Get all changes made to user data"""
-    client = get_db_client()
-    if not client:
+def get_changes_log(user_id, limit=None):
+    """Get changes made to user data, oldest first (only the newest `limit` when given)"""
+    changes = get_event_collection("changes")
+    if changes is None:
         return []
+    write_behind.flush("changes", user_id)
     
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    user = users.find_one({"user_id": user_id})
-    
-    return user.get("changes_log", []) if user else []
+    cursor = changes.find({"user_id": user_id}, {"_id": 0, "user_id": 0}).sort([("timestamp", -1), ("_id", -1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)[::-1]
 
-def get_all_users():
-    """Get list of all users (for user switching)"""
-    client = get_db_client()
-    if not client:
+def get_all_users(limit=None):
+    """Get list of all users, newest first (for user switching)"""
+    users = get_users_collection()
+    if users is None:
         return []
     
-    db = client["vehicle_bot_db"]
-    users = db["users"]
-    
-    user_list = list(users.find({}, {"user_id": 1, "model": 1, "city": 1, "district": 1, "created_date": 1}))
-    return user_list
+    cursor = users.find({}, USER_LIST_FIELDS).sort([("created_date", -1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
 
 # Legacy function for backward compatibility
 def save_vehicle_profile(data):
-    client = get_db_client()
-    if client:
-        db = client["vehicle_bot_db"]
-        users = db["users"]
+    users = get_users_collection()
+    if users is not None:
         users.update_one(
             {"user_id": "default_user"},
             {"$set": data},
@@ -260,8 +665,8 @@ def save_vehicle_profile(data):
     return False
 
 def get_vehicle_profile():
-    client = get_db_client()
-    if client:
-        db = client["vehicle_bot_db"]
-        return db["users"].find_one({"user_id": "default_user"})
+    users = get_users_collection()
+    if users is not None:
+        # Profile fields are free-form here, so exclude the legacy history arrays instead
+        return users.find_one({"user_id": "default_user"}, {"_id": 0, "trips_data": 0, "history_log": 0, "changes_log": 0})
     return None
\ No newline at end of file
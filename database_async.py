@@ -0,0 +1,328 @@
+"""
+Asyncio variant of the database.py data access API (same function names, awaitable)
+
+Built on PyMongo's native AsyncMongoClient, falling back to Motor when only that is installed.
+Documents, indexes, projections and page cursors are shared with database.py, so both APIs
+read and write the same data. Event inserts are awaited directly (they no longer hold a
+thread, so the write-behind buffer is not needed here). Both APIs stamp timestamp and _id
+when an event is written, and reads order by them, so mixing the APIs for one user keeps
+event order; reads here first flush events the sync API still has queued.
+
+    user = await database_async.get_or_create_user("Toyota Axio", "Kandy", "Kandy")
+    page = await database_async.get_trips(user["user_id"])
+"""
+import asyncio
+import time
+from datetime import datetime
+
+import pymongo
+from pymongo import ReturnDocument
+
+import database
+from database import (
+    DB_NAME, EVENT_PAGE_SIZE, SCHEMA_INDEXES, USER_LIST_FIELDS, USER_PROFILE_FIELDS,
+    generate_user_id, get_mongo_uri
+)
+
+try:
+    from pymongo import AsyncMongoClient as _client_factory
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as _client_factory
+    except ImportError:
+        _client_factory = None
+
+# One client per URI, shared by every coroutine on the event loop it was created on
+_clients = {}
+_indexed_clients = set()
+# URI -> time.monotonic() of its last failed connection (retried after database.MONGO_RETRY_BACKOFF)
+_connect_failures = {}
+_warned_no_driver = False
+
+
+async def _create_client(mongo_uri):
+    client = _client_factory(
+        mongo_uri,
+        serverSelectionTimeoutMS=5000,
+        tlsAllowInvalidCertificates=True,
+        maxPoolSize=database.MONGO_MAX_POOL_SIZE,
+        minPoolSize=database.MONGO_MIN_POOL_SIZE
+    )
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        # Don't leak the client's pool and monitor tasks on a failed attempt
+        await _close(client)
+        raise
+    return client
+
+
+async def _close(client):
+    result = client.close()
+    if asyncio.iscoroutine(result):
+        await result
+
+
+async def get_db_client():
+    """
+    Return the shared async client for this URI and event loop, reconnecting if it went stale
+    Like database.get_db_client, a failed connection is not retried for MONGO_RETRY_BACKOFF seconds
+    """
+    global _warned_no_driver
+    mongo_uri = get_mongo_uri()
+    if not mongo_uri:
+        # Silently fail - allow app to work with session state
+        return None
+    if _client_factory is None:
+        if not _warned_no_driver:
+            _warned_no_driver = True
+            print("⚠️ No async MongoDB driver (pymongo>=4.9 or motor) installed - database_async is disabled")
+        return None
+
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(mongo_uri)
+    now = time.monotonic()
+    if entry and entry["loop"] is loop:
+        if now - entry["checked_at"] < database.MONGO_HEALTH_CHECK_INTERVAL:
+            return entry["client"]
+        try:
+            await entry["client"].admin.command("ping")
+            entry["checked_at"] = now
+            return entry["client"]
+        except Exception:
+            pass
+    if entry:
+        # Stale, or bound to an event loop that is no longer running this code
+        _clients.pop(mongo_uri, None)
+        _indexed_clients.discard(id(entry["client"]))
+        try:
+            await _close(entry["client"])
+        except Exception:
+            pass
+    else:
+        failed_at = _connect_failures.get(mongo_uri)
+        if failed_at is not None and now - failed_at < database.MONGO_RETRY_BACKOFF:
+            return None
+
+    try:
+        client = await _create_client(mongo_uri)
+    except Exception:
+        _connect_failures[mongo_uri] = time.monotonic()
+        return None
+    _connect_failures.pop(mongo_uri, None)
+
+    current = _clients.get(mongo_uri)
+    if current and current["loop"] is loop:
+        # Another coroutine connected first - keep its client
+        await _close(client)
+        return current["client"]
+    _clients[mongo_uri] = {"client": client, "loop": loop, "checked_at": time.monotonic()}
+    return client
+
+
+async def reset_db_client():
+    """Close every cached client; the next call reconnects"""
+    for entry in list(_clients.values()):
+        try:
+            await _close(entry["client"])
+        except Exception:
+            pass
+    _clients.clear()
+    _connect_failures.clear()
+    _indexed_clients.clear()
+
+
+async def ensure_schema(client):
+    """Create every index in database.SCHEMA_INDEXES (idempotent, once per client)"""
+    if id(client) in _indexed_clients:
+        return
+    db = client[DB_NAME]
+    for collection, indexes in SCHEMA_INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await db[collection].create_index(keys, **options)
+            except pymongo.errors.PyMongoError as e:
+                print(f"⚠️ Could not create index {options['name']} on {collection}: {e}")
+    _indexed_clients.add(id(client))
+
+
+async def _collection(name):
+    client = await get_db_client()
+    if not client:
+        return None
+    await ensure_schema(client)
+    return client[DB_NAME][name]
+
+
+async def get_users_collection():
+    return await _collection("users")
+
+
+async def get_event_collection(name):
+    return await _collection(name)
+
+
+async def _flush_sync_writes(name, user_id):
+    """Store the user's events the sync API still has queued (database.write_behind) before a read"""
+    if database.write_behind.has_pending(name, user_id):
+        await asyncio.to_thread(database.write_behind.flush, name, user_id)
+
+
+async def _append_events(name, user_id, events):
+    collection = await get_event_collection(name)
+    if collection is None:
+        return False
+    now = datetime.now().isoformat()
+    docs = [{"user_id": user_id, "timestamp": now, **event} for event in events]
+    if docs:
+        try:
+            await collection.insert_many(docs, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Duplicate keys are events that were already stored
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    return True
+
+
+async def get_events_page(name, user_id, limit=EVENT_PAGE_SIZE, before=None):
+    """One page of a user's events, newest first (see database.get_events_page)"""
+    collection = await get_event_collection(name)
+    if collection is None:
+        return {"items": [], "next": None}
+    await _flush_sync_writes(name, user_id)
+
+    cursor = (
+        collection.find(database._page_query(user_id, before), {"user_id": 0})
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    return database._page_result(await cursor.to_list(None), limit)
+
+
+async def get_trips(user_id, limit=EVENT_PAGE_SIZE, before=None):
+    return await get_events_page("trips", user_id, limit, before)
+
+
+async def get_reports(user_id, limit=EVENT_PAGE_SIZE, before=None):
+    return await get_events_page("reports", user_id, limit, before)
+
+
+async def get_or_create_user(model, city, district):
+    """Get user by model+city or create new user"""
+    users = await get_users_collection()
+    if users is None:
+        return None
+
+    user_id = generate_user_id(model, city)
+    user = await users.find_one({"user_id": user_id}, USER_PROFILE_FIELDS)
+    if not user:
+        user = database._new_user(user_id, model, city, district)
+        try:
+            await users.insert_one(user)
+        except pymongo.errors.DuplicateKeyError:
+            # Created concurrently by another coroutine - read theirs
+            return await users.find_one({"user_id": user_id}, USER_PROFILE_FIELDS)
+        user.pop("_id", None)
+    return user
+
+
+async def get_user_by_id(user_id):
+    users = await get_users_collection()
+    if users is None:
+        return None
+    return await users.find_one({"user_id": user_id}, USER_PROFILE_FIELDS)
+
+
+async def save_user_data(user_id, vehicle_data, trips_data, history_log):
+    """Save vehicle data and append the session's new trips/reports (see database.save_user_data)"""
+    users = await get_users_collection()
+    if users is None:
+        return False
+
+    await users.update_one(
+        {"user_id": user_id},
+        {"$set": {"vehicle_data": vehicle_data, "last_updated": datetime.now().isoformat()}}
+    )
+    for name, entries in [("trips", trips_data), ("reports", history_log)]:
+        pending, docs = database._unsaved_entries(name, entries)
+        if docs and await _append_events(name, user_id, docs):
+            database._mark_saved(pending, docs)
+    return True
+
+
+async def update_vehicle_fields(user_id, changes, changed_by="user_update"):
+    """Set vehicle_data fields atomically and log the values they replaced (see database.update_vehicle_fields)"""
+    users = await get_users_collection()
+    if users is None or not changes:
+        return False
+
+    now = datetime.now().isoformat()
+    before = await users.find_one_and_update(
+        {"user_id": user_id}, *database._vehicle_fields_update(changes, now), return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return False
+    await _append_events("changes", user_id, database._field_change_events(changes, before, changed_by, now))
+    return True
+
+
+async def update_service_odometer(user_id, new_service_odo):
+    return await update_vehicle_fields(user_id, {"s_odo": new_service_odo})
+
+
+async def update_alignment_odometer(user_id, new_align_odo):
+    return await update_vehicle_fields(user_id, {"a_odo": new_align_odo})
+
+
+async def add_trip_data(user_id, trip):
+    if not await _append_events("trips", user_id, [trip]):
+        return False
+    return await _append_events("changes", user_id, [{"field": "trip_added", "trip_data": trip, "changed_by": "trip_entry"}])
+
+
+async def add_report(user_id, report_data):
+    if not await _append_events("reports", user_id, [{"report": report_data}]):
+        return False
+    return await _append_events("changes", user_id, [{
+        "field": "report_generated",
+        "report_type": report_data.get("type", "unknown"),
+        "changed_by": "report_generation"
+    }])
+
+
+async def get_changes_log(user_id, limit=None):
+    """Changes made to user data, oldest first (only the newest `limit` when given)"""
+    changes = await get_event_collection("changes")
+    if changes is None:
+        return []
+    await _flush_sync_writes("changes", user_id)
+    cursor = changes.find({"user_id": user_id}, {"_id": 0, "user_id": 0}).sort([("timestamp", -1), ("_id", -1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return (await cursor.to_list(None))[::-1]
+
+
+async def get_all_users(limit=None):
+    """List of all users, newest first (for user switching)"""
+    users = await get_users_collection()
+    if users is None:
+        return []
+    cursor = users.find({}, USER_LIST_FIELDS).sort([("created_date", -1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+
+async def save_vehicle_profile(data):
+    users = await get_users_collection()
+    if users is None:
+        return False
+    await users.update_one({"user_id": "default_user"}, {"$set": data}, upsert=True)
+    return True
+
+
+async def get_vehicle_profile():
+    users = await get_users_collection()
+    if users is None:
+        return None
+    return await users.find_one({"user_id": "default_user"}, {"_id": 0, "trips_data": 0, "history_log": 0, "changes_log": 0})
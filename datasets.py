@@ -4,9 +4,1302 @@ Loads and manages maintenance schedules, OBD codes, and specialized vehicle data
 """
 
 import pandas as pd
+import numpy as np
 import os
+import io
+import json
+import time
+import hashlib
+import threading
 import streamlit as st
 from pathlib import Path
+from types import MappingProxyType
+
+# DatasetCache hands out shallow views, which only stay isolated from the cached frame under
+# copy-on-write: always on from pandas 3.0. On 2.x it is the application's opt-in
+# (mode.copy_on_write) and is left alone here; without it callers get deep copies.
+PANDAS_MAJOR = int(pd.__version__.split(".")[0])
+COPY_ON_WRITE = PANDAS_MAJOR >= 3
+
+def _copy_on_write():
+    """Whether copy-on-write is in effect (pandas 3, or pandas 2 with mode.copy_on_write=True)"""
+    return COPY_ON_WRITE or (PANDAS_MAJOR == 2 and pd.get_option("mode.copy_on_write") is True)
+
+class DatasetCache:
+    """
+    Process-wide cache of parsed dataset files, independent of the Streamlit runtime
+    Each file is parsed once; a changed mtime/size triggers a content-hash check and
+    a reload only if the bytes actually changed. Callers get shallow views of the
+    cached frame when copy-on-write keeps their edits local, deep copies otherwise.
+    """
+    
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+    
+    @staticmethod
+    def _file_digest(path):
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _view(data):
+        # Without copy-on-write a shallow copy would write through to the cached frame
+        return data.copy(deep=not _copy_on_write())
+    
+    def _entry(self, path, loader):
+        # Caller holds self._lock
+        key = str(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        
+        entry = self._entries.get(key)
+        if entry and entry["signature"] != signature:
+            # File touched - only reload if the content really changed
+            if self._file_digest(path) == entry["digest"]:
+                entry["signature"] = signature
+            else:
+                entry = None
+                self.reloads += 1
+        
+        if entry:
+            self.hits += 1
+            entry["checked_at"] = time.monotonic()
+            return entry
+        
+        self.misses += 1
+        start = time.perf_counter()
+        data = loader(path)
+        load_time = time.perf_counter() - start
+        
+        previous = self._entries.get(key)
+        entry = self._entries[key] = {
+            "data": data,
+            "signature": signature,
+            "digest": self._file_digest(path),
+            "version": previous["version"] + 1 if previous else 1,
+            "load_time_s": load_time,
+            "loaded_at": time.time(),
+            "checked_at": time.monotonic(),
+            "derived": {}
+        }
+        return entry
+    
+    def get(self, path, loader):
+        """Return a read-only view of loader(path), parsing the file only when it changed"""
+        with self._lock:
+            return self._view(self._entry(path, loader)["data"])
+    
+    def derived(self, path, loader, name, build, check_interval=0.0):
+        """
+        build(data) over loader(path)'s cached frame, stored with the cache entry and rebuilt
+        only when the file is reloaded. The file is stat'ed at most every check_interval
+        seconds, so hot lookups skip both the stat and the view copy.
+        """
+        entry = self._entries.get(str(path))
+        if entry is None or time.monotonic() - entry["checked_at"] >= check_interval:
+            with self._lock:
+                entry = self._entry(path, loader)
+        
+        value = entry["derived"].get(name)
+        if value is None:
+            with self._lock:
+                value = entry["derived"].get(name)
+                if value is None:
+                    value = entry["derived"][name] = build(entry["data"])
+        return value
+    
+    def version(self, path):
+        """Load counter for a file (0 if never loaded); bumps on every reload"""
+        entry = self._entries.get(str(path))
+        return entry["version"] if entry else 0
+    
+    def invalidate(self, path=None):
+        """Drop one file (or everything) so the next get() re-parses it"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(path), None)
+    
+    def get_stats(self):
+        """Hit/miss counters plus per-file load times"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "files": {
+                key: {
+                    "version": entry["version"],
+                    "rows": len(entry["data"]),
+                    "load_time_s": entry["load_time_s"],
+                    "loaded_at": entry["loaded_at"]
+                }
+                for key, entry in self._entries.items()
+            }
+        }
+
+# Shared by every DatasetHandler in the process
+dataset_cache = DatasetCache()
+
+# --- TELEMETRY SNAPSHOT (typed, memory-mappable columnar copy of maintain_schdule.csv) ---
+TELEMETRY_CATEGORICAL_COLUMNS = ["vehicle_id", "brand", "failure_type"]
+TELEMETRY_DATETIME_COLUMNS = ["timestamp", "failure_date"]
+TELEMETRY_FLAG_COLUMNS = [
+    "abs_fault_indicator", "engine_failure_imminent",
+    "brake_issue_imminent", "battery_issue_imminent"
+]
+# Sensor channels (everything except ids, timestamps, labels and GPS)
+TELEMETRY_SENSOR_COLUMNS = [
+    "odometer_reading", "engine_temp_c", "engine_rpm", "oil_pressure_psi", "coolant_temp_c",
+    "fuel_level_percent", "fuel_consumption_lph", "engine_load_percent", "throttle_pos_percent",
+    "air_flow_rate_gps", "exhaust_gas_temp_c", "vibration_level", "engine_hours",
+    "brake_fluid_level_psi", "brake_pad_wear_mm", "brake_temp_c", "abs_fault_indicator",
+    "brake_pedal_pos_percent", "wheel_speed_fl_kph", "wheel_speed_fr_kph", "wheel_speed_rl_kph",
+    "wheel_speed_rr_kph", "battery_voltage_v", "battery_current_a", "battery_temp_c",
+    "alternator_output_v", "battery_charge_percent", "battery_health_percent", "vehicle_speed_kph",
+    "ambient_temp_c", "humidity_percent"
+]
+SNAPSHOT_FORMAT_VERSION = 1
+
+def typed_telemetry_frame(df):
+    """Downcast raw telemetry: float32 sensors, categorical ids/labels, datetime64 timestamps, int8 flags"""
+    typed = {}
+    for col in df.columns:
+        if col in TELEMETRY_CATEGORICAL_COLUMNS:
+            typed[col] = df[col].astype("category")
+        elif col in TELEMETRY_DATETIME_COLUMNS:
+            typed[col] = pd.to_datetime(df[col]).astype("datetime64[ns]")
+        elif col in TELEMETRY_FLAG_COLUMNS:
+            typed[col] = df[col].fillna(0).astype(np.int8)
+        else:
+            typed[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    return pd.DataFrame(typed)
+
+def _snapshot_dir_for(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.stem + ".snapshot")
+
+def _csv_signature(csv_path):
+    """Recorded with build artifacts: size and mtime for cheap checks, md5 for touched-but-unchanged files"""
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "md5": DatasetCache._file_digest(csv_path)}
+
+def _source_matches(source, csv_path):
+    """Whether csv_path still is the file an artifact was built from (hashes only if it was touched)"""
+    stat = os.stat(csv_path)
+    if not source or source.get("size") != stat.st_size:
+        return False
+    if source.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return source.get("md5") == DatasetCache._file_digest(csv_path)
+
+def _write_json_atomic(path, data):
+    # Readers see either the previous file or the complete new one, never a partial write
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def build_telemetry_snapshot(csv_path, snapshot_dir=None):
+    """
+    Convert a telemetry CSV into a columnar snapshot directory
+    One .npy file per column (categoricals as integer codes) plus meta.json
+    """
+    csv_path = Path(csv_path)
+    snapshot_dir = Path(snapshot_dir) if snapshot_dir else _snapshot_dir_for(csv_path)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    # Retire the old snapshot before its column files are overwritten
+    (snapshot_dir / "meta.json").unlink(missing_ok=True)
+    
+    source = _csv_signature(csv_path)
+    df = typed_telemetry_frame(pd.read_csv(csv_path))
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        file_name = f"{i:03d}.npy"
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(snapshot_dir / file_name, series.cat.codes.to_numpy())
+            columns.append({"name": col, "file": file_name, "kind": "category",
+                            "categories": [str(c) for c in series.cat.categories]})
+        elif col in TELEMETRY_DATETIME_COLUMNS:
+            np.save(snapshot_dir / file_name, series.to_numpy(dtype="datetime64[ns]"))
+            columns.append({"name": col, "file": file_name, "kind": "datetime"})
+        else:
+            np.save(snapshot_dir / file_name, series.to_numpy())
+            columns.append({"name": col, "file": file_name, "kind": "numeric"})
+    
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "rows": len(df),
+        "source": source,
+        "columns": columns
+    }
+    # meta.json is written last (and atomically) so a half-built snapshot is never picked up
+    _write_json_atomic(snapshot_dir / "meta.json", meta)
+    return snapshot_dir
+
+def load_telemetry_snapshot(snapshot_dir, mmap=True):
+    """Load a snapshot built by build_telemetry_snapshot (columns memory-mapped by default)"""
+    snapshot_dir = Path(snapshot_dir)
+    with open(snapshot_dir / "meta.json") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {snapshot_dir}")
+    
+    data = {}
+    for col in meta["columns"]:
+        values = np.load(snapshot_dir / col["file"], mmap_mode="r" if mmap else None)
+        if col["kind"] == "category":
+            data[col["name"]] = pd.Categorical.from_codes(values, col["categories"])
+        else:
+            data[col["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+def load_telemetry_frame(csv_path):
+    """
+    Typed telemetry for csv_path: the snapshot if it is present and matches the CSV,
+    otherwise parse the CSV (automatic fallback)
+    """
+    snapshot_dir = _snapshot_dir_for(csv_path)
+    meta_path = snapshot_dir / "meta.json"
+    if meta_path.exists():
+        try:
+            with open(meta_path) as f:
+                source = json.load(f).get("source", {})
+            if _source_matches(source, csv_path):
+                return load_telemetry_snapshot(snapshot_dir)
+        except Exception:
+            pass  # Corrupt or stale snapshot - fall back to the CSV
+    return typed_telemetry_frame(pd.read_csv(csv_path))
+
+# --- FAILURE PREDICTION (per-failure-type logistic models over the telemetry sensors) ---
+FAILURE_TARGETS = {
+    "engine": "engine_failure_imminent",
+    "brake": "brake_issue_imminent",
+    "battery": "battery_issue_imminent"
+}
+FAILURE_FEATURE_COLUMNS = TELEMETRY_SENSOR_COLUMNS
+FAILURE_MODEL_FORMAT_VERSION = 1
+FAILURE_INSPECTION_PARTS = {"engine": "Engine", "brake": "Brake System", "battery": "Battery & Charging"}
+
+def _model_path_for(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.stem + ".failure_model.npz")
+
+def _fit_logistic(X, y, l2=1.0, iterations=50, tol=1e-6):
+    """
+    Class-balanced, L2-regularised logistic regression fitted by Newton/IRLS
+    X must already be standardised; returns (coef, intercept)
+    """
+    n, d = X.shape
+    positives = y.sum()
+    if positives == 0 or positives == n:
+        rate = np.clip(positives / n, 1e-6, 1 - 1e-6)
+        return np.zeros(d), float(np.log(rate / (1 - rate)))
+    
+    Xb = np.hstack([X, np.ones((n, 1))])
+    sample_weight = np.where(y == 1, n / (2 * positives), n / (2 * (n - positives)))
+    penalty = np.full(d + 1, l2)
+    penalty[-1] = 0.0  # intercept is not regularised
+    w = np.zeros(d + 1)
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(Xb @ w)))
+        gradient = Xb.T @ (sample_weight * (p - y)) + penalty * w
+        hessian = (Xb * (sample_weight * p * (1 - p))[:, None]).T @ Xb + np.diag(penalty + 1e-9)
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+    return w[:-1], float(w[-1])
+
+def _best_f1_threshold(scores, y):
+    """Probability cut-off that maximises F1 on (scores, y)"""
+    if y.sum() == 0:
+        return 0.5
+    order = np.argsort(-scores)
+    hits = np.cumsum(y[order])
+    f1 = 2 * hits / (np.arange(1, len(y) + 1) + y.sum())
+    return float(scores[order][np.argmax(f1)])
+
+class FailurePredictor:
+    """
+    One logistic model per failure type (engine / brake / battery) over the telemetry sensors
+    Standardisation is folded into the weights, so scoring a batch is a single
+    float32 matrix product - microseconds per vehicle. Persisted as an .npz file.
+    """
+    
+    def __init__(self, features, targets, weights, bias, thresholds, failure_types, fill_values, source=None):
+        self.features = list(features)
+        self.targets = list(targets)
+        self.weights = np.asarray(weights, dtype=np.float32)        # (features, targets)
+        self.bias = np.asarray(bias, dtype=np.float32)              # (targets,)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)  # (targets,)
+        self.failure_types = list(failure_types)
+        self.fill_values = np.asarray(fill_values, dtype=np.float32)
+        self.source = source
+    
+    @classmethod
+    def fit(cls, df, l2=1.0, folds=5, source=None):
+        """
+        Fit every failure head on a telemetry frame (labels from FAILURE_TARGETS)
+        Decision thresholds are tuned on out-of-fold scores, with folds split by
+        vehicle_id so a vehicle's own readings never grade its model.
+        """
+        X = df[FAILURE_FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        mean = np.nanmean(X, axis=0)
+        X = np.where(np.isnan(X), mean, X)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Xs = (X - mean) / scale
+        
+        fold_of_row = None
+        if "vehicle_id" in df.columns and df["vehicle_id"].nunique() >= folds > 1:
+            vehicles, codes = np.unique(df["vehicle_id"].astype(str).to_numpy(), return_inverse=True)
+            fold_of_row = np.random.default_rng(0).permutation(len(vehicles))[codes] % folds
+        
+        weights, bias, thresholds, failure_types = [], [], [], []
+        for name, column in FAILURE_TARGETS.items():
+            y = df[column].to_numpy(dtype=np.float64)
+            coef, intercept = _fit_logistic(Xs, y, l2=l2)
+            if fold_of_row is None:
+                scores = 1 / (1 + np.exp(-(Xs @ coef + intercept)))
+            else:
+                scores = np.empty(len(y))
+                for fold in range(folds):
+                    held_out = fold_of_row == fold
+                    fold_coef, fold_intercept = _fit_logistic(Xs[~held_out], y[~held_out], l2=l2)
+                    scores[held_out] = 1 / (1 + np.exp(-(Xs[held_out] @ fold_coef + fold_intercept)))
+            thresholds.append(_best_f1_threshold(scores, y))
+            # Fold (x - mean) / scale into the weights
+            weights.append(coef / scale)
+            bias.append(intercept - (mean / scale) @ coef)
+            labels = df.loc[y == 1, "failure_type"].astype(str)
+            failure_types.append(labels.mode().iloc[0] if len(labels) else "")
+        
+        return cls(FAILURE_FEATURE_COLUMNS, list(FAILURE_TARGETS), np.stack(weights, axis=1),
+                   bias, thresholds, failure_types, mean, source)
+    
+    def _matrix(self, readings):
+        """Feature matrix from a DataFrame, one reading dict, a list of dicts or an array"""
+        if isinstance(readings, dict):
+            readings = [readings]
+        if isinstance(readings, list):
+            readings = [[reading.get(f, np.nan) for f in self.features] for reading in readings]
+        elif isinstance(readings, pd.DataFrame):
+            readings = readings.reindex(columns=self.features).to_numpy(dtype=np.float32)
+        X = np.asarray(readings, dtype=np.float32)
+        if np.isnan(X).any():
+            X = np.where(np.isnan(X), self.fill_values, X)
+        return X
+    
+    def predict_proba(self, readings):
+        """(n, targets) float32 failure probabilities"""
+        z = self._matrix(readings) @ self.weights + self.bias
+        return 1 / (1 + np.exp(-z))
+    
+    def predict(self, readings):
+        """DataFrame with <target>_probability and <target>_imminent columns per reading"""
+        proba = self.predict_proba(readings)
+        result = {}
+        for i, target in enumerate(self.targets):
+            result[f"{target}_probability"] = proba[:, i]
+            result[f"{target}_imminent"] = proba[:, i] >= self.thresholds[i]
+        return pd.DataFrame(result)
+    
+    def save(self, path):
+        """Write the model to path (via a temp file, so readers never see a partial .npz)"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, weights=self.weights, bias=self.bias, thresholds=self.thresholds,
+                fill_values=self.fill_values,
+                meta=np.array(json.dumps({
+                    "format_version": FAILURE_MODEL_FORMAT_VERSION,
+                    "features": self.features,
+                    "targets": self.targets,
+                    "failure_types": self.failure_types,
+                    "source": self.source
+                }))
+            )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format_version") != FAILURE_MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported failure model format in {path}")
+            return cls(meta["features"], meta["targets"], data["weights"], data["bias"], data["thresholds"],
+                       meta["failure_types"], data["fill_values"], meta.get("source"))
+
+def load_failure_predictor(csv_path, retrain=False):
+    """
+    Fitted FailurePredictor for csv_path: the persisted model if it was trained on the
+    current CSV, otherwise fit one (and save it for the next start)
+    """
+    model_path = _model_path_for(csv_path)
+    if not retrain and model_path.exists():
+        try:
+            model = FailurePredictor.load(model_path)
+            if _source_matches(model.source, csv_path):
+                return model
+        except Exception:
+            pass  # Corrupt or old model - retrain
+    
+    model = FailurePredictor.fit(load_telemetry_frame(csv_path), source=_csv_signature(csv_path))
+    try:
+        model.save(model_path)
+    except OSError:
+        pass  # Read-only deployment - keep the in-memory model
+    return model
+
+# --- PER-VEHICLE TELEMETRY AGGREGATES (updated in O(1) per reading, no rescans) ---
+AGGREGATE_STATS = ["count", "mean", "std", "min", "max", "last"]
+
+class TelemetryAggregateStore:
+    """
+    Running count/mean/std/min/max/last per vehicle and sensor
+    Each vehicle owns one row in a set of (vehicles x sensors) arrays, so a new
+    reading costs a handful of vectorised ops on one row regardless of history
+    size, and queries never touch the raw telemetry. NaN readings are skipped
+    per sensor; readings older than the vehicle's latest never replace `last`.
+    """
+    
+    def __init__(self, columns=TELEMETRY_SENSOR_COLUMNS, capacity=64):
+        self.columns = list(columns)
+        self._column_index = {col: i for i, col in enumerate(self.columns)}
+        self._rows = {}
+        self._vehicle_ids = []
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+        self.readings = 0
+    
+    def _allocate(self, capacity):
+        shape = (capacity, len(self.columns))
+        grown = {
+            "count": np.zeros(shape, dtype=np.int64),
+            "sum": np.zeros(shape),
+            "sumsq": np.zeros(shape),
+            "min": np.full(shape, np.inf),
+            "max": np.full(shape, -np.inf),
+            "last": np.full(shape, np.nan),
+            "last_ts": np.full(capacity, np.datetime64("NaT"), dtype="datetime64[ns]")
+        }
+        used = len(self._vehicle_ids)
+        for name, array in grown.items():
+            if used:
+                array[:used] = getattr(self, "_" + name)[:used]
+            setattr(self, "_" + name, array)
+    
+    def _row(self, vehicle_id):
+        row = self._rows.get(vehicle_id)
+        if row is None:
+            row = len(self._vehicle_ids)
+            if row == len(self._count):
+                self._allocate(2 * row)
+            self._rows[vehicle_id] = row
+            self._vehicle_ids.append(vehicle_id)
+        return row
+    
+    def update(self, vehicle_id, reading, timestamp=None):
+        """Fold one reading (dict of sensor values) into the vehicle's aggregates"""
+        values = np.array([reading.get(col, np.nan) for col in self.columns], dtype=np.float64)
+        present = ~np.isnan(values)
+        clean = np.where(present, values, 0.0)
+        timestamp = np.datetime64(timestamp, "ns") if timestamp is not None else np.datetime64("NaT")
+        with self._lock:
+            row = self._row(str(vehicle_id))
+            self._count[row] += present
+            self._sum[row] += clean
+            self._sumsq[row] += clean * clean
+            np.fmin(self._min[row], values, out=self._min[row])
+            np.fmax(self._max[row], values, out=self._max[row])
+            if np.isnat(self._last_ts[row]) or np.isnat(timestamp) or timestamp >= self._last_ts[row]:
+                self._last[row] = np.where(present, values, self._last[row])
+                if not np.isnat(timestamp):
+                    self._last_ts[row] = timestamp
+            self.readings += 1
+    
+    def update_batch(self, df):
+        """
+        Fold a chunk of readings (vehicle_id, optional timestamp, sensor columns) in
+        one pass: aggregate the chunk per vehicle, then merge into the running rows
+        """
+        if len(df) == 0:
+            return
+        if "timestamp" in df.columns:
+            df = df.sort_values("timestamp", kind="stable")
+        ids = df["vehicle_id"].astype(str).to_numpy()
+        codes, vehicles = pd.factorize(ids, sort=False)
+        values = df.reindex(columns=self.columns).to_numpy(dtype=np.float64)
+        
+        # Chunk aggregates per vehicle (NaN skipped); rows are in time order, so last() is the latest
+        grouped = pd.DataFrame(values).groupby(codes, sort=True)
+        count = grouped.count().to_numpy()
+        total = grouped.sum().to_numpy()
+        squares = pd.DataFrame(values * values).groupby(codes, sort=True).sum().to_numpy()
+        low = grouped.min().to_numpy()
+        high = grouped.max().to_numpy()
+        last = grouped.last().to_numpy()
+        if "timestamp" in df.columns:
+            last_ts = pd.Series(df["timestamp"].to_numpy(dtype="datetime64[ns]")).groupby(codes, sort=True).max().to_numpy()
+        else:
+            last_ts = np.full(len(vehicles), np.datetime64("NaT"), dtype="datetime64[ns]")
+        
+        with self._lock:
+            rows = np.array([self._row(v) for v in vehicles])
+            self._count[rows] += count
+            self._sum[rows] += total
+            self._sumsq[rows] += squares
+            self._min[rows] = np.fmin(self._min[rows], low)
+            self._max[rows] = np.fmax(self._max[rows], high)
+            stored_ts = self._last_ts[rows]
+            newer = np.isnat(stored_ts) | np.isnat(last_ts) | (last_ts >= stored_ts)
+            self._last[rows] = np.where(newer[:, None] & ~np.isnan(last), last, self._last[rows])
+            self._last_ts[rows] = np.where(newer & ~np.isnat(last_ts), last_ts, stored_ts)
+            self.readings += len(df)
+    
+    @classmethod
+    def from_frame(cls, df, columns=TELEMETRY_SENSOR_COLUMNS):
+        store = cls(columns, capacity=max(64, df["vehicle_id"].nunique()))
+        store.update_batch(df)
+        return store
+    
+    def _stats(self, rows):
+        count = self._count[rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self._sum[rows] / count
+            variance = np.maximum(self._sumsq[rows] / count - mean * mean, 0.0)
+        empty = count == 0
+        return {
+            "count": count,
+            "mean": mean,
+            "std": np.sqrt(variance),
+            "min": np.where(empty, np.nan, self._min[rows]),
+            "max": np.where(empty, np.nan, self._max[rows]),
+            "last": self._last[rows]
+        }
+    
+    def get(self, vehicle_id):
+        """{sensor: {count, mean, std, min, max, last}} plus last_timestamp, or None for an unknown vehicle"""
+        with self._lock:
+            row = self._rows.get(str(vehicle_id))
+            if row is None:
+                return None
+            stats = self._stats(row)
+            last_ts = self._last_ts[row]
+        result = {
+            col: {stat: (int(stats[stat][i]) if stat == "count" else float(stats[stat][i])) for stat in AGGREGATE_STATS}
+            for i, col in enumerate(self.columns)
+        }
+        result["last_timestamp"] = None if np.isnat(last_ts) else pd.Timestamp(last_ts)
+        return result
+    
+    def summary(self, stat="mean", columns=None):
+        """One statistic for every vehicle as a (vehicle_id x sensor) DataFrame - the fleet dashboard view"""
+        with self._lock:
+            used = len(self._vehicle_ids)
+            values = self._stats(slice(0, used))[stat]
+            index = pd.Index(self._vehicle_ids[:used], name="vehicle_id")
+        frame = pd.DataFrame(values, index=index, columns=self.columns)
+        return frame[columns] if columns else frame
+    
+    def vehicles(self):
+        with self._lock:
+            return list(self._vehicle_ids)
+
+# --- STREAMING TELEMETRY INGESTION (fixed-size chunks through a generator pipeline) ---
+TELEMETRY_CHUNK_ROWS = int(os.getenv("TELEMETRY_CHUNK_ROWS", "50000"))
+# Hard physical limits; readings outside them are sensor glitches and become NaN
+TELEMETRY_VALID_RANGES = {
+    "odometer_reading": (0, 2_000_000),
+    "engine_rpm": (0, 20_000),
+    "fuel_level_percent": (0, 100),
+    "brake_pad_wear_mm": (0, 50),
+    "battery_voltage_v": (0, 60),
+    "battery_charge_percent": (0, 100),
+    "battery_health_percent": (0, 100)
+}
+
+def _peak_rss_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return None
+
+def read_telemetry_chunks(source, chunk_rows=TELEMETRY_CHUNK_ROWS):
+    """Parse stage: a telemetry CSV (path or file object) as raw DataFrame chunks"""
+    yield from pd.read_csv(source, chunksize=chunk_rows)
+
+def tail_telemetry_chunks(stream, chunk_rows=1000, flush_interval=1.0, follow=True, poll_interval=0.2):
+    """
+    Parse stage for live data: CSV lines appended to a file (follow=True keeps
+    polling at EOF, like tail -f) or piped through stdin (follow=False, stops at EOF)
+    A chunk is emitted once it holds chunk_rows lines or flush_interval seconds
+    after its first line arrived. The first line must be the CSV header.
+    """
+    header = stream.readline()
+    pending, partial, started = [], "", None
+    while True:
+        line = stream.readline()
+        if line:
+            line = partial + line
+            partial = ""
+            if not line.endswith("\n"):
+                partial = line  # writer is mid-line - wait for the rest
+            elif line.strip():
+                pending.append(line)
+                started = started or time.monotonic()
+        elif not follow:
+            break
+        else:
+            time.sleep(poll_interval)
+        
+        if pending and (len(pending) >= chunk_rows or time.monotonic() - started >= flush_interval):
+            yield pd.read_csv(io.StringIO(header + "".join(pending)))
+            pending, started = [], None
+    
+    if partial.strip():
+        pending.append(partial + "\n")
+    if pending:
+        yield pd.read_csv(io.StringIO(header + "".join(pending)))
+
+def validate_telemetry_chunks(chunks, stats):
+    """
+    Validate stage: drop rows without a vehicle_id or a parseable timestamp, coerce
+    sensors to numbers and blank out values outside TELEMETRY_VALID_RANGES
+    """
+    for chunk in chunks:
+        missing = {"vehicle_id", "timestamp"} - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Telemetry is missing required columns: {sorted(missing)}")
+        
+        timestamps = pd.to_datetime(chunk["timestamp"], errors="coerce")
+        valid = chunk["vehicle_id"].notna() & timestamps.notna()
+        stats["rejected_rows"] += int((~valid).sum())
+        chunk = chunk[valid].assign(timestamp=timestamps[valid])
+        
+        for col in TELEMETRY_SENSOR_COLUMNS:
+            if col not in chunk.columns:
+                continue
+            values = pd.to_numeric(chunk[col], errors="coerce")
+            bad = values.isna() & chunk[col].notna()
+            if col in TELEMETRY_VALID_RANGES:
+                low, high = TELEMETRY_VALID_RANGES[col]
+                bad |= (values < low) | (values > high)
+            if bad.any():
+                stats["invalid_values"] += int(bad.sum())
+                values = values.mask(bad)
+            chunk[col] = values
+        yield chunk
+
+def downcast_telemetry_chunks(chunks):
+    """Downcast stage: same compact dtypes as the snapshot (float32 sensors, categorical ids)"""
+    for chunk in chunks:
+        yield typed_telemetry_frame(chunk)
+
+def ingest_telemetry(chunks, store=None, predictor=None, on_flagged=None, progress=None,
+                     detector=None, on_anomalies=None):
+    """
+    Run raw chunks through validate -> downcast -> aggregate/flag
+    - store (TelemetryAggregateStore) receives every valid reading
+    - predictor (FailurePredictor) flags readings with an imminent failure; they are
+      passed to on_flagged(DataFrame) and never accumulated
+    - detector (SensorAnomalyDetector) scores every reading; anomalies go to on_anomalies(DataFrame)
+    Only one chunk is alive at a time, so memory is bounded by the chunk size plus
+    the O(vehicles) store. Returns rows/s, rejected counts and peak RSS.
+    """
+    stats = {"chunks": 0, "rows": 0, "rejected_rows": 0, "invalid_values": 0, "flagged": 0, "anomalies": 0}
+    start = time.perf_counter()
+    for chunk in downcast_telemetry_chunks(validate_telemetry_chunks(chunks, stats)):
+        if store is not None:
+            store.update_batch(chunk)
+        if predictor is not None and len(chunk):
+            imminent = predictor.predict_proba(chunk) >= predictor.thresholds
+            flagged = imminent.any(axis=1)
+            if flagged.any():
+                stats["flagged"] += int(flagged.sum())
+                if on_flagged:
+                    hits = chunk.loc[flagged, ["vehicle_id", "timestamp"]].reset_index(drop=True)
+                    for i, target in enumerate(predictor.targets):
+                        hits[f"{target}_imminent"] = imminent[flagged, i]
+                    on_flagged(hits)
+        if detector is not None:
+            anomalies = detector.update_batch(chunk)
+            stats["anomalies"] += len(anomalies)
+            if on_anomalies and len(anomalies):
+                on_anomalies(anomalies)
+        stats["chunks"] += 1
+        stats["rows"] += len(chunk)
+        if progress:
+            progress(stats)
+    
+    stats["elapsed_s"] = round(time.perf_counter() - start, 3)
+    stats["rows_per_s"] = round(stats["rows"] / stats["elapsed_s"]) if stats["elapsed_s"] else None
+    stats["peak_rss_mb"] = _peak_rss_mb()
+    return stats
+
+# --- TIME-INDEXED TELEMETRY (sorted by vehicle and time; queries are binary searches) ---
+THRESHOLD_OPS = {"<": ("left", True), "<=": ("right", True), ">": ("right", False), ">=": ("left", False)}
+
+class TelemetryIndex:
+    """
+    Telemetry sorted by (vehicle_id, timestamp) with each vehicle's rows at a known offset
+    - readings(vehicle, start, end): binary search inside that vehicle's contiguous block
+    - where(column, op, value, ...): binary searches on a per-column sorted index, a
+      fleet-wide time order and/or the vehicles' time blocks (each built on first use),
+      then the conditions are checked on the smallest of those candidate slices only
+    Results are row slices of the sorted frame, returned in (vehicle_id, timestamp) order.
+    """
+    
+    def __init__(self, df):
+        codes, vehicles = pd.factorize(df["vehicle_id"].astype(str), sort=True)
+        timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        order = np.lexsort((timestamps, codes))
+        
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self._timestamps = timestamps[order]
+        self._codes = codes[order]
+        self.vehicle_ids = list(vehicles)
+        bounds = np.searchsorted(self._codes, np.arange(len(vehicles) + 1))
+        self._offsets = {v: (int(bounds[i]), int(bounds[i + 1])) for i, v in enumerate(self.vehicle_ids)}
+        self._code_of = {v: i for i, v in enumerate(self.vehicle_ids)}
+        self._value_index = {}
+        self._by_time = None
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.frame)
+    
+    @staticmethod
+    def _ns(value, default):
+        return default if value is None else pd.Timestamp(value).value
+    
+    def _time_slice(self, vehicle_id, start=None, end=None):
+        """(lo, hi) rows of vehicle_id with start <= timestamp <= end"""
+        first, last = self._offsets.get(str(vehicle_id), (0, 0))
+        block = self._timestamps[first:last]
+        lo = first + np.searchsorted(block, self._ns(start, np.iinfo(np.int64).min), side="left")
+        hi = first + np.searchsorted(block, self._ns(end, np.iinfo(np.int64).max), side="right")
+        return int(lo), int(hi)
+    
+    def readings(self, vehicle_id, start=None, end=None):
+        """One vehicle's readings between start and end (inclusive) as a slice of the sorted frame"""
+        lo, hi = self._time_slice(vehicle_id, start, end)
+        return self.frame.iloc[lo:hi]
+    
+    def _sorted_column(self, column):
+        with self._lock:
+            entry = self._value_index.get(column)
+            if entry is None:
+                values = self.frame[column].to_numpy()
+                if not np.issubdtype(values.dtype, np.floating):
+                    values = values.astype(np.float64)
+                order = np.argsort(values, kind="stable")  # NaN sorts last
+                sorted_values = values[order]
+                entry = (sorted_values, order, int(np.count_nonzero(~np.isnan(values))))
+                self._value_index[column] = entry
+            return entry
+    
+    def _time_order(self):
+        """All rows ordered by timestamp alone (built on first use) for fleet-wide time windows"""
+        with self._lock:
+            if self._by_time is None:
+                order = np.argsort(self._timestamps, kind="stable")
+                self._by_time = (self._timestamps[order], order)
+            return self._by_time
+    
+    def where(self, column, op, value, start=None, end=None, vehicle_ids=None):
+        """Readings with `column op value` (op one of < <= > >=), optionally within a time window and vehicles"""
+        side, below = THRESHOLD_OPS[op]
+        t0 = self._ns(start, np.iinfo(np.int64).min)
+        t1 = self._ns(end, np.iinfo(np.int64).max)
+        
+        # Candidate slices, each found by binary search
+        sorted_values, by_value, valid = self._sorted_column(column)
+        value = sorted_values.dtype.type(value)  # compare at the column's precision, as a mask would
+        cut = int(np.searchsorted(sorted_values[:valid], value, side=side))
+        candidates = [by_value[:cut] if below else by_value[cut:valid]]
+        if start is not None or end is not None:
+            sorted_times, by_time = self._time_order()
+            lo = np.searchsorted(sorted_times, t0, side="left")
+            hi = np.searchsorted(sorted_times, t1, side="right")
+            candidates.append(by_time[lo:hi])
+        if vehicle_ids is not None:
+            vehicle_ids = list(dict.fromkeys(str(v) for v in vehicle_ids))
+            slices = [self._time_slice(v, start, end) for v in vehicle_ids]
+            candidates.append(np.concatenate([np.arange(a, b) for a, b in slices] or [np.empty(0, dtype=np.int64)]))
+        
+        # Check every condition on the smallest candidate set only
+        rows = min(candidates, key=len)
+        compare = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}[op]
+        keep = compare(self.frame[column].to_numpy(dtype=sorted_values.dtype)[rows], value)
+        ts = self._timestamps[rows]
+        keep &= (ts >= t0) & (ts <= t1)
+        if vehicle_ids is not None:
+            allowed = np.zeros(len(self.vehicle_ids), dtype=bool)
+            allowed[[self._code_of[v] for v in vehicle_ids if v in self._code_of]] = True
+            keep &= allowed[self._codes[rows]]
+        return self.frame.iloc[np.sort(rows[keep])]
+    
+    @property
+    def latest(self):
+        """Newest timestamp in the index (for "last week" style windows)"""
+        return pd.Timestamp(self._timestamps.max()) if len(self._timestamps) else None
+
+# --- SENSOR ANOMALY DETECTION (per-vehicle EWMA z-scores, vectorised across vehicles) ---
+# Monitored channel -> (system, risk points when anomalous); *_divergence_kph channels are derived.
+# Slow wear trends (brake_pad_wear_mm) are left to the failure model and threshold queries.
+ANOMALY_CHANNELS = {
+    "engine_temp_c": ("engine", 5),
+    "oil_pressure_psi": ("engine", 5),
+    "coolant_temp_c": ("engine", 5),
+    "exhaust_gas_temp_c": ("engine", 5),
+    "vibration_level": ("engine", 5),
+    "brake_fluid_level_psi": ("brakes", 8),
+    "brake_temp_c": ("brakes", 8),
+    "wheel_speed_front_divergence_kph": ("wheels", 10),
+    "wheel_speed_rear_divergence_kph": ("wheels", 10),
+    "battery_voltage_v": ("battery", 3),
+    "alternator_output_v": ("battery", 3),
+    "battery_temp_c": ("battery", 3)
+}
+ANOMALY_RESULT_COLUMNS = ["vehicle_id", "timestamp", "sensor", "system", "value", "expected", "zscore"]
+DERIVED_CHANNELS = {
+    "wheel_speed_front_divergence_kph": ("wheel_speed_fl_kph", "wheel_speed_fr_kph"),
+    "wheel_speed_rear_divergence_kph": ("wheel_speed_rl_kph", "wheel_speed_rr_kph")
+}
+
+class SensorAnomalyDetector:
+    """
+    Streaming anomaly detection over live sensor readings
+    Every (vehicle, channel) keeps an exponentially weighted mean and variance. Each
+    reading is scored against the state *before* it (z = (x - mean) / std) and is an
+    anomaly when |z| >= z_threshold once the channel has seen `warmup` readings.
+    Left/right wheel-speed divergence is scored as its own channel.
+    A chunk is processed in rounds holding at most one reading per vehicle, so each
+    round is a few NumPy ops across all vehicles at once.
+    """
+    
+    def __init__(self, alpha=0.1, z_threshold=4.0, warmup=10, channels=ANOMALY_CHANNELS, capacity=64):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.channels = list(channels)
+        self.systems = [channels[c][0] for c in self.channels]
+        self.risk_points = [channels[c][1] for c in self.channels]
+        self._rows = {}
+        self._vehicle_ids = []
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+        self.readings = 0
+        self.anomalies = 0
+    
+    def _allocate(self, capacity):
+        shape = (capacity, len(self.channels))
+        grown = {
+            "count": np.zeros(shape, dtype=np.int64),
+            "mean": np.zeros(shape),
+            "var": np.zeros(shape),
+            "last_value": np.full(shape, np.nan),
+            "last_expected": np.full(shape, np.nan),
+            "last_z": np.full(shape, np.nan)
+        }
+        used = len(self._vehicle_ids)
+        for name, array in grown.items():
+            if used:
+                array[:used] = getattr(self, "_" + name)[:used]
+            setattr(self, "_" + name, array)
+    
+    def _row(self, vehicle_id):
+        row = self._rows.get(vehicle_id)
+        if row is None:
+            row = len(self._vehicle_ids)
+            if row == len(self._count):
+                self._allocate(2 * row)
+            self._rows[vehicle_id] = row
+            self._vehicle_ids.append(vehicle_id)
+        return row
+    
+    def channel_values(self, readings):
+        """(n, channels) float64 matrix from a DataFrame, deriving the divergence channels"""
+        columns = {}
+        for channel in self.channels:
+            if channel in DERIVED_CHANNELS:
+                left, right = DERIVED_CHANNELS[channel]
+                columns[channel] = np.abs(readings[left].to_numpy(dtype=np.float64) - readings[right].to_numpy(dtype=np.float64))
+            elif channel in readings.columns:
+                columns[channel] = readings[channel].to_numpy(dtype=np.float64)
+            else:
+                columns[channel] = np.full(len(readings), np.nan)
+        return np.column_stack([columns[c] for c in self.channels])
+    
+    def _step(self, rows, values):
+        """Score one reading per vehicle (rows unique) and fold it into the EWMA state"""
+        mean = self._mean[rows]
+        var = self._var[rows]
+        count = self._count[rows]
+        present = ~np.isnan(values)
+        
+        with np.errstate(invalid="ignore"):
+            z = np.where(present & (count >= self.warmup), (values - mean) / (np.sqrt(var) + 1e-9), np.nan)
+            anomalous = np.abs(z) >= self.z_threshold
+        
+        first = present & (count == 0)
+        diff = np.where(present, values - mean, 0.0)
+        increment = self.alpha * diff
+        self._mean[rows] = np.where(first, values, mean + increment)
+        self._var[rows] = np.where(first, 0.0, (1 - self.alpha) * (var + diff * increment))
+        self._count[rows] = count + present
+        self._last_value[rows] = values
+        self._last_expected[rows] = np.where(count > 0, mean, np.nan)
+        self._last_z[rows] = z
+        return z, anomalous, mean
+    
+    def update_batch(self, df):
+        """
+        Score and absorb a chunk of readings (vehicle_id, optional timestamp, sensors)
+        Returns the anomalies as a DataFrame: vehicle_id, timestamp, sensor, system, value, expected, zscore
+        """
+        if len(df) == 0:
+            return pd.DataFrame(columns=ANOMALY_RESULT_COLUMNS)
+        if "timestamp" in df.columns:
+            df = df.sort_values("timestamp", kind="stable")
+        codes, vehicles = pd.factorize(df["vehicle_id"].astype(str), sort=False)
+        values = self.channel_values(df)
+        
+        # Round r holds every vehicle's r-th reading of this chunk
+        by_vehicle = np.argsort(codes, kind="stable")
+        group_start = np.searchsorted(codes[by_vehicle], np.arange(len(vehicles)))
+        rank = np.empty(len(codes), dtype=np.int64)
+        rank[by_vehicle] = np.arange(len(codes)) - group_start[codes[by_vehicle]]
+        
+        hits = []
+        with self._lock:
+            vehicle_rows = np.array([self._row(v) for v in vehicles])
+            for r in range(int(rank.max()) + 1):
+                positions = np.flatnonzero(rank == r)
+                z, anomalous, expected = self._step(vehicle_rows[codes[positions]], values[positions])
+                if anomalous.any():
+                    reading, channel = np.nonzero(anomalous)
+                    hits.append((positions[reading], channel, z[reading, channel], expected[reading, channel]))
+            self.readings += len(df)
+        
+        if not hits:
+            return pd.DataFrame(columns=ANOMALY_RESULT_COLUMNS)
+        positions, channel, z, expected = (np.concatenate(parts) for parts in zip(*hits))
+        self.anomalies += len(positions)
+        return pd.DataFrame({
+            "vehicle_id": np.asarray(vehicles)[codes[positions]],
+            "timestamp": df["timestamp"].to_numpy()[positions] if "timestamp" in df.columns else pd.NaT,
+            "sensor": np.asarray(self.channels)[channel],
+            "system": np.asarray(self.systems)[channel],
+            "value": values[positions, channel],
+            "expected": expected,
+            "zscore": z
+        })
+    
+    def update(self, vehicle_id, reading):
+        """Score one live reading (dict); returns its findings (see findings())"""
+        values = np.array([[
+            abs(reading.get(DERIVED_CHANNELS[c][0], np.nan) - reading.get(DERIVED_CHANNELS[c][1], np.nan))
+            if c in DERIVED_CHANNELS else reading.get(c, np.nan)
+            for c in self.channels
+        ]], dtype=np.float64)
+        with self._lock:
+            row = self._row(str(vehicle_id))
+            _, anomalous, _ = self._step(np.array([row]), values)
+            self.readings += 1
+            self.anomalies += int(anomalous.sum())
+        return self.findings(vehicle_id)
+    
+    def findings(self, vehicle_id):
+        """Channels whose latest reading for the vehicle was anomalous, worst first (input for the risk score)"""
+        with self._lock:
+            row = self._rows.get(str(vehicle_id))
+            if row is None:
+                return []
+            z = self._last_z[row].copy()
+            value = self._last_value[row].copy()
+            expected = self._last_expected[row].copy()
+        with np.errstate(invalid="ignore"):
+            flagged = np.flatnonzero(np.abs(z) >= self.z_threshold)
+        result = [{
+            "sensor": self.channels[i],
+            "system": self.systems[i],
+            "value": round(float(value[i]), 2),
+            "expected": round(float(expected[i]), 2),
+            "zscore": round(float(z[i]), 1),
+            "risk_points": self.risk_points[i]
+        } for i in flagged]
+        return sorted(result, key=lambda f: -abs(f["zscore"]))
+
+# Seconds between checks of obd-trouble-codes.csv for changes on the lookup path
+OBD_CHECK_INTERVAL = 5.0
+
+def _read_obd_codes(path):
+    return pd.read_csv(path, header=None, names=["Code", "Description"])
+
+def normalize_obd_code(code):
+    """Canonical form used for OBD lookups (trimmed, upper-case)"""
+    return str(code).strip().upper()
+
+class OBDCodeTrie:
+    """Character trie over OBD codes for prefix queries such as P01* or all C-codes"""
+    
+    __slots__ = ("root",)
+    
+    def __init__(self):
+        self.root = {}
+    
+    def insert(self, code):
+        node = self.root
+        for char in code:
+            node = node.setdefault(char, {})
+        node[None] = code  # None key marks the end of a full code
+    
+    def codes_with_prefix(self, prefix, limit=None):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        
+        codes = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if None in node:
+                codes.append(node[None])
+            stack.extend(child for key, child in node.items() if key is not None)
+        codes.sort()
+        return codes[:limit] if limit else codes
+
+def _compile_obd_index(df):
+    """Normalised code -> description index plus prefix trie for the OBD table"""
+    index = {}
+    trie = OBDCodeTrie()
+    for code, description in zip(df["Code"], df["Description"]):
+        key = normalize_obd_code(code)
+        if key and key not in index:  # First entry wins, as with the old scan
+            index[key] = description
+            trie.insert(key)
+    return index, trie
+
+# --- PARTS GROUPS (which parts table applies to a vehicle type/fuel combination) ---
+BIKE_TYPES = ["Motorbike", "Bike", "Motorcycle"]
+TUK_TYPES = ["Three-Wheeler", "Tuk", "Auto"]
+
+# Vehicle_Type labels used by create_specialized_data.py's CSVs -> parts group
+SPECIAL_VEHICLE_GROUPS = {"Motor Bicycle": "bike", "Three-Wheeler": "tuk"}
+
+# group -> representative (vehicle_type, fuel_type)
+PARTS_GROUPS = {
+    "bike": ("Motorbike", None),
+    "tuk": ("Three-Wheeler", None),
+    "car:Electric": ("EV", "Electric"),
+    "car:Diesel": ("Petrol/Diesel Car", "Diesel"),
+    "car:Hybrid": ("Hybrid", "Hybrid"),
+    "car:Petrol": ("Petrol/Diesel Car", "Petrol")
+}
+
+def parts_group_for(vehicle_type, fuel_type=None):
+    """Map a vehicle type and (optional) fuel type to one of PARTS_GROUPS"""
+    if vehicle_type in BIKE_TYPES:
+        return "bike"
+    if vehicle_type in TUK_TYPES:
+        return "tuk"
+    
+    # Car or generic vehicle - determine fuel type if not provided
+    if not fuel_type:
+        if vehicle_type == "EV":
+            fuel_type = "Electric"
+        elif vehicle_type == "Hybrid":
+            fuel_type = "Hybrid"
+        else:
+            fuel_type = "Petrol"
+    
+    if fuel_type in ("EV", "Electric"):
+        return "car:Electric"
+    if fuel_type in ("Diesel", "Hybrid"):
+        return f"car:{fuel_type}"
+    return "car:Petrol"
+
+# --- PARTS CATALOG (parts_catalog.json, loaded once and shared read-only) ---
+class PartSpec:
+    """Immutable catalog record for one part"""
+    
+    __slots__ = ("name", "price_lkr", "interval_km", "urgency", "risk_factor", "symptom")
+    
+    def __init__(self, name, price_lkr, interval_km, urgency, risk_factor=None, symptom=None):
+        for slot, value in zip(self.__slots__, (name, price_lkr, interval_km, urgency, risk_factor, symptom)):
+            object.__setattr__(self, slot, value)
+    
+    def __setattr__(self, key, value):
+        raise AttributeError("PartSpec is read-only")
+    
+    def __repr__(self):
+        return f"PartSpec({self.name!r}, {self.price_lkr} LKR, every {self.interval_km} km, {self.urgency})"
+    
+    def as_info(self):
+        """Legacy dict shape used by the get_*_parts_info callers"""
+        return {"Price_LKR": self.price_lkr, "Interval_km": self.interval_km, "Urgency": self.urgency}
+
+class PartsCatalog:
+    """
+    Parts tables keyed by parts group (see PARTS_GROUPS), built from parts_catalog.json
+    Lifespan notes come from parts_lifespan.json and, if create_specialized_data.py has
+    been run, bike/tuk prices from data/parts_db_special.csv override the catalog - each row
+    only for the group of its Vehicle_Type (rows without one only where the part name is
+    unambiguous between bike and tuk).
+    The source files are re-checked every `check_interval` seconds, so editing prices
+    takes effect without a restart; `version` increases on every reload.
+    """
+    
+    def __init__(self, base_path, check_interval=5.0):
+        base_path = Path(base_path)
+        self.catalog_path = base_path / "parts_catalog.json"
+        self.lifespan_path = base_path / "parts_lifespan.json"
+        self.special_prices_path = base_path / "data" / "parts_db_special.csv"
+        self.check_interval = check_interval
+        self.version = 0
+        self.catalog_version = None
+        self.last_error = None  # why the last reload was rejected, if it was
+        self._state = None  # (groups, read-only views), swapped atomically on reload
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def _source_signature(self):
+        signature = []
+        for path in (self.catalog_path, self.lifespan_path, self.special_prices_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def _read_sources(self):
+        with open(self.catalog_path) as f:
+            catalog = json.load(f)
+        
+        lifespan = {}
+        if self.lifespan_path.exists():
+            with open(self.lifespan_path) as f:
+                lifespan = {entry["part"]: entry for entry in json.load(f)}
+        
+        special_prices = []
+        if self.special_prices_path.exists():
+            special = pd.read_csv(self.special_prices_path)
+            vehicle_types = special["Vehicle_Type"] if "Vehicle_Type" in special else [None] * len(special)
+            special_prices = list(zip(vehicle_types, special["Part_Name"], special["Base_Price_LKR"]))
+        
+        return catalog, lifespan, special_prices
+    
+    @staticmethod
+    def _resolve_group(raw_groups, name, seen=()):
+        """Expand {"extends": ..., "parts": [...]} entries; later parts replace same-named ones in place"""
+        if name in seen:
+            raise ValueError(f"Circular 'extends' in parts catalog: {name}")
+        entry = raw_groups[name]
+        if isinstance(entry, list):
+            return {row["part"]: row for row in entry}
+        
+        rows = PartsCatalog._resolve_group(raw_groups, entry["extends"], seen + (name,))
+        for row in entry["parts"]:
+            rows[row["part"]] = row
+        return rows
+    
+    @staticmethod
+    def _special_price_overrides(special_prices, resolved):
+        """(Vehicle_Type, part, price) rows -> {(group, part): price}"""
+        overrides = {}
+        for vehicle_type, name, price in special_prices:
+            if isinstance(vehicle_type, str) and vehicle_type:
+                candidates = [SPECIAL_VEHICLE_GROUPS.get(vehicle_type) or parts_group_for(vehicle_type)]
+            else:
+                # Older files have no Vehicle_Type column: only apply where the name is unambiguous
+                candidates = [g for g in SPECIAL_VEHICLE_GROUPS.values() if name in resolved[g]]
+            if len(candidates) == 1 and name in resolved[candidates[0]]:
+                overrides[(candidates[0], name)] = price
+        return overrides
+    
+    def _build(self, catalog, lifespan, special_prices):
+        groups = {}
+        views = {}
+        resolved = {group: self._resolve_group(catalog["groups"], group) for group in PARTS_GROUPS}
+        overrides = self._special_price_overrides(special_prices, resolved)
+        for group in PARTS_GROUPS:
+            specs = []
+            for name, row in resolved[group].items():
+                notes = next((entry for part, entry in lifespan.items() if name.startswith(part)), {})
+                specs.append(PartSpec(
+                    name,
+                    int(overrides.get((group, name), row["price_lkr"])),
+                    int(row["interval_km"]),
+                    row["urgency"],
+                    notes.get("risk_factor"),
+                    notes.get("symptom")
+                ))
+            groups[group] = tuple(specs)
+            views[group] = MappingProxyType({spec.name: MappingProxyType(spec.as_info()) for spec in specs})
+        return groups, views
+    
+    def reload(self):
+        """Re-read the source files; on error the previous catalog stays in place (see last_error)"""
+        with self._lock:
+            signature = self._source_signature()
+            try:
+                catalog, lifespan, special_prices = self._read_sources()
+                state = self._build(catalog, lifespan, special_prices)
+            except Exception as e:
+                if self._state is None:
+                    raise
+                self.last_error = e
+                print(f"⚠️ Could not reload parts catalog, keeping version {self.version}: {e}")
+                self._signature = signature
+                return self.version
+            
+            self.catalog_version = catalog.get("version")
+            self.last_error = None
+            self._state = state
+            self._signature = signature
+            self.version += 1
+            return self.version
+    
+    def check_for_updates(self):
+        """Reload if a source file changed (checked at most every check_interval seconds)"""
+        now = time.monotonic()
+        if self._state is not None and now - self._checked_at < self.check_interval:
+            return self.version
+        self._checked_at = now
+        if self._state is None or self._source_signature() != self._signature:
+            return self.reload()
+        return self.version
+    
+    def parts(self, group):
+        """Tuple of PartSpec records for a parts group"""
+        self.check_for_updates()
+        return self._state[0][group]
+    
+    def as_dict(self, group):
+        """Read-only {part name: {"Price_LKR", "Interval_km", "Urgency"}} mapping for a parts group"""
+        self.check_for_updates()
+        return self._state[1][group]
+
+parts_catalog = PartsCatalog(Path(__file__).parent)
 
 class DatasetHandler:
     """Load and cache datasets for vehicle maintenance and diagnostics"""
@@ -17,42 +1310,134 @@ class DatasetHandler:
         self.obd_codes_df = None
         self.bike_maintenance = None
         self.tuk_maintenance = None
+        self.interval_matrix = None
+        self.failure_predictor = None
+        self.failure_predictor_version = 0
+        self.telemetry_aggregates = None
+        self.telemetry_aggregates_version = 0
+        self.telemetry_index = None
+        self.telemetry_index_version = 0
+        self.anomaly_detector = None
+        self.anomaly_detector_version = 0
+        self._build_lock = threading.Lock()
         
-    @st.cache_data
-    def load_maintenance_schedule(_self):
-        """Load maintenance schedule dataset"""
+    def load_maintenance_schedule(self):
+        """Load typed maintenance telemetry (snapshot or CSV, once per process via dataset_cache)"""
         try:
-            path = _self.base_path / "maintain_schdule.csv"
-            df = pd.read_csv(path)
-            return df
+            path = self.base_path / "maintain_schdule.csv"
+            return dataset_cache.get(path, load_telemetry_frame)
         except Exception as e:
             st.warning(f"Could not load maintenance schedule: {e}")
             return None
     
-    @st.cache_data
-    def load_obd_codes(_self):
-        """Load OBD trouble codes dataset"""
+    def load_obd_codes(self):
+        """Load OBD trouble codes dataset (parsed once per process via dataset_cache)"""
         try:
-            path = _self.base_path / "obd-trouble-codes.csv"
-            df = pd.read_csv(path, header=None, names=["Code", "Description"])
-            return df
+            path = self.base_path / "obd-trouble-codes.csv"
+            return dataset_cache.get(path, _read_obd_codes)
         except Exception as e:
             st.warning(f"Could not load OBD codes: {e}")
             return None
     
-    def get_maintenance_for_odometer(self, current_odometer, last_service_odo, vehicle_type="Car"):
+    def _telemetry_artifact(self, attr, build):
+        """
+        self.<attr>, built by build(df) and rebuilt whenever maintain_schdule.csv is reloaded
+        Double-checked under a lock, so concurrent sessions build it only once
+        """
+        df = self.load_maintenance_schedule()
+        if df is None:
+            return None
+        
+        version = dataset_cache.version(self.base_path / "maintain_schdule.csv")
+        # <attr>_version is published after <attr>, so read it first
+        if getattr(self, f"{attr}_version") == version and getattr(self, attr) is not None:
+            return getattr(self, attr)
+        with self._build_lock:
+            if getattr(self, f"{attr}_version") != version or getattr(self, attr) is None:
+                setattr(self, attr, build(df))
+                setattr(self, f"{attr}_version", version)
+            return getattr(self, attr)
+    
+    def get_failure_predictor(self):
+        """Failure model for maintain_schdule.csv (loaded from disk or trained once, refit if the CSV changes)"""
+        path = self.base_path / "maintain_schdule.csv"
+        try:
+            return self._telemetry_artifact("failure_predictor", lambda df: load_failure_predictor(path))
+        except Exception as e:
+            st.warning(f"Could not load failure model: {e}")
+            return None
+    
+    def predict_failures(self, readings):
+        """
+        Engine/brake/battery failure probabilities for a batch of sensor readings
+        readings: DataFrame, list of dicts or one dict with FAILURE_FEATURE_COLUMNS
+        """
+        predictor = self.get_failure_predictor()
+        if predictor is None:
+            return None
+        return predictor.predict(readings)
+    
+    def get_telemetry_aggregates(self):
+        """
+        Per-vehicle sensor aggregates seeded from maintain_schdule.csv
+        Live readings are added with record_telemetry(); the store is reseeded if the CSV changes.
+        """
+        return self._telemetry_artifact("telemetry_aggregates", TelemetryAggregateStore.from_frame)
+    
+    def get_anomaly_detector(self):
+        """Sensor anomaly detector warmed up on maintain_schdule.csv (rebuilt if the CSV changes)"""
+        def build(df):
+            detector = SensorAnomalyDetector(capacity=max(64, df["vehicle_id"].nunique()))
+            detector.update_batch(df)
+            return detector
+        
+        return self._telemetry_artifact("anomaly_detector", build)
+    
+    def get_sensor_anomalies(self, vehicle_id):
+        """Anomalous channels in the vehicle's latest reading (feed to logic.calculate_accident_risk)"""
+        detector = self.get_anomaly_detector()
+        return detector.findings(vehicle_id) if detector is not None else []
+    
+    def record_telemetry(self, vehicle_id, reading, timestamp=None):
+        """
+        Fold one new sensor reading into the vehicle's aggregates (O(1)) and score it
+        for anomalies; returns the reading's anomaly findings
+        """
+        store = self.get_telemetry_aggregates()
+        if store is not None:
+            store.update(vehicle_id, reading, timestamp)
+        detector = self.get_anomaly_detector()
+        return detector.update(vehicle_id, reading) if detector is not None else []
+    
+    def get_vehicle_telemetry_stats(self, vehicle_id):
+        """Running mean/std/min/max/last per sensor for one vehicle, or None if unknown"""
+        store = self.get_telemetry_aggregates()
+        return store.get(vehicle_id) if store is not None else None
+    
+    def get_telemetry_index(self):
+        """(vehicle_id, timestamp)-sorted index over maintain_schdule.csv (rebuilt if the CSV changes)"""
+        return self._telemetry_artifact("telemetry_index", TelemetryIndex)
+    
+    def get_vehicle_readings(self, vehicle_id, start=None, end=None):
+        """Telemetry rows for one vehicle between start and end (inclusive), oldest first"""
+        index = self.get_telemetry_index()
+        return index.readings(vehicle_id, start, end) if index is not None else None
+    
+    def ingest_telemetry_chunks(self, chunks, on_flagged=None, progress=None, on_anomalies=None):
+        """Stream raw telemetry chunks into this handler's aggregates, failure model and anomaly detector"""
+        return ingest_telemetry(chunks, self.get_telemetry_aggregates(), self.get_failure_predictor(),
+                                on_flagged=on_flagged, progress=progress,
+                                detector=self.get_anomaly_detector(), on_anomalies=on_anomalies)
+    
+    def get_maintenance_for_odometer(self, current_odometer, last_service_odo, vehicle_type="Car", telemetry=None):
         """
         Get maintenance recommendations based on odometer readings
-        Uses maintenance schedule dataset
+        With a latest sensor reading (telemetry dict), failures the model predicts
+        as imminent are added as inspections
         """
         try:
-            df = self.load_maintenance_schedule()
-            if df is None:
-                return []
-            
             km_since_service = current_odometer - last_service_odo
             
-            # Get relevant maintenance records from dataset
             recommendations = []
             
             if km_since_service >= 5000:
@@ -79,27 +1464,75 @@ class DatasetHandler:
                     "km_until_due": 0
                 })
             
+            predictor = self.get_failure_predictor() if telemetry is not None else None
+            if predictor is not None:
+                proba = predictor.predict_proba(telemetry)[-1]
+                for i, target in enumerate(predictor.targets):
+                    if proba[i] >= predictor.thresholds[i]:
+                        recommendations.append({
+                            "part": FAILURE_INSPECTION_PARTS[target],
+                            "action": "Inspect",
+                            "urgency": "CRITICAL" if proba[i] >= 0.8 else "HIGH",
+                            "km_until_due": 0,
+                            "failure_probability": round(float(proba[i]), 3),
+                            "likely_failure": predictor.failure_types[i]
+                        })
+            
             return recommendations
         except Exception as e:
             st.error(f"Error getting maintenance: {e}")
             return []
     
+    def get_obd_index(self):
+        """
+        (code index, prefix trie) for the OBD table, kept with its dataset_cache entry
+        Rebuilt only when the CSV is reloaded; None if the table cannot be loaded
+        """
+        try:
+            path = self.base_path / "obd-trouble-codes.csv"
+            return dataset_cache.derived(path, _read_obd_codes, "obd_index", _compile_obd_index, OBD_CHECK_INTERVAL)
+        except Exception as e:
+            st.warning(f"Could not load OBD codes: {e}")
+            return None
+    
+    def lookup_obd_codes(self, trouble_codes):
+        """
+        Resolve a batch of OBD codes (e.g. a whole scan-tool dump) in one call
+        Returns {code: description or None} in input order
+        """
+        compiled = self.get_obd_index()
+        if compiled is None:
+            return {code: None for code in trouble_codes}
+        
+        index = compiled[0]
+        return {code: index.get(normalize_obd_code(code)) for code in trouble_codes}
+    
+    def search_obd_codes(self, prefix, limit=None):
+        """
+        Find codes by prefix, e.g. "P01", "P01*" or "C" for all chassis codes
+        Returns a sorted list of (code, description) tuples
+        """
+        compiled = self.get_obd_index()
+        if compiled is None:
+            return []
+        
+        index, trie = compiled
+        codes = trie.codes_with_prefix(normalize_obd_code(prefix).rstrip("*"), limit)
+        return [(code, index[code]) for code in codes]
+    
     def get_obd_description(self, trouble_code):
         """
         Get OBD trouble code description from dataset
         Handles codes like P0100, C1234, etc.
         """
         try:
-            df = self.load_obd_codes()
-            if df is None:
+            compiled = self.get_obd_index()
+            if compiled is None:
                 return f"OBD Code: {trouble_code} (Description not found)"
             
-            # Search for the code
-            code_upper = trouble_code.upper()
-            match = df[df['Code'].str.strip().str.upper() == code_upper]
+            description = compiled[0].get(normalize_obd_code(trouble_code))
             
-            if not match.empty:
-                description = match.iloc[0]['Description']
+            if description is not None:
                 return f"**{trouble_code}**: {description}"
             else:
                 return f"OBD Code: {trouble_code} (Not found in database)"
@@ -107,6 +1540,15 @@ class DatasetHandler:
         except Exception as e:
             return f"Error looking up code {trouble_code}: {e}"
     
+    def get_obd_descriptions(self, trouble_codes):
+        """Formatted descriptions for a list of codes, same format as get_obd_description"""
+        resolved = self.lookup_obd_codes(trouble_codes)
+        return [
+            f"**{code}**: {description}" if description is not None
+            else f"OBD Code: {code} (Not found in database)"
+            for code, description in resolved.items()
+        ]
+    
     def get_bike_maintenance(self):
         """Get maintenance schedule for motorbikes"""
         try:
@@ -148,80 +1590,20 @@ class DatasetHandler:
             return None
     
     def get_car_parts_info(self, fuel_type="Petrol"):
-        """Get car parts pricing based on fuel type"""
-        # Base parts for all cars
-        base_parts = {
-            "Engine Oil (5L)": {"Price_LKR": 8500, "Interval_km": 8000, "Urgency": "CRITICAL"},
-            "Oil Filter": {"Price_LKR": 1800, "Interval_km": 8000, "Urgency": "CRITICAL"},
-            "Brake Fluid": {"Price_LKR": 2500, "Interval_km": 20000, "Urgency": "MEDIUM"},
-            "Coolant Flush": {"Price_LKR": 3500, "Interval_km": 40000, "Urgency": "MEDIUM"},
-            "Air Filter": {"Price_LKR": 2200, "Interval_km": 15000, "Urgency": "MEDIUM"},
-            "Wheel Alignment": {"Price_LKR": 4500, "Interval_km": 10000, "Urgency": "HIGH"},
-            "Tire Rotation": {"Price_LKR": 2000, "Interval_km": 8000, "Urgency": "MEDIUM"},
-            "Spark Plugs": {"Price_LKR": 3500, "Interval_km": 20000, "Urgency": "MEDIUM"},
-            "Brake Pads": {"Price_LKR": 6500, "Interval_km": 30000, "Urgency": "HIGH"}
-        }
-        
-        # Fuel-specific parts
-        if fuel_type == "EV" or fuel_type == "Electric":
-            # EV specific: no oil, no spark plugs, no carbon filter
-            ev_parts = {
-                "Brake Fluid": {"Price_LKR": 2500, "Interval_km": 20000, "Urgency": "MEDIUM"},
-                "Coolant Flush (Battery)": {"Price_LKR": 4500, "Interval_km": 40000, "Urgency": "MEDIUM"},
-                "Air Filter (Cabin)": {"Price_LKR": 2200, "Interval_km": 15000, "Urgency": "MEDIUM"},
-                "Wheel Alignment": {"Price_LKR": 4500, "Interval_km": 10000, "Urgency": "HIGH"},
-                "Tire Rotation": {"Price_LKR": 2000, "Interval_km": 8000, "Urgency": "MEDIUM"},
-                "Brake Pads (Regenerative)": {"Price_LKR": 7500, "Interval_km": 40000, "Urgency": "HIGH"},
-                "Battery Health Check": {"Price_LKR": 5000, "Interval_km": 25000, "Urgency": "HIGH"},
-                "Transmission Fluid (EV)": {"Price_LKR": 3500, "Interval_km": 50000, "Urgency": "MEDIUM"}
-            }
-            return ev_parts
-        
-        elif fuel_type == "Diesel":
-            base_parts.update({
-                "Diesel Filter": {"Price_LKR": 2800, "Interval_km": 10000, "Urgency": "HIGH"},
-                "Carbon Buildup Cleaning": {"Price_LKR": 5500, "Interval_km": 50000, "Urgency": "MEDIUM"}
-            })
-            return base_parts
-        
-        elif fuel_type == "Hybrid":
-            base_parts.update({
-                "Hybrid Battery Check": {"Price_LKR": 6000, "Interval_km": 30000, "Urgency": "MEDIUM"},
-                "Transmission Fluid (CVT)": {"Price_LKR": 4200, "Interval_km": 40000, "Urgency": "MEDIUM"},
-                "Carbon Filter": {"Price_LKR": 3800, "Interval_km": 20000, "Urgency": "MEDIUM"}
-            })
-            return base_parts
-        
-        else:  # Petrol (default)
-            base_parts.update({
-                "Carbon Filter": {"Price_LKR": 3200, "Interval_km": 20000, "Urgency": "MEDIUM"}
-            })
-            return base_parts
+        """Get car parts pricing based on fuel type (read-only view of the parts catalog)"""
+        return parts_catalog.as_dict(parts_group_for("Petrol/Diesel Car", fuel_type))
     
     def get_bike_parts_info(self):
         """Get bike parts pricing and information - No wheel alignment for bikes"""
-        parts = {
-            "Engine Oil (1L)": {"Price_LKR": 2800, "Interval_km": 3000, "Urgency": "CRITICAL"},
-            "Air Filter": {"Price_LKR": 1200, "Interval_km": 10000, "Urgency": "MEDIUM"},
-            "Spark Plug": {"Price_LKR": 850, "Interval_km": 5000, "Urgency": "HIGH"},
-            "Chain Sprocket Kit": {"Price_LKR": 8500, "Interval_km": 15000, "Urgency": "HIGH"},
-            "Brake Shoes (Rear)": {"Price_LKR": 1500, "Interval_km": 10000, "Urgency": "HIGH"},
-            "Tire Pressure Check": {"Price_LKR": 300, "Interval_km": 2000, "Urgency": "CRITICAL"},
-            "Clutch Cable": {"Price_LKR": 900, "Interval_km": 12000, "Urgency": "MEDIUM"},
-            "Brake Fluid": {"Price_LKR": 1500, "Interval_km": 15000, "Urgency": "MEDIUM"}
-        }
-        return parts
+        return parts_catalog.as_dict("bike")
     
     def get_tuk_parts_info(self):
         """Get three-wheeler parts pricing and information"""
-        parts = {
-            "Engine Oil (RE)": {"Price_LKR": 3200, "Interval_km": 5000, "Urgency": "CRITICAL"},
-            "CV Joint (Axle)": {"Price_LKR": 12500, "Interval_km": 25000, "Urgency": "HIGH"},
-            "Canvas Hood": {"Price_LKR": 18000, "Interval_km": 50000, "Urgency": "LOW"},
-            "Clutch Cable": {"Price_LKR": 1200, "Interval_km": 10000, "Urgency": "MEDIUM"},
-            "Grease Nipple Service": {"Price_LKR": 500, "Interval_km": 1000, "Urgency": "CRITICAL"}
-        }
-        return parts
+        return parts_catalog.as_dict("tuk")
+    
+    def get_parts_info(self, vehicle_type, fuel_type=None):
+        """Parts for a vehicle type/fuel combination (same rules as the recommendations)"""
+        return parts_catalog.as_dict(parts_group_for(vehicle_type, fuel_type))
     
     def get_maintenance_recommendations(self, vehicle_type, current_odo, service_odo, fuel_type=None):
         """
@@ -231,54 +1613,147 @@ class DatasetHandler:
         km_since_service = current_odo - service_odo
         recommendations = []
         
-        if vehicle_type in ["Motorbike", "Bike", "Motorcycle"]:
-            parts_info = self.get_bike_parts_info()
-            for part_name, info in parts_info.items():
-                if km_since_service >= info["Interval_km"]:
-                    recommendations.append({
-                        "name": part_name,
-                        "urgency": info["Urgency"],
-                        "estimated_cost_lkr": info["Price_LKR"],
-                        "why": f"Service interval of {info['Interval_km']} km exceeded",
-                        "risk_reduction_if_replaced": 5
-                    })
-        
-        elif vehicle_type in ["Three-Wheeler", "Tuk", "Auto"]:
-            parts_info = self.get_tuk_parts_info()
-            for part_name, info in parts_info.items():
-                if km_since_service >= info["Interval_km"]:
-                    recommendations.append({
-                        "name": part_name,
-                        "urgency": info["Urgency"],
-                        "estimated_cost_lkr": info["Price_LKR"],
-                        "why": f"Service interval of {info['Interval_km']} km exceeded",
-                        "risk_reduction_if_replaced": 5
-                    })
-        
-        else:  # Car or generic vehicle
-            # Determine fuel type if not provided
-            if not fuel_type:
-                if vehicle_type == "EV":
-                    fuel_type = "Electric"
-                elif vehicle_type == "Hybrid":
-                    fuel_type = "Hybrid"
-                elif vehicle_type == "Petrol/Diesel Car":
-                    fuel_type = "Petrol"
-                else:
-                    fuel_type = "Petrol"
-            
-            parts_info = self.get_car_parts_info(fuel_type)
-            for part_name, info in parts_info.items():
-                if km_since_service >= info["Interval_km"]:
-                    recommendations.append({
-                        "name": part_name,
-                        "urgency": info["Urgency"],
-                        "estimated_cost_lkr": info["Price_LKR"],
-                        "why": f"Service interval of {info['Interval_km']} km exceeded",
-                        "risk_reduction_if_replaced": 5
-                    })
+        parts_info = self.get_parts_info(vehicle_type, fuel_type)
+        for part_name, info in parts_info.items():
+            if km_since_service >= info["Interval_km"]:
+                recommendations.append({
+                    "name": part_name,
+                    "urgency": info["Urgency"],
+                    "estimated_cost_lkr": info["Price_LKR"],
+                    "why": f"Service interval of {info['Interval_km']} km exceeded",
+                    "risk_reduction_if_replaced": 5
+                })
         
         return recommendations
+    
+    def _build_interval_matrix(self):
+        """
+        Precompute one padded row per parts group for fleet sweeps: intervals (inf padding),
+        prices, and name/urgency/why as integer codes into small label tables
+        """
+        version = parts_catalog.check_for_updates()
+        groups = list(PARTS_GROUPS)
+        parts = [parts_catalog.parts(g) for g in groups]
+        width = max(len(p) for p in parts)
+        
+        intervals = np.full((len(groups), width), np.inf)
+        prices = np.zeros((len(groups), width), dtype=np.int64)
+        labels = {"names": {}, "urgency": {}, "why": {}}
+        codes = {key: np.zeros((len(groups), width), dtype=np.int16) for key in labels}
+        for g, group_parts in enumerate(parts):
+            for p, spec in enumerate(group_parts):
+                intervals[g, p] = spec.interval_km
+                prices[g, p] = spec.price_lkr
+                cells = {
+                    "names": spec.name,
+                    "urgency": spec.urgency,
+                    "why": f"Service interval of {spec.interval_km} km exceeded"
+                }
+                for key, label in cells.items():
+                    codes[key][g, p] = labels[key].setdefault(label, len(labels[key]))
+        
+        self.interval_matrix = {
+            "catalog_version": version,
+            "groups": {g: i for i, g in enumerate(groups)},
+            "intervals": intervals,
+            "prices": prices,
+            "codes": codes,
+            "labels": {key: list(table) for key, table in labels.items()}
+        }
+        return self.interval_matrix
+    
+    def get_fleet_maintenance_recommendations(self, fleet, as_lists=False):
+        """
+        Due parts for a whole fleet in one broadcast pass
+        fleet: DataFrame (or dict of arrays) with vehicle_type, current_odo, service_odo
+               and optional fuel_type columns
+        Returns a long DataFrame (one row per due part, `vehicle` = fleet row position),
+        or with as_lists=True one list per vehicle identical to get_maintenance_recommendations
+        """
+        fleet = pd.DataFrame(fleet)
+        n = len(fleet)
+        matrix = self.interval_matrix
+        if matrix is None or matrix["catalog_version"] != parts_catalog.check_for_updates():
+            matrix = self._build_interval_matrix()
+        
+        # Resolve each distinct (vehicle_type, fuel_type) pair once, then map back to rows
+        # Missing values become "" which the resolver treats like None
+        fuel = fleet["fuel_type"] if "fuel_type" in fleet else pd.Series([""] * n, index=fleet.index)
+        type_codes, type_values = pd.factorize(fleet["vehicle_type"].fillna("").astype(str))
+        fuel_codes, fuel_values = pd.factorize(fuel.fillna("").astype(str))
+        group_table = np.array(
+            [[matrix["groups"][parts_group_for(v, f)] for f in fuel_values] for v in type_values],
+            dtype=np.int64
+        ).reshape(len(type_values), len(fuel_values))
+        group_idx = group_table[type_codes, fuel_codes]
+        
+        km_since_service = (
+            fleet["current_odo"].to_numpy(dtype=np.float64) - fleet["service_odo"].to_numpy(dtype=np.float64)
+        )
+        due = km_since_service[:, None] >= matrix["intervals"][group_idx]
+        vehicle, part = np.nonzero(due)
+        group = group_idx[vehicle]
+        
+        def labelled(key):
+            return pd.Categorical.from_codes(matrix["codes"][key][group, part], matrix["labels"][key])
+        
+        result = pd.DataFrame({
+            "vehicle": vehicle,
+            "name": labelled("names"),
+            "urgency": labelled("urgency"),
+            "estimated_cost_lkr": matrix["prices"][group, part],
+            "why": labelled("why"),
+            "risk_reduction_if_replaced": np.full(len(vehicle), 5, dtype=np.int64)
+        })
+        if not as_lists:
+            return result
+        
+        columns = ["name", "urgency", "estimated_cost_lkr", "why", "risk_reduction_if_replaced"]
+        lists = [[] for _ in range(n)]
+        for row in zip(vehicle.tolist(), *(result[c].tolist() for c in columns)):
+            lists[row[0]].append(dict(zip(columns, row[1:])))
+        return lists
 
 # Initialize global handler
 dataset_handler = DatasetHandler()
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description="Build dataset artifacts or stream telemetry into the aggregates")
+    sub = parser.add_subparsers(dest="command")
+    ingest = sub.add_parser("ingest", help="Stream a telemetry CSV ('-' for stdin) through the ingestion pipeline")
+    ingest.add_argument("source")
+    ingest.add_argument("--follow", action="store_true", help="Keep reading lines appended to the file (tail -f)")
+    ingest.add_argument("--chunk-rows", type=int, default=TELEMETRY_CHUNK_ROWS)
+    args = parser.parse_args()
+    
+    if args.command == "ingest":
+        if args.source == "-":
+            chunks = tail_telemetry_chunks(sys.stdin, chunk_rows=args.chunk_rows, follow=False)
+        elif args.follow:
+            chunks = tail_telemetry_chunks(open(args.source), chunk_rows=args.chunk_rows)
+        else:
+            chunks = read_telemetry_chunks(args.source, chunk_rows=args.chunk_rows)
+        
+        def report_flagged(hits):
+            for row in hits.itertuples(index=False):
+                print(f"⚠️ {row.vehicle_id} {row.timestamp}: imminent failure predicted")
+        
+        def report_progress(stats):
+            print(f"  {stats['rows']:,} rows in {stats['chunks']} chunks ({stats['rejected_rows']:,} rejected)", file=sys.stderr)
+        
+        try:
+            stats = dataset_handler.ingest_telemetry_chunks(chunks, report_flagged, report_progress)
+            print(f"✅ Ingested {stats['rows']:,} rows at {stats['rows_per_s']:,} rows/s "
+                  f"(peak RSS {stats['peak_rss_mb']:.0f} MB, {stats['flagged']:,} flagged)", file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+    else:
+        # Build step: python datasets.py  ->  maintain_schdule.snapshot/ + maintain_schdule.failure_model.npz
+        csv_path = dataset_handler.base_path / "maintain_schdule.csv"
+        snapshot = build_telemetry_snapshot(csv_path)
+        print(f"✅ Telemetry snapshot written to {snapshot}")
+        load_failure_predictor(csv_path, retrain=True)
+        print(f"✅ Failure model written to {_model_path_for(csv_path)}")
@@ -0,0 +1,13 @@
+"""
+Latency summaries shared by the caches, write-behind buffer and batch/benchmark CLIs
+"""
+
+import math
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile (q in 0..1) of the samples; None when there are none"""
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
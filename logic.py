@@ -4,6 +4,7 @@ import base64
 import json
 from datetime import datetime
 import requests
+import groq
 from io import BytesIO
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -11,17 +12,50 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib import colors
 from datasets import dataset_handler
+from latency import percentile
 import os
+import time
+import hashlib
+import random
+import sqlite3
+import threading
+import httpx
+import numpy as np
+import pandas as pd
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_weather_data(city):
-    """Get current weather for the city"""
+# Free weather API (override to point at a local stub in tests)
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://wttr.in")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "5"))
+
+# One keep-alive session for all weather calls
+_weather_session = requests.Session()
+_weather_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_weather_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Report stages are mostly waiting on HTTP, so a shared thread pool is enough
+REPORT_PIPELINE_WORKERS = int(os.getenv("REPORT_PIPELINE_WORKERS", "8"))
+_report_executor = ThreadPoolExecutor(max_workers=REPORT_PIPELINE_WORKERS, thread_name_prefix="report")
+
+def get_groq_api_key():
+    """Groq API key from Streamlit secrets, falling back to the environment/.env"""
+    try:
+        if "GROQ_API_KEY" in st.secrets:
+            return st.secrets["GROQ_API_KEY"]
+    except:
+        # Secrets not configured - that's okay
+        pass
+    return os.getenv("GROQ_API_KEY")
+
+def fetch_weather_data(city):
+    """Get current weather for the city straight from the upstream API (no caching)"""
     try:
-        # Free weather API
-        url = f"https://wttr.in/{city}?format=j1"
-        response = requests.get(url, timeout=5)
+        url = f"{WEATHER_API_URL}/{city}?format=j1"
+        response = _weather_session.get(url, timeout=WEATHER_TIMEOUT)
         if response.status_code == 200:
             data = response.json()
             current = data['current_condition'][0]
@@ -35,6 +69,126 @@ def get_weather_data(city):
         pass
     return None
 
+class WeatherCache:
+    """
+    Per-city weather cache shared by all reports in the process
+    - fresh for `ttl` seconds, then served stale for up to `stale_ttl` while one
+      background refresh runs (stale-while-revalidate)
+    - concurrent misses for the same city share a single upstream request
+    - failures are cached for `negative_ttl` seconds so a down upstream is not hammered
+    - at most `max_concurrency` upstream requests (different cities) run at once
+    """
+    
+    def __init__(self, ttl=600, stale_ttl=3600, negative_ttl=60, fetch=None, max_concurrency=8):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.fetch = fetch or fetch_weather_data
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._upstream_slots = threading.BoundedSemaphore(max_concurrency)
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0,
+                      "coalesced": 0, "upstream_requests": 0, "upstream_errors": 0}
+        self._latencies_ms = deque(maxlen=200)
+    
+    def _refresh(self, key, city):
+        """Fetch from upstream and publish the result to everyone waiting on `key`"""
+        start = time.perf_counter()
+        try:
+            with self._upstream_slots:
+                start = time.perf_counter()
+                value = self.fetch(city)
+        except Exception:
+            value = None
+        latency_ms = (time.perf_counter() - start) * 1000
+        
+        now = time.monotonic()
+        with self._lock:
+            self.stats["upstream_requests"] += 1
+            self._latencies_ms.append(latency_ms)
+            previous = self._entries.get(key)
+            if value is not None:
+                self._entries[key] = {"value": value, "expires": now + self.ttl, "stale_until": now + self.stale_ttl}
+            else:
+                self.stats["upstream_errors"] += 1
+                if previous and previous["value"] is not None and now < previous["stale_until"]:
+                    # Keep serving the last good value, retry after the negative TTL
+                    previous["expires"] = now + self.negative_ttl
+                else:
+                    self._entries[key] = {"value": None, "expires": now + self.negative_ttl,
+                                          "stale_until": now + self.negative_ttl}
+            done = self._inflight.pop(key)
+        done.set()
+        return value
+    
+    def get(self, city):
+        key = city.strip().lower()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry["expires"]:
+                self.stats["negative_hits" if entry["value"] is None else "hits"] += 1
+                return entry["value"]
+            
+            if entry and entry["value"] is not None and now < entry["stale_until"]:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self._inflight[key] = threading.Event()
+                    _report_executor.submit(self._refresh, key, city)
+                return entry["value"]
+            
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self.stats["misses"] += 1
+                self._inflight[key] = threading.Event()
+            else:
+                self.stats["coalesced"] += 1
+        
+        if waiter is None:
+            return self._refresh(key, city)
+        
+        waiter.wait(WEATHER_TIMEOUT * 2)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["value"] if entry else None
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_metrics(self):
+        """Cache counters, hit ratio and upstream latency (ms) over the last 200 fetches"""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies_ms)
+            last = self._latencies_ms[-1] if self._latencies_ms else None
+        served = stats["hits"] + stats["stale_hits"] + stats["negative_hits"] + stats["misses"] + stats["coalesced"]
+        cached = stats["hits"] + stats["stale_hits"] + stats["negative_hits"] + stats["coalesced"]
+        stats["hit_ratio"] = cached / served if served else 0.0
+        stats["upstream_latency_ms"] = {
+            "last": round(last, 1) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p50": round(percentile(latencies, 0.5), 1) if latencies else None,
+            "p95": round(percentile(latencies, 0.95), 1) if latencies else None
+        }
+        return stats
+
+weather_cache = WeatherCache(
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    stale_ttl=float(os.getenv("WEATHER_STALE_TTL", "3600")),
+    negative_ttl=float(os.getenv("WEATHER_NEGATIVE_TTL", "60")),
+    max_concurrency=int(os.getenv("WEATHER_MAX_CONCURRENCY", "8"))
+)
+
+def get_weather_data(city):
+    """Get current weather for the city (cached per city, see WeatherCache)"""
+    return weather_cache.get(city)
+
+def get_weather_metrics():
+    """Weather cache hit ratio and upstream latency for monitoring"""
+    return weather_cache.get_metrics()
+
 def get_spare_parts_shops(city, district):
     """Get nearby spare parts shops for the location with accurate Sri Lankan data"""
     # Comprehensive shop data for major Sri Lankan cities
@@ -141,101 +295,217 @@ def get_spare_parts_shops(city, district):
     
     return shops
 
-def calculate_accident_risk(vehicle_condition, weather, road_conditions, parts_replaced=None):
-    """Calculate accident risk based on multiple factors"""
-    risk_score = 0
-    risk_factors = []
-    
-    # Vehicle condition (0-40 points) - Main safety factors
-    if vehicle_condition.get('service_overdue'):
-        risk_score += 18
-        risk_factors.append("⚠️ Service overdue - Engine efficiency compromised")
-    if vehicle_condition.get('tyre_wear_high'):
-        risk_score += 15
-        risk_factors.append("⚠️ High tyre wear - Reduced grip and braking")
-    if vehicle_condition.get('brake_wear_high'):
-        risk_score += 18
-        risk_factors.append("⚠️ High brake wear - Increased stopping distance")
-    
-    # Parts replaced recently (reduces risk for those parts)
-    if parts_replaced:
-        recent_replacements = len(parts_replaced)
-        # Each part replacement reduces risk by 5-8% depending on type
-        for part in parts_replaced:
-            if 'Tyre' in part or 'Tyres' in part or 'Tire' in part or 'Tires' in part:
-                risk_score = max(0, risk_score - 8)  # Recently replaced tires = safer handling
-                risk_factors.append("✅ Tyres recently replaced - Better grip and safety")
-            elif 'Brake' in part:
-                risk_score = max(0, risk_score - 8)  # Brakes are critical
-                risk_factors.append("✅ Brakes recently serviced - Optimal stopping power")
-            elif 'Suspension' in part or 'Shock' in part:
-                risk_score = max(0, risk_score - 7)  # Suspension affects handling
-                risk_factors.append("✅ Suspension recently serviced - Better vehicle control")
-            elif 'Battery' in part or 'Alternator' in part:
-                risk_score = max(0, risk_score - 3)
-                risk_factors.append("✅ Electrical components recently replaced")
-            elif 'Engine Oil' in part or 'Oil' in part:
-                risk_score = max(0, risk_score - 5)
-                risk_factors.append("✅ Engine oil recently changed - Engine protection")
-            else:
-                risk_score = max(0, risk_score - 4)
-                risk_factors.append(f"✅ {part} recently replaced")
-    
-    # Weather conditions (0-30 points) - Environmental hazards
-    if weather:
-        if 'rain' in weather['condition'].lower() or 'drizzle' in weather['condition'].lower():
-            risk_score += 12
-            risk_factors.append("🌧️ Rainy conditions - Reduced grip and visibility")
-        if 'thunderstorm' in weather['condition'].lower() or 'heavy rain' in weather['condition'].lower():
-            risk_score += 18
-            risk_factors.append("⛈️ Heavy thunderstorm - Extreme visibility reduction")
-        if int(weather.get('wind_speed', 0)) > 50:
-            risk_score += 12
-            risk_factors.append("💨 Strong winds - Reduced vehicle stability")
-        elif int(weather.get('wind_speed', 0)) > 30:
-            risk_score += 6
-            risk_factors.append("💨 Moderate winds - Minor stability concern")
-        if int(weather.get('temp', 25)) > 35:
-            risk_score += 5
-            risk_factors.append("🌡️ High temperature - Brake fade risk, tire pressure increase")
-    
-    # Road conditions (0-30 points) - Environmental hazards
-    if road_conditions:
-        if 'Mountain' in road_conditions:
-            risk_score += 15
-            risk_factors.append("⛰️ Mountain roads - High risk of brake failure, steering challenge")
-        if 'Rough' in road_conditions:
-            risk_score += 12
-            risk_factors.append("🛣️ Rough/Pothole roads - Suspension strain, puncture risk")
-        if 'City' in road_conditions:
-            risk_score += 5
-            risk_factors.append("🏙️ City traffic - Frequent braking, congestion stress")
-        if 'Highway' in road_conditions or 'Expressway' in road_conditions:
-            risk_score += 8
-            risk_factors.append("🛣️ High-speed roads - Higher impact speeds, longer stopping distance")
-        if 'Coastal' in road_conditions:
-            risk_score += 4
-            risk_factors.append("🌊 Coastal roads - Salt spray corrosion risk")
+# --- ACCIDENT RISK (declarative rule table, scalar and vectorised scoring share it) ---
+CONDITION_FLAGS = ["service_overdue", "tyre_wear_high", "brake_wear_high"]
+ROAD_TYPES = ["Mountain", "Rough", "City", "Highway", "Expressway", "Coastal"]
+# First matching keyword group wins, as in the original if/elif chain
+PART_CATEGORIES = {
+    "tyres": ("Tyre", "Tyres", "Tire", "Tires"),
+    "brakes": ("Brake",),
+    "suspension": ("Suspension", "Shock"),
+    "electrical": ("Battery", "Alternator"),
+    "oil": ("Engine Oil", "Oil"),
+    "other": ()
+}
+WEATHER_KEYWORDS = {
+    "rain": ("rain", "drizzle"),
+    "storm": ("thunderstorm", "heavy rain")
+}
+
+# (rule id, group, feature, lower bound (exclusive), upper bound (inclusive), points, factor)
+# Threshold rules fire when lower < feature <= upper; "parts" rules score points per replaced part.
+RISK_RULES = [
+    ("service_overdue", "condition", "service_overdue", 0, np.inf, 18, "⚠️ Service overdue - Engine efficiency compromised"),
+    ("tyre_wear_high", "condition", "tyre_wear_high", 0, np.inf, 15, "⚠️ High tyre wear - Reduced grip and braking"),
+    ("brake_wear_high", "condition", "brake_wear_high", 0, np.inf, 18, "⚠️ High brake wear - Increased stopping distance"),
+    ("tyres_replaced", "parts", "parts_tyres", 0, np.inf, -8, "✅ Tyres recently replaced - Better grip and safety"),
+    ("brakes_replaced", "parts", "parts_brakes", 0, np.inf, -8, "✅ Brakes recently serviced - Optimal stopping power"),
+    ("suspension_replaced", "parts", "parts_suspension", 0, np.inf, -7, "✅ Suspension recently serviced - Better vehicle control"),
+    ("electrical_replaced", "parts", "parts_electrical", 0, np.inf, -3, "✅ Electrical components recently replaced"),
+    ("oil_replaced", "parts", "parts_oil", 0, np.inf, -5, "✅ Engine oil recently changed - Engine protection"),
+    ("other_replaced", "parts", "parts_other", 0, np.inf, -4, "✅ {part} recently replaced"),
+    ("rain", "weather", "rain", 0, np.inf, 12, "🌧️ Rainy conditions - Reduced grip and visibility"),
+    ("storm", "weather", "storm", 0, np.inf, 18, "⛈️ Heavy thunderstorm - Extreme visibility reduction"),
+    ("strong_wind", "weather", "wind_speed", 50, np.inf, 12, "💨 Strong winds - Reduced vehicle stability"),
+    ("moderate_wind", "weather", "wind_speed", 30, 50, 6, "💨 Moderate winds - Minor stability concern"),
+    ("high_temp", "weather", "temp", 35, np.inf, 5, "🌡️ High temperature - Brake fade risk, tire pressure increase"),
+    ("mountain_roads", "road", "road_mountain", 0, np.inf, 15, "⛰️ Mountain roads - High risk of brake failure, steering challenge"),
+    ("rough_roads", "road", "road_rough", 0, np.inf, 12, "🛣️ Rough/Pothole roads - Suspension strain, puncture risk"),
+    ("city_roads", "road", "road_city", 0, np.inf, 5, "🏙️ City traffic - Frequent braking, congestion stress"),
+    ("fast_roads", "road", "road_fast", 0, np.inf, 8, "🛣️ High-speed roads - Higher impact speeds, longer stopping distance"),
+    ("coastal_roads", "road", "road_coastal", 0, np.inf, 4, "🌊 Coastal roads - Salt spray corrosion risk"),
+]
+RISK_ANOMALY_CAP = 20
+# (minimum score, level, colour), checked top-down
+RISK_LEVELS = [
+    (75, "🔴 CRITICAL", "#ff0000"),
+    (60, "🔴 HIGH", "#ff4444"),
+    (40, "🟠 MODERATE-HIGH", "#ff9900"),
+    (25, "🟡 MODERATE", "#ffcc00"),
+    (0, "🟢 LOW", "#00cc00")
+]
+
+def _compile_risk_rules(rules):
+    """Rule table -> per-group feature names, bounds and points arrays for the vectorised scorer"""
+    compiled = {}
+    for group in ["condition", "parts", "weather", "road"]:
+        rows = [r for r in rules if r[1] == group]
+        compiled[group] = {
+            "ids": [r[0] for r in rows],
+            "features": [r[2] for r in rows],
+            "lower": np.array([r[3] for r in rows], dtype=np.float64),
+            "upper": np.array([r[4] for r in rows], dtype=np.float64),
+            "points": np.array([r[5] for r in rows], dtype=np.int64)
+        }
+    return compiled
+
+_COMPILED_RISK_RULES = _compile_risk_rules(RISK_RULES)
+_RISK_LEVEL_FLOORS = np.array([floor for floor, _, _ in RISK_LEVELS])
+
+def classify_replaced_part(part):
+    for category, keywords in PART_CATEGORIES.items():
+        if any(keyword in part for keyword in keywords):
+            return category
+    return "other"
+
+def encode_weather(weather):
+    """Weather dict -> rain/storm flags and numeric wind/temp, as the risk rules read them"""
+    if not weather:
+        return {"rain": 0, "storm": 0, "wind_speed": 0, "temp": 25}
+    condition = weather["condition"].lower()
+    return {
+        "rain": int(any(k in condition for k in WEATHER_KEYWORDS["rain"])),
+        "storm": int(any(k in condition for k in WEATHER_KEYWORDS["storm"])),
+        "wind_speed": int(weather.get("wind_speed", 0)),
+        "temp": int(weather.get("temp", 25))
+    }
+
+def encode_roads(road_conditions):
+    """Road names -> ROAD_TYPES bitmask"""
+    return sum(1 << i for i, road in enumerate(ROAD_TYPES) if road in (road_conditions or []))
+
+def encode_conditions(vehicle_condition):
+    """vehicle_condition dict -> CONDITION_FLAGS bitmask"""
+    return sum(1 << i for i, flag in enumerate(CONDITION_FLAGS) if vehicle_condition.get(flag))
+
+def _risk_features(condition_flags, road_mask, part_counts, weather):
+    """Bitmasks/counts/weather arrays -> {feature name: array} for the rule table"""
+    condition_flags = np.asarray(condition_flags, dtype=np.int64)
+    road_mask = np.asarray(road_mask, dtype=np.int64)
+    features = {flag: (condition_flags >> i) & 1 for i, flag in enumerate(CONDITION_FLAGS)}
+    roads = {road: (road_mask >> i) & 1 for i, road in enumerate(ROAD_TYPES)}
+    features.update({
+        "road_mountain": roads["Mountain"],
+        "road_rough": roads["Rough"],
+        "road_city": roads["City"],
+        "road_fast": roads["Highway"] | roads["Expressway"],
+        "road_coastal": roads["Coastal"]
+    })
+    n = len(condition_flags)
+    if part_counts is None:
+        part_counts = np.zeros((n, len(PART_CATEGORIES)), dtype=np.int64)
+    part_counts = np.asarray(part_counts)
+    if part_counts.ndim == 1:
+        # Bitmask form: bit i = PART_CATEGORIES[i] replaced once
+        part_counts = (part_counts[:, None] >> np.arange(len(PART_CATEGORIES))) & 1
+    for i, category in enumerate(PART_CATEGORIES):
+        features["parts_" + category] = part_counts[:, i]
+    features.update(weather)
+    return features
+
+def score_risk_batch(condition_flags, road_mask, part_counts=None, rain=None, storm=None,
+                     wind_speed=None, temp=None, anomaly_points=None):
+    """
+    Score many risk scenarios in one pass over the RISK_RULES table
+    - condition_flags: int bitmask per scenario (bit i = CONDITION_FLAGS[i], see encode_conditions)
+    - road_mask: int bitmask (bit i = ROAD_TYPES[i], see encode_roads)
+    - part_counts: (n, PART_CATEGORIES) replaced-part counts, or an int bitmask of categories
+    - rain/storm flags, wind_speed/temp numbers (defaults = no weather data)
+    - anomaly_points: summed sensor-anomaly points (capped at RISK_ANOMALY_CAP)
+    Returns {"score": int64 array, "level": index into RISK_LEVELS, "fired": {rule id: bool array}}
+    Every group subtotal is an integer matmul (the parts group multiplies its counts as int64),
+    so scores are exact int64 rather than floats
+    """
+    n = len(np.asarray(condition_flags))
+    weather = {
+        "rain": np.zeros(n) if rain is None else np.asarray(rain),
+        "storm": np.zeros(n) if storm is None else np.asarray(storm),
+        "wind_speed": np.zeros(n) if wind_speed is None else np.asarray(wind_speed),
+        "temp": np.full(n, 25) if temp is None else np.asarray(temp)
+    }
+    features = _risk_features(condition_flags, road_mask, part_counts, weather)
+    
+    fired = {}
+    subtotal = {}
+    for group, rules in _COMPILED_RISK_RULES.items():
+        values = np.column_stack([features[f] for f in rules["features"]]).astype(np.float64)
+        if group == "parts":
+            subtotal[group] = values.astype(np.int64) @ rules["points"]
+            hits = values > 0
+        else:
+            hits = (values > rules["lower"]) & (values <= rules["upper"])
+            subtotal[group] = hits @ rules["points"]
+        fired.update(zip(rules["ids"], hits.T))
+    
+    # Replacements only offset vehicle-condition risk (never below zero), as in the scalar rules
+    score = np.maximum(0, subtotal["condition"] + subtotal["parts"]) + subtotal["weather"] + subtotal["road"]
+    if anomaly_points is not None:
+        score = score + np.minimum(RISK_ANOMALY_CAP, np.asarray(anomaly_points))
+    score = np.clip(score, 0, 100)
+    level = np.searchsorted(-_RISK_LEVEL_FLOORS, -score, side="left")
+    return {"score": score, "level": level, "fired": fired}
+
+def calculate_accident_risk(vehicle_condition, weather, road_conditions, parts_replaced=None, sensor_anomalies=None):
+    """
+    Calculate accident risk based on multiple factors (rules in RISK_RULES)
+    sensor_anomalies: findings from dataset_handler.get_sensor_anomalies() for vehicles with live telemetry
+    """
+    features = {flag: int(bool(vehicle_condition.get(flag))) for flag in CONDITION_FLAGS}
+    features.update(encode_weather(weather))
+    roads = road_conditions or []
+    features.update({
+        "road_mountain": int("Mountain" in roads),
+        "road_rough": int("Rough" in roads),
+        "road_city": int("City" in roads),
+        "road_fast": int("Highway" in roads or "Expressway" in roads),
+        "road_coastal": int("Coastal" in roads)
+    })
+    
+    subtotal = {"condition": 0, "parts": 0, "weather": 0, "road": 0}
+    factors = {"condition": [], "parts": [], "weather": [], "road": []}
+    for rule_id, group, feature, lower, upper, points, factor in RISK_RULES:
+        if group != "parts" and lower < features[feature] <= upper:
+            subtotal[group] += points
+            factors[group].append(factor)
+    
+    # Replaced parts are scored one by one, in the order given
+    part_rules = {rule[2]: rule for rule in RISK_RULES if rule[1] == "parts"}
+    for part in parts_replaced or []:
+        _, _, _, _, _, points, factor = part_rules["parts_" + classify_replaced_part(part)]
+        subtotal["parts"] += points
+        factors["parts"].append(factor.format(part=part))
+    
+    risk_score = max(0, subtotal["condition"] + subtotal["parts"]) + subtotal["weather"] + subtotal["road"]
+    risk_factors = factors["condition"] + factors["parts"] + factors["weather"] + factors["road"]
+    
+    # Live sensor anomalies (0-20 points) - unusual readings vs the vehicle's own recent history
+    if sensor_anomalies:
+        anomaly_points = 0
+        for finding in sensor_anomalies:
+            anomaly_points += finding.get("risk_points", 5)
+            risk_factors.append(
+                f"📈 Abnormal {finding['sensor'].replace('_', ' ')}: {finding['value']} "
+                f"(usually ~{finding['expected']}, {finding['zscore']:+.1f}σ) - check {finding['system']}"
+            )
+        risk_score += min(RISK_ANOMALY_CAP, anomaly_points)
     
     # Ensure score is between 0-100
     risk_score = max(0, min(100, risk_score))
     
     # Determine risk level with accurate thresholds
-    if risk_score >= 75:
-        risk_level = "🔴 CRITICAL"
-        color = "#ff0000"
-    elif risk_score >= 60:
-        risk_level = "🔴 HIGH"
-        color = "#ff4444"
-    elif risk_score >= 40:
-        risk_level = "🟠 MODERATE-HIGH"
-        color = "#ff9900"
-    elif risk_score >= 25:
-        risk_level = "🟡 MODERATE"
-        color = "#ffcc00"
-    else:
-        risk_level = "🟢 LOW"
-        color = "#00cc00"
+    for floor, risk_level, color in RISK_LEVELS:
+        if risk_score >= floor:
+            break
     
     return {
         "score": risk_score,
@@ -244,6 +514,104 @@ def calculate_accident_risk(vehicle_condition, weather, road_conditions, parts_r
         "factors": risk_factors
     }
 
+def assess_vehicle_condition(km_since_service):
+    """Wear flags from km since the last service (works on scalars and numpy arrays)"""
+    return {
+        'service_overdue': km_since_service >= 8000,
+        'tyre_wear_high': km_since_service > 6000,
+        'brake_wear_high': km_since_service > 7000
+    }
+
+# --- WHAT-IF RISK SIMULATOR (offline grid sweep: future odometer x weather x road mix) ---
+WHAT_IF_WEATHER = {
+    "Clear": {"condition": "Clear", "wind_speed": 10, "temp": 29},
+    "Rain": {"condition": "Light rain", "wind_speed": 18, "temp": 27},
+    "Monsoon storm": {"condition": "Thunderstorm with heavy rain", "wind_speed": 45, "temp": 26},
+    "Windy": {"condition": "Clouds", "wind_speed": 55, "temp": 28},
+    "Heatwave": {"condition": "Clear", "wind_speed": 8, "temp": 37}
+}
+WHAT_IF_ROADS = {
+    "City": ["City"],
+    "Highway": ["Highway"],
+    "Mountain": ["Mountain"],
+    "Rough": ["Rough"],
+    "Mountain + Rough": ["Mountain", "Rough"],
+    "City + Highway": ["City", "Highway"],
+    "Coastal": ["Coastal"]
+}
+
+def simulate_risk(v_type, odo, service_odo, fuel_type=None, parts_replaced=None, distances=None,
+                  weather_scenarios=None, road_mixes=None, sensor_anomalies=None):
+    """
+    What-if sweep of accident risk over future odometer points x weather x road mixes
+    No network calls: weather comes from WHAT_IF_WEATHER presets (or {name: weather dict}),
+    maintenance from the dataset, and the whole grid is scored in one score_risk_batch() pass
+    - distances: extra km to drive from `odo` (default 0..10,000 km in 500 km steps)
+    - weather_scenarios / road_mixes: names from the presets, or dicts of custom entries
+    Returns {"distances", "odometer", "weather", "roads", "score"/"level" arrays shaped
+    (odometer, weather, road), "due_parts" and "due_cost_lkr" per odometer point}
+    """
+    distances = np.arange(0, 10001, 500) if distances is None else np.asarray(distances)
+    if not isinstance(weather_scenarios, dict):
+        weather_scenarios = {name: WHAT_IF_WEATHER[name] for name in weather_scenarios or WHAT_IF_WEATHER}
+    if not isinstance(road_mixes, dict):
+        road_mixes = {name: WHAT_IF_ROADS[name] for name in road_mixes or WHAT_IF_ROADS}
+    odometer = odo + distances
+    
+    # Per-axis encodings, then broadcast to the (odometer, weather, road) grid
+    condition = assess_vehicle_condition(odometer - service_odo)
+    condition_flags = sum(condition[flag].astype(np.int64) << i for i, flag in enumerate(CONDITION_FLAGS))
+    weather = [encode_weather(w) for w in weather_scenarios.values()]
+    road_mask = np.array([encode_roads(r) for r in road_mixes.values()], dtype=np.int64)
+    part_counts = np.zeros(len(PART_CATEGORIES), dtype=np.int64)
+    for part in parts_replaced or []:
+        part_counts[list(PART_CATEGORIES).index(classify_replaced_part(part))] += 1
+    anomaly_points = sum(f.get("risk_points", 5) for f in sensor_anomalies or [])
+    
+    shape = (len(odometer), len(weather), len(road_mask))
+    o, w, r = (axis.ravel() for axis in np.indices(shape))
+    result = score_risk_batch(
+        condition_flags[o], road_mask[r], np.broadcast_to(part_counts, (o.size, part_counts.size)),
+        **{key: np.array([x[key] for x in weather])[w] for key in ["rain", "storm", "wind_speed", "temp"]},
+        anomaly_points=np.full(o.size, anomaly_points)
+    )
+    
+    # Maintenance only depends on the odometer: one fleet-sweep row per point
+    due = dataset_handler.get_fleet_maintenance_recommendations({
+        "vehicle_type": [v_type] * len(odometer),
+        "fuel_type": [fuel_type or ""] * len(odometer),
+        "current_odo": odometer,
+        "service_odo": [service_odo] * len(odometer)
+    })
+    due_parts = [[] for _ in odometer]
+    for vehicle, name in zip(due["vehicle"].tolist(), due["name"].tolist()):
+        due_parts[vehicle].append(name)
+    due_cost = np.bincount(due["vehicle"], weights=due["estimated_cost_lkr"], minlength=len(odometer))
+    
+    return {
+        "distances": distances,
+        "odometer": odometer,
+        "weather": list(weather_scenarios),
+        "roads": list(road_mixes),
+        "score": result["score"].reshape(shape),
+        "level": result["level"].reshape(shape),
+        "due_parts": due_parts,
+        "due_cost_lkr": due_cost.astype(np.int64)
+    }
+
+def what_if_frame(simulation):
+    """Flatten a simulate_risk() result into a long DataFrame (one row per grid point) for plotting"""
+    shape = simulation["score"].shape
+    o, w, r = (axis.ravel() for axis in np.indices(shape))
+    return pd.DataFrame({
+        "extra_km": simulation["distances"][o],
+        "odometer": simulation["odometer"][o],
+        "weather": np.array(simulation["weather"])[w],
+        "roads": np.array(simulation["roads"])[r],
+        "score": simulation["score"].ravel(),
+        "level": np.array([level for _, level, _ in RISK_LEVELS])[simulation["level"].ravel()]
+    })
+
 def get_vehicle_condition_description(odo, service_odo, align_odo, m_year, parts_replaced=None):
     """Generate a human-readable description of vehicle condition"""
     km_since_service = odo - service_odo
@@ -294,13 +662,333 @@ def get_vehicle_condition_description(odo, service_odo, align_odo, m_year, parts
     
     return description
 
-def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced=None, additional_notes=None, parts_mileage=None, fuel_type=None):
-    """Generate structured report with sections - Using datasets for maintenance, APIs for weather/shops"""
-    api_key = st.secrets.get("GROQ_API_KEY")
-    llm = ChatGroq(model="llama-3.3-70b-versatile", groq_api_key=api_key)
+# --- LLM CLIENTS (one configured client per model/key, shared HTTP pool, retries) ---
+DEFAULT_LLM_MODEL = "llama-3.3-70b-versatile"
+
+class LLMClientManager:
+    """
+    Holds one ChatGroq client per (model, api key, base url) on a shared pooled
+    httpx transport, caps concurrent LLM calls, and retries 429/5xx/connection
+    errors with jittered exponential backoff (honouring Retry-After).
+    Pass client_factory(model, api_key) to swap in a local fake.
+    """
+    
+    def __init__(self, max_concurrency=4, max_retries=3, backoff_base=0.5, backoff_cap=8.0,
+                 timeout=60.0, client_factory=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.client_factory = client_factory
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._http_client = None
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+    
+    def _shared_http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                timeout=self.timeout
+            )
+        return self._http_client
+    
+    def get_client(self, model=DEFAULT_LLM_MODEL):
+        api_key = get_groq_api_key()
+        key = (model, api_key, os.getenv("GROQ_API_BASE"))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self.client_factory:
+                    client = self.client_factory(model, api_key)
+                else:
+                    # Retries are handled here (with jitter), not inside the SDK
+                    client = ChatGroq(model=model, groq_api_key=api_key, max_retries=0,
+                                      http_client=self._shared_http_client())
+                self._clients[key] = client
+            return client
+    
+    @staticmethod
+    def _is_retryable(error):
+        status = getattr(error, "status_code", None)
+        if status is not None:
+            return status == 429 or status >= 500
+        return isinstance(error, (groq.APIConnectionError, httpx.TransportError))
+    
+    def _backoff(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.backoff_cap, float(retry_after))
+        except (TypeError, ValueError):
+            # Full jitter so concurrent callers don't retry in lockstep
+            return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+    
+    def call(self, fn, model=DEFAULT_LLM_MODEL):
+        """Run fn(client) under the concurrency limit, retrying transient failures"""
+        client = self.get_client(model)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    self.stats["calls"] += 1
+                    return fn(client)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self._backoff(attempt, e))
+    
+    def invoke(self, prompt, model=DEFAULT_LLM_MODEL):
+        """Completion text for prompt"""
+        return self.call(lambda client: client.invoke(prompt).content, model)
+    
+    def stream(self, prompt, model=DEFAULT_LLM_MODEL):
+        """
+        Yield completion text chunks as they arrive
+        Transient failures are retried only until the first chunk has been yielded.
+        """
+        client = self.get_client(model)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                with self._slots:
+                    self.stats["calls"] += 1
+                    for chunk in client.stream(prompt):
+                        if chunk.content:
+                            started = True
+                            yield chunk.content
+                return
+            except Exception as e:
+                if started or attempt >= self.max_retries or not self._is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self._backoff(attempt, e))
+    
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+llm_manager = LLMClientManager(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))
+)
+
+# --- LLM RESPONSE CACHE (report analysis is deterministic enough to reuse across similar vehicles) ---
+# Bump when the report prompt changes so old answers are not reused
+REPORT_PROMPT_VERSION = 1
+
+class LLMResponseCache:
+    """
+    Content-addressed cache of parsed LLM answers
+    In-process LRU (max_entries, ttl seconds); with sqlite_path set, entries are also
+    stored in a SQLite file so every worker process on the host shares them.
+    """
+    
+    def __init__(self, max_entries=512, ttl=6 * 3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if sqlite_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
     
-    # Get weather data
-    weather = get_weather_data(city)
+    def _connect(self):
+        return sqlite3.connect(self.sqlite_path, timeout=5)
+    
+    def _get_shared(self, key, now):
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                return row[0], row[1]
+        except sqlite3.Error:
+            return None
+    
+    def _set_shared(self, key, payload, now):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now)
+                )
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error:
+            pass
+    
+    def get(self, key):
+        """Cached value for key (a fresh copy), or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return json.loads(entry[0])
+            if entry:
+                del self._entries[key]
+        
+        shared = self._get_shared(key, now) if self.sqlite_path else None
+        with self._lock:
+            if shared is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._remember(key, shared[0], shared[1])
+        return json.loads(shared[0])
+    
+    def _remember(self, key, payload, created_at):
+        self._entries[key] = (payload, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def set(self, key, value):
+        """Store a JSON-serialisable value (kept serialised so callers never share it)"""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, payload, now)
+            self.stats["stores"] += 1
+        if self.sqlite_path:
+            self._set_shared(key, payload, now)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_cache")
+
+llm_response_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(6 * 3600))),
+    sqlite_path=os.getenv("LLM_CACHE_SQLITE") or None
+)
+
+def report_analysis_cache_key(v_type, model, m_year, odo, service_odo, fuel_type, district,
+                              parts_to_replace, parts_replaced, road_conditions, weather, additional_notes,
+                              city="", parts_mileage=None):
+    """
+    Canonical, bucketed fingerprint of everything the report prompt depends on
+    Odometer readings (and km since each replaced part) are bucketed to 1,000 km and
+    temperature/wind to 5 units, so near-identical submissions share one LLM answer.
+    """
+    def bucket(value, size):
+        try:
+            return int(float(value) // size)
+        except (TypeError, ValueError):
+            return None
+    
+    canonical = {
+        "prompt_version": REPORT_PROMPT_VERSION,
+        "vehicle": [str(v_type), " ".join(str(model).lower().split()), int(m_year), fuel_type or ""],
+        "location": [str(city or "").strip().lower(), str(district).strip().lower()],
+        "odo_bucket": bucket(odo, 1000),
+        "since_service_bucket": bucket(odo - service_odo, 1000),
+        "due_parts": sorted(p["name"] for p in parts_to_replace),
+        "parts_replaced": sorted(parts_replaced or []),
+        # Only replaced parts' mileage reaches the prompt
+        "since_replacement_buckets": {
+            part: bucket(odo - mileage, 1000)
+            for part, mileage in (parts_mileage or {}).items() if part in (parts_replaced or [])
+        },
+        "roads": sorted(road_conditions),
+        "weather": [
+            weather["condition"].strip().lower(),
+            bucket(weather.get("temp"), 5),
+            bucket(weather.get("wind_speed"), 5)
+        ] if weather else None,
+        "notes": " ".join((additional_notes or "").lower().split())
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _timed_stage(timings, stage, fn, *args):
+    """Run one report stage and record its wall time (ms) under timings[stage]"""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+def _run_report_analysis(prompt, cache_key=None):
+    """Ask the LLM for the risk analysis JSON (cached by cache_key), with a safe fallback on any failure"""
+    if cache_key:
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    try:
+        response = llm_manager.invoke(prompt)
+        # Clean response to extract JSON
+        response = response.strip()
+        if response.startswith("```json"):
+            response = response[7:]
+        if response.startswith("```"):
+            response = response[3:]
+        if response.endswith("```"):
+            response = response[:-3]
+        response = response.strip()
+        
+        analysis = json.loads(response)
+        if cache_key:
+            # Only real answers are cached, never the fallback below
+            llm_response_cache.set(cache_key, analysis)
+        return analysis
+    except Exception as e:
+        return {
+            "critical_issues": [],
+            "accident_risk_analysis": {
+                "base_risk": 0,
+                "critical_parts_impact": [],
+                "total_estimated_risk": 0
+            },
+            "maintenance_tips": ["Consult with a professional mechanic"],
+            "road_specific_warnings": [],
+            "weather_advisories": []
+        }
+
+def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced=None, additional_notes=None, parts_mileage=None, fuel_type=None, sensor_anomalies=None):
+    """
+    Generate structured report with sections - Using datasets for maintenance, APIs for weather/shops
+    Weather, dataset recommendations and shop lookup run concurrently; the LLM call starts as soon
+    as the inputs its prompt needs (weather + recommendations) are ready. Per-stage wall times are
+    recorded in metadata["timings_ms"].
+    """
+    pipeline_start = time.perf_counter()
+    timings = {}
+    
+    # Fan out the independent stages
+    weather_future = _report_executor.submit(_timed_stage, timings, "weather", get_weather_data, city)
+    recommendations_future = _report_executor.submit(
+        _timed_stage, timings, "maintenance", dataset_handler.get_maintenance_recommendations,
+        v_type, odo, service_odo, fuel_type
+    )
+    shops_future = _report_executor.submit(_timed_stage, timings, "shops", get_spare_parts_shops, city, district)
     
     # Extract road conditions from trips
     road_conditions = []
@@ -311,18 +999,10 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
     # Calculate service intervals
     km_since_service = odo - service_odo
     km_since_alignment = odo - align_odo
-    service_due = km_since_service >= 8000
     alignment_due = km_since_alignment >= 10000
     
     # Vehicle condition assessment
-    vehicle_condition = {
-        'service_overdue': service_due,
-        'tyre_wear_high': km_since_service > 6000,
-        'brake_wear_high': km_since_service > 7000
-    }
-    
-    # Calculate accident risk
-    accident_risk = calculate_accident_risk(vehicle_condition, weather, road_conditions, parts_replaced)
+    vehicle_condition = assess_vehicle_condition(km_since_service)
     
     # Format trip data
     trips_summary = ""
@@ -344,9 +1024,7 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
             parts_info += "\n"
     
     # GET MAINTENANCE RECOMMENDATIONS FROM DATASET
-    maintenance_recommendations = dataset_handler.get_maintenance_recommendations(
-        v_type, odo, service_odo, fuel_type
-    )
+    maintenance_recommendations = recommendations_future.result()
     
     # Convert dataset recommendations to JSON format
     parts_to_replace = []
@@ -359,9 +1037,6 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
             "risk_reduction_if_replaced": rec.get("risk_reduction_if_replaced", 5)
         })
     
-    # Get shops using API
-    spare_parts_shops = get_spare_parts_shops(city, district)
-    
     # Use AI for risk analysis, maintenance tips, and advisories only
     
     # Build parts mileage info for analysis
@@ -373,6 +1048,12 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
                 km_since = odo - mileage
                 parts_mileage_analysis += f"  - {part}: Replaced at {mileage}km, {km_since}km ago (RISK REDUCTION: ~5%)\n"
     
+    # The prompt needs the weather - wait for it (shops keep running)
+    weather = weather_future.result()
+    
+    # Calculate accident risk
+    accident_risk = calculate_accident_risk(vehicle_condition, weather, road_conditions, parts_replaced, sensor_anomalies)
+    
     prompt = f"""
     You are an EXPERT Sri Lankan Professional Automobile Mechanic (2026) with deep knowledge of:
     - Vehicle maintenance standards in Sri Lanka (tropical climate)
@@ -442,31 +1123,13 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
     }}
     """
     
-    try:
-        response = llm.invoke(prompt).content
-        # Clean response to extract JSON
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        
-        ai_analysis = json.loads(response)
-    except Exception as e:
-        ai_analysis = {
-            "critical_issues": [],
-            "accident_risk_analysis": {
-                "base_risk": 0,
-                "critical_parts_impact": [],
-                "total_estimated_risk": 0
-            },
-            "maintenance_tips": ["Consult with a professional mechanic"],
-            "road_specific_warnings": [],
-            "weather_advisories": []
-        }
+    cache_key = report_analysis_cache_key(
+        v_type, model, m_year, odo, service_odo, fuel_type, district,
+        parts_to_replace, parts_replaced, road_conditions, weather, additional_notes,
+        city=city, parts_mileage=parts_mileage
+    )
+    ai_analysis = _timed_stage(timings, "llm", _run_report_analysis, prompt, cache_key)
+    spare_parts_shops = shops_future.result()
     
     # Merge dataset maintenance with AI risk analysis
     structured_data = {
@@ -487,7 +1150,8 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
             "generated_at": datetime.now().isoformat(),
             "vehicle": f"{m_year} {model}",
             "location": f"{city}, {district}",
-            "current_odometer": odo
+            "current_odometer": odo,
+            "timings_ms": {**timings, "total": round((time.perf_counter() - pipeline_start) * 1000, 1)}
         },
         "vehicle_condition": vehicle_condition_desc,
         "accident_risk": accident_risk,
@@ -496,15 +1160,20 @@ def get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo,
         "structured_data": structured_data
     }
 
-def get_advanced_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced=None, additional_notes=None, parts_mileage=None, fuel_type=None):
+def get_advanced_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced=None, additional_notes=None, parts_mileage=None, fuel_type=None, sensor_anomalies=None):
     """Legacy function - returns structured report"""
-    return get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced, additional_notes, parts_mileage, fuel_type)
+    return get_structured_report(v_type, model, m_year, odo, district, city, tyre_odo, align_odo, service_odo, trips, parts_replaced, additional_notes, parts_mileage, fuel_type, sensor_anomalies)
 
-def analyze_vision_chat(image_file, user_query, vehicle_context):
-    """Analyze vehicle description using Groq LLM (no image API needed)"""
+def analyze_vision_chat(image_file, user_query, vehicle_context, stats=None):
+    """
+    Analyze vehicle description using Groq LLM (no image API needed)
+    If a dict is passed as `stats`, stats["error"] tells whether the reply is an error message
+    """
+    stats = stats if stats is not None else {}
+    stats["error"] = True
     try:
         # Get Groq API key
-        api_key = st.secrets.get("GROQ_API_KEY")
+        api_key = get_groq_api_key()
         if not api_key:
             return "❌ Groq API key not configured. Please add GROQ_API_KEY to secrets."
         
@@ -549,10 +1218,10 @@ Based on the user's description and question about the vehicle image, provide a
 Note: For detailed image analysis, ask the user to describe what they see in the image, and I'll provide more accurate recommendations."""
         
         # Use Groq for analysis
-        llm = ChatGroq(model="llama-3.3-70b-versatile", groq_api_key=api_key)
-        response = llm.invoke(analysis_prompt).content
+        response = llm_manager.invoke(analysis_prompt)
         
         if response:
+            stats["error"] = False
             return response
         else:
             return "⚠️ No response received. Please try uploading a different image or describing the issue."
@@ -748,31 +1417,149 @@ def generate_pdf_report(report_data):
         st.error(f"PDF generation error: {str(e)}")
         return None
 
-def chat_with_mechanic(user_query, vehicle_context):
-    """Chat with AI mechanic without image - text-only conversation"""
-    try:
-        api_key = st.secrets.get("GROQ_API_KEY")
-        if not api_key:
-            return "❌ API key not configured. Please set GROQ_API_KEY."
-        
-        llm = ChatGroq(model="llama-3.3-70b-versatile", groq_api_key=api_key)
-        
-        prompt = f"""You are a friendly and knowledgeable Sri Lankan automotive mechanic (2026).
+# --- CHAT MEMORY (last turns verbatim, older turns rolled into a bounded summary) ---
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200"))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "300"))
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+def _clip(text, max_tokens):
+    max_chars = max_tokens * 4
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+def summarize_turn(user_text, assistant_text):
+    """One compact line per rolled-up turn: the question and the first sentence of the advice"""
+    advice = assistant_text.split(". ")[0]
+    return f"- User asked: {_clip(user_text, 30)} | Mechanic: {_clip(advice, 40)}"
+
+class ConversationMemory:
+    """
+    Chat context with a constant upper bound on prompt size
+    The last `recent_turns` user/assistant turns are kept verbatim; older turns (or recent
+    ones that would exceed `token_budget`) are rolled into a running summary that is itself
+    trimmed to `summary_budget` tokens, dropping the oldest lines first.
+    `summarizer(user_text, assistant_text)` can be swapped for an LLM-backed one.
+    """
+    
+    def __init__(self, recent_turns=CHAT_RECENT_TURNS, token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                 summary_budget=CHAT_SUMMARY_TOKEN_BUDGET, summarizer=None):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer or summarize_turn
+        self.turns = deque()  # (user_text, assistant_text)
+        self.summary_lines = deque()
+        self.total_turns = 0
+    
+    def add_turn(self, user_text, assistant_text):
+        self.turns.append((user_text, assistant_text))
+        self.total_turns += 1
+        self._compact()
+    
+    def _turn_tokens(self, turn):
+        return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+    
+    def _roll_oldest(self):
+        self.summary_lines.append(self.summarizer(*self.turns.popleft()))
+        while self.summary_lines and sum(estimate_tokens(l) for l in self.summary_lines) > self.summary_budget:
+            self.summary_lines.popleft()
+    
+    def _compact(self):
+        while len(self.turns) > self.recent_turns:
+            self._roll_oldest()
+        verbatim_budget = self.token_budget - self.summary_budget
+        while len(self.turns) > 1 and sum(self._turn_tokens(t) for t in self.turns) > verbatim_budget:
+            self._roll_oldest()
+        if self.turns and self._turn_tokens(self.turns[0]) > verbatim_budget:
+            # A single huge turn is clipped rather than sent whole
+            user_text, assistant_text = self.turns[0]
+            self.turns[0] = (_clip(user_text, verbatim_budget // 4), _clip(assistant_text, verbatim_budget * 3 // 4))
+    
+    def build_context(self):
+        """Text block for the prompt (empty for a new conversation)"""
+        sections = []
+        if self.summary_lines:
+            sections.append("EARLIER CONVERSATION (summary):\n" + "\n".join(self.summary_lines))
+        if self.turns:
+            sections.append("RECENT CONVERSATION:\n" + "\n".join(
+                f"User: {user_text}\nMechanic: {assistant_text}" for user_text, assistant_text in self.turns
+            ))
+        return "\n\n".join(sections)
+    
+    def token_count(self):
+        return estimate_tokens(self.build_context())
+    
+    def clear(self):
+        self.turns.clear()
+        self.summary_lines.clear()
+        self.total_turns = 0
+
+def _mechanic_chat_prompt(user_query, vehicle_context, memory=None):
+    history = memory.build_context() if memory else ""
+    history_block = f"\n{history}\n" if history else ""
+    return f"""You are a friendly and knowledgeable Sri Lankan automotive mechanic (2026).
 
 VEHICLE CONTEXT: {vehicle_context}
-USER QUESTION: {user_query}
+{history_block}USER QUESTION: {user_query}
 
 Provide practical, helpful advice about vehicle maintenance, repairs, or any automotive question.
 Be specific to Sri Lankan context where relevant (local costs, common issues, available services).
 Keep your response concise but thorough.
 If cost estimates are needed, include LKR pricing with 18% VAT and 2.5% SSCL where applicable."""
+
+def _chat_error_message(error):
+    error_msg = str(error)
+    if "api" in error_msg.lower():
+        return "⚠️ Could not connect to AI service. Please check your internet connection."
+    else:
+        return f"⚠️ Error: {error_msg[:150]}"
+
+def chat_with_mechanic(user_query, vehicle_context, memory=None, stats=None):
+    """
+    Chat with AI mechanic without image - text-only conversation (memory: optional ConversationMemory)
+    If a dict is passed as `stats`, stats["error"] tells whether the reply is an error message
+    """
+    stats = stats if stats is not None else {}
+    stats["error"] = True
+    try:
+        api_key = get_groq_api_key()
+        if not api_key:
+            return "❌ API key not configured. Please set GROQ_API_KEY."
         
-        response = llm.invoke(prompt).content
+        response = llm_manager.invoke(_mechanic_chat_prompt(user_query, vehicle_context, memory))
+        stats["error"] = False
         return response
         
     except Exception as e:
-        error_msg = str(e)
-        if "api" in error_msg.lower():
-            return "⚠️ Could not connect to AI service. Please check your internet connection."
-        else:
-            return f"⚠️ Error: {error_msg[:150]}"
\ No newline at end of file
+        return _chat_error_message(e)
+
+def stream_chat_with_mechanic(user_query, vehicle_context, stats=None, memory=None):
+    """
+    Streaming version of chat_with_mechanic: yields text chunks as the LLM produces them
+    If a dict is passed as `stats` it receives ttft_ms (time to first token), total_ms and chunks.
+    Errors are yielded as a final message, like chat_with_mechanic returns them, and set
+    stats["error"] (the reply may then also hold a partial answer).
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    stats.update({"ttft_ms": None, "total_ms": None, "chunks": 0, "error": False})
+    try:
+        if not get_groq_api_key():
+            stats["error"] = True
+            yield "❌ API key not configured. Please set GROQ_API_KEY."
+            return
+        
+        for chunk in llm_manager.stream(_mechanic_chat_prompt(user_query, vehicle_context, memory)):
+            if stats["ttft_ms"] is None:
+                stats["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            stats["chunks"] += 1
+            yield chunk
+    except Exception as e:
+        stats["error"] = True
+        yield _chat_error_message(e)
+    finally:
+        stats["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+One-shot migration: move the embedded trips_data / history_log / changes_log arrays out of
+each users document into the append-only trips / reports / changes collections
+
+Usage:
+    python migrate_event_logs.py [--dry-run] [--keep-arrays]
+
+Safe to re-run: events carry their (user_id, legacy_index), so a user interrupted half-way is
+completed without duplicates, and the arrays are only removed once their events are stored.
+"""
+import argparse
+import sys
+
+import database
+
+# users document array -> (event collection, array entry -> event document)
+LEGACY_ARRAYS = {
+    "trips_data": ("trips", lambda entry: dict(entry)),
+    "history_log": ("reports", lambda entry: {"report": entry}),
+    "changes_log": ("changes", lambda entry: dict(entry))
+}
+
+
+def legacy_events(user, array):
+    """Event documents for one embedded array, in array order"""
+    collection, convert = LEGACY_ARRAYS[array]
+    # Entries without their own timestamp (trips, reports) fall back to the trip date or the user's
+    # last update; same-timestamp events keep array order through insertion order (_id)
+    fallback = user.get("last_updated") or user.get("created_date") or ""
+    events = []
+    for index, entry in enumerate(user.get(array) or []):
+        event = convert(entry)
+        event["timestamp"] = event.get("timestamp") or str(event.get("date") or fallback)
+        event["user_id"] = user["user_id"]
+        event["legacy_index"] = index
+        events.append(event)
+    return collection, events
+
+
+def migrate_user(db, user, dry_run=False, keep_arrays=False):
+    """Copy one user's arrays into the event collections; returns {collection: events}"""
+    counts = {}
+    for array in LEGACY_ARRAYS:
+        collection, events = legacy_events(user, array)
+        counts[collection] = len(events)
+        if dry_run or not events:
+            continue
+        # Skip entries a previous (interrupted) run already copied
+        done = set(db[collection].distinct("legacy_index", {"user_id": user["user_id"], "legacy_index": {"$exists": True}}))
+        pending = [event for event in events if event["legacy_index"] not in done]
+        if pending:
+            db[collection].insert_many(pending, ordered=True)
+
+    if not dry_run and not keep_arrays:
+        db["users"].update_one({"_id": user["_id"]}, {"$unset": {array: "" for array in LEGACY_ARRAYS}})
+    return counts
+
+
+def migrate(dry_run=False, keep_arrays=False, log=print):
+    client = database.get_db_client()
+    if client is None:
+        raise RuntimeError("MongoDB is not reachable - set MONGO_URI")
+    database.ensure_schema(client)
+    db = client[database.DB_NAME]
+
+    totals = {name: 0 for name, _ in LEGACY_ARRAYS.values()}
+    users = db["users"].find(
+        {"$or": [{array: {"$exists": True}} for array in LEGACY_ARRAYS]},
+        {"user_id": 1, "created_date": 1, "last_updated": 1, **{array: 1 for array in LEGACY_ARRAYS}}
+    )
+    migrated = 0
+    for user in users:
+        counts = migrate_user(db, user, dry_run, keep_arrays)
+        migrated += 1
+        for name, count in counts.items():
+            totals[name] += count
+        log(f"{user['user_id']}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+    log(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} users: "
+        + ", ".join(f"{count} {name}" for name, count in totals.items()))
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be moved")
+    parser.add_argument("--keep-arrays", action="store_true", help="Copy events but leave the embedded arrays in place")
+    args = parser.parse_args(argv)
+    try:
+        migrate(args.dry_run, args.keep_arrays)
+    except RuntimeError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
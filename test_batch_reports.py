@@ -0,0 +1,90 @@
+"""
+Batch report CLI tests (offline stubs, no network)
+Run with: python -m pytest test_batch_reports.py
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import batch_reports
+import logic
+
+
+@pytest.fixture
+def offline_services(monkeypatch):
+    # Register the current globals so configure_services' replacements are undone afterwards
+    for name in ["weather_cache", "llm_manager", "llm_response_cache", "_report_executor"]:
+        monkeypatch.setattr(logic, name, getattr(logic, name))
+    batch_reports.configure_services(SimpleNamespace(
+        offline=True, stub_weather_ms=5, stub_llm_ms=5, weather_concurrency=2, llm_concurrency=2, workers=4
+    ))
+
+
+@pytest.fixture
+def fleet_file(tmp_path):
+    rows = [
+        {"vehicle_id": "CAR-1", "v_type": "Petrol/Diesel Car", "model": "Toyota Axio", "m_year": 2016, "odo": 62000,
+         "district": "Kandy", "city": "Kandy", "s_odo": 52000, "a_odo": 50000, "fuel_type": "Petrol",
+         "parts_replaced": ["Brake Pads"], "trips": [{"km": 120, "road": ["Mountain"], "date": "2026-01-20"}]},
+        {"user_id": "abc123", "vehicle_data": {"v_type": "Motorbike", "model": "Bajaj CT100", "odo": 18000,
+         "district": "Galle", "city": "Galle", "s_odo": 15000, "a_odo": 0}, "trips_data": []},
+        {"vehicle_id": "TUK/9", "v_type": "Three-Wheeler", "model": "Bajaj RE", "odo": 41000, "district": "Colombo"},
+    ]
+    path = tmp_path / "fleet.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in rows))
+    return path
+
+
+def test_batch_generates_exports_and_summary(offline_services, fleet_file, tmp_path):
+    vehicles = batch_reports.load_fleet(fleet_file)
+    assert [v["vehicle_id"] for v in vehicles] == ["CAR-1", "abc123", "TUK/9"]
+    assert vehicles[2]["city"] == "Colombo"
+
+    out = tmp_path / "out"
+    summary = batch_reports.run_batch(vehicles, out, workers=4)
+
+    assert summary["succeeded"] == 3 and summary["failed"] == 0
+    assert summary["reports_per_s"] > 0
+    assert {"weather", "llm", "export", "report"} <= set(summary["stages_ms"])
+    for name in ["CAR-1", "abc123", "TUK_9"]:
+        for ext in ["json", "csv", "pdf"]:
+            assert (out / "reports" / f"{name}.{ext}").stat().st_size > 0
+    report = json.loads((out / "reports" / "CAR-1.json").read_text())
+    assert report["weather"]["condition"] in batch_reports.OFFLINE_CONDITIONS
+
+
+def test_batch_resumes_from_checkpoint_and_retries_failures(offline_services, fleet_file, tmp_path, monkeypatch):
+    vehicles = batch_reports.load_fleet(fleet_file)
+    out = tmp_path / "out"
+    real_report = logic.get_structured_report
+
+    def flaky_report(*args):
+        if args[1] == "Bajaj RE":
+            raise RuntimeError("boom")
+        return real_report(*args)
+
+    monkeypatch.setattr(logic, "get_structured_report", flaky_report)
+    first = batch_reports.run_batch(vehicles, out, formats=["json"])
+    assert (first["succeeded"], first["failed"]) == (2, 1)
+
+    monkeypatch.setattr(logic, "get_structured_report", real_report)
+    second = batch_reports.run_batch(vehicles, out, formats=["json"])
+    assert (second["skipped"], second["succeeded"]) == (2, 1)
+
+    third = batch_reports.run_batch(vehicles, out, formats=["json"])
+    assert third["skipped"] == 3 and third["processed"] == 0
+
+
+def test_offline_run_keeps_stub_analyses_out_of_shared_cache(monkeypatch, fleet_file, tmp_path):
+    for name in ["weather_cache", "llm_manager", "llm_response_cache", "_report_executor"]:
+        monkeypatch.setattr(logic, name, getattr(logic, name))
+    shared = logic.LLMResponseCache(sqlite_path=str(tmp_path / "llm_cache.sqlite"))
+    logic.llm_response_cache = shared
+    batch_reports.configure_services(SimpleNamespace(
+        offline=True, stub_weather_ms=5, stub_llm_ms=5, weather_concurrency=2, llm_concurrency=2, workers=2
+    ))
+    assert logic.llm_response_cache is not shared and logic.llm_response_cache.sqlite_path is None
+
+    batch_reports.run_batch(batch_reports.load_fleet(fleet_file), tmp_path / "out", formats=["json"])
+    assert shared.stats["stores"] == 0 and logic.llm_response_cache.stats["stores"] > 0
@@ -0,0 +1,349 @@
+"""
+Data access tests against an in-memory MongoDB stand-in (mongomock)
+Run with: python -m pytest test_database.py
+"""
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import database
+import migrate_event_logs
+
+# A real server for the query-plan test (mongomock has no planner); skipped when unreachable
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(database, "_client_factory", mongomock.MongoClient)
+    database.reset_db_client()
+    monkeypatch.setattr(database, "_mongo_uri", "mongodb://localhost:27017")
+    client = database.get_db_client()
+    client.drop_database(database.DB_NAME)
+    yield client[database.DB_NAME]
+    database.write_behind.flush()
+    database.reset_db_client()
+
+
+@pytest.fixture
+def user_id(db):
+    return database.get_or_create_user("Toyota Axio", "Kandy", "Kandy")["user_id"]
+
+
+class _UnreachableClient:
+    """Client whose ping fails, recording whether it was closed"""
+
+    def __init__(self, attempts):
+        self.closed = False
+        attempts.append(self)
+
+    @property
+    def admin(self):
+        return self
+
+    def command(self, name):
+        raise pymongo.errors.ServerSelectionTimeoutError("down")
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_is_shared_and_failed_connections_back_off(monkeypatch):
+    attempts = []
+    def unreachable(*args, **kwargs):
+        return _UnreachableClient(attempts)
+
+    monkeypatch.setattr(database, "_client_factory", unreachable)
+    database.reset_db_client()
+    monkeypatch.setattr(database, "_mongo_uri", "mongodb://localhost:27017")
+    assert database.get_db_client() is None and database.get_db_client() is None
+    assert len(attempts) == 1 and attempts[0].closed
+
+    # Once the backoff has passed, concurrent callers all end up with one published client
+    monkeypatch.setattr(database, "MONGO_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(database, "_client_factory", mongomock.MongoClient)
+    with ThreadPoolExecutor(8) as pool:
+        clients = list(pool.map(lambda _: database.get_db_client(), range(16)))
+    assert all(client is clients[0] for client in clients) and clients[0] is not None
+    assert database.get_db_client() is clients[0]
+    database.reset_db_client()
+
+
+def test_events_go_to_collections_not_the_user_document(db, user_id):
+    database.add_trip_data(user_id, {"km": 120, "road": ["Mountain"], "date": "2026-01-20"})
+    database.add_report(user_id, {"type": "structured", "score": 42})
+    database.update_service_odometer(user_id, 52000)
+
+    user = database.get_user_by_id(user_id)
+    assert not {"trips_data", "history_log", "changes_log"} & set(user)
+    assert database.get_trips(user_id)["items"][0]["km"] == 120
+    assert database.get_reports(user_id)["items"][0]["report"]["score"] == 42
+    assert [c["field"] for c in database.get_changes_log(user_id)] == ["trip_added", "report_generated", "last_service_odometer"]
+    assert database.get_changes_log(user_id, limit=1)[0]["new_value"] == 52000
+    assert all("user_id_timestamp" in db[name].index_information() for name in database.EVENT_COLLECTIONS)
+
+
+def test_pages_are_stable_when_timestamps_tie(user_id):
+    # save_user_data stamps one batch with a single timestamp, so ordering falls back to _id
+    trips = [{"km": i, "road": [], "date": "2026-02-01"} for i in range(125)]
+    database.save_user_data(user_id, {"odo": 60000}, trips, [])
+    database.save_user_data(user_id, {"odo": 60000}, trips, [])
+
+    seen, cursor = [], None
+    while True:
+        page = database.get_trips(user_id, limit=50, before=cursor)
+        seen.extend(t["km"] for t in page["items"])
+        cursor = page["next"]
+        if not cursor:
+            break
+    assert seen == list(range(124, -1, -1))
+
+
+def test_save_user_data_appends_each_session_entry_once(db, user_id, monkeypatch):
+    trips = [{"km": km, "road": [], "date": "2026-02-01"} for km in range(3)]
+    database.save_user_data(user_id, {}, trips, [{"type": "structured"}])
+    database.save_user_data(user_id, {}, trips, [])
+    assert all(database.SAVED_ENTRY_KEY in trip for trip in trips)
+
+    # A reset (shorter) session list still has its new entries saved
+    database.save_user_data(user_id, {}, [{"km": 99, "road": [], "date": "2026-02-02"}], [])
+    # Entries a failed save could not store are retried by the next one
+    pending = [{"km": 100, "road": [], "date": "2026-02-03"}]
+    real_collection = database.get_event_collection
+    monkeypatch.setattr(database, "get_event_collection", lambda name: None)
+    database.save_user_data(user_id, {}, pending, [])
+    assert database.SAVED_ENTRY_KEY not in pending[0]
+    monkeypatch.setattr(database, "get_event_collection", real_collection)
+    database.save_user_data(user_id, {}, pending, [])
+    database.write_behind.flush()
+
+    assert sorted(t["km"] for t in db["trips"].find({"user_id": user_id})) == [0, 1, 2, 99, 100]
+    assert db["reports"].find_one({"user_id": user_id})["report"] == {"type": "structured"}
+
+
+def test_migration_moves_embedded_arrays_once(db):
+    db["users"].insert_one({
+        "user_id": "legacy1", "created_date": "2025-01-01T00:00:00", "last_updated": "2025-06-01T00:00:00",
+        "vehicle_data": {"s_odo": 40000},
+        "trips_data": [{"km": 10, "road": ["City"], "date": "2025-05-01"}, {"km": 20, "road": [], "date": "2025-05-02"}],
+        "history_log": [{"type": "structured"}],
+        "changes_log": [{"timestamp": "2025-05-01T10:00:00", "field": "trip_added", "changed_by": "trip_entry"}]
+    })
+
+    totals = migrate_event_logs.migrate(log=lambda line: None)
+    assert totals == {"trips": 2, "reports": 1, "changes": 1}
+    db["users"].update_one({"user_id": "legacy1"}, {"$set": {"trips_data": [{"km": 10, "road": ["City"], "date": "2025-05-01"}]}})
+    migrate_event_logs.migrate(log=lambda line: None)
+
+    assert [t["km"] for t in database.get_trips("legacy1")["items"]] == [20, 10]
+    assert database.get_reports("legacy1")["items"][0]["report"] == {"type": "structured"}
+    assert "trips_data" not in db["users"].find_one({"user_id": "legacy1"})
+
+
+def test_schema_bootstrap_is_idempotent(db):
+    database.get_or_create_user("Honda Fit", "Galle", "Galle")
+    database._indexed_clients.clear()
+    database.get_or_create_user("Honda Fit", "Galle", "Galle")
+
+    indexes = db["users"].index_information()
+    assert indexes["user_id_unique"]["unique"]
+    assert "users_by_created" in indexes
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        db["users"].insert_one({"user_id": database.generate_user_id("Honda Fit", "Galle")})
+
+
+def test_reads_project_only_needed_fields(db, user_id):
+    db["users"].update_one({"user_id": user_id}, {"$set": {"trips_data": [{"km": 1}] * 50}})
+    assert "trips_data" not in database.get_user_by_id(user_id)
+    assert "_id" not in database.get_or_create_user("Toyota Axio", "Kandy", "Kandy")
+    assert set(database.get_all_users()[0]) == {"user_id", "model", "city", "district", "created_date"}
+
+
+class _CommandRecorder(pymongo.monitoring.CommandListener):
+    EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in self.EXPLAINABLE and event.database_name == database.DB_NAME:
+            self.commands.append({k: v for k, v in event.command.items() if not k.startswith("$") and k != "lsid"})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _has_collscan(plan):
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(_has_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(v) for v in plan)
+    return False
+
+
+def test_no_query_does_a_collection_scan(monkeypatch):
+    probe = pymongo.MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=500)
+    try:
+        probe.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip(f"no mongod at {MONGO_TEST_URI}")
+    probe.drop_database(database.DB_NAME)
+
+    recorder = _CommandRecorder()
+    monkeypatch.setattr(database, "_client_factory", functools.partial(pymongo.MongoClient, event_listeners=[recorder]))
+    database.reset_db_client()
+    monkeypatch.setattr(database, "_mongo_uri", MONGO_TEST_URI)
+    try:
+        # Exercise every read and write path in database.py
+        for model in ["Toyota Axio", "Honda Fit", "Suzuki Alto"]:
+            user_id = database.get_or_create_user(model, "Kandy", "Kandy")["user_id"]
+        database.get_user_by_id(user_id)
+        database.save_user_data(user_id, {"odo": 60000}, [{"km": i, "road": [], "date": "2026-02-01"} for i in range(60)], [{"type": "structured"}])
+        database.update_service_odometer(user_id, 52000)
+        database.update_alignment_odometer(user_id, 50000)
+        database.add_trip_data(user_id, {"km": 5, "road": ["City"], "date": "2026-02-02"})
+        database.add_report(user_id, {"type": "structured"})
+        database.get_trips(user_id, before=database.get_trips(user_id, limit=10)["next"])
+        database.get_reports(user_id)
+        database.get_changes_log(user_id, limit=5)
+        database.get_all_users()
+        database.save_vehicle_profile({"odo": 1})
+        database.get_vehicle_profile()
+
+        db = database.get_db_client()[database.DB_NAME]
+        scans = []
+        for command in recorder.commands:
+            # Multi-statement updates/deletes are explained one statement at a time
+            batch_key = {"update": "updates", "delete": "deletes"}.get(next(iter(command)))
+            statements = [{**command, batch_key: [s]} for s in command[batch_key]] if batch_key else [command]
+            for statement in statements:
+                plan = db.command("explain", statement, verbosity="queryPlanner")["queryPlanner"]
+                if _has_collscan(plan["winningPlan"]):
+                    scans.append(statement)
+        assert recorder.commands and scans == []
+    finally:
+        database.reset_db_client()
+        probe.drop_database(database.DB_NAME)
+        probe.close()
+
+
+def test_field_updates_batch_and_log_replaced_values_under_concurrency(db, user_id):
+    assert database.update_vehicle_fields(user_id, {"s_odo": 50000, "a_odo": 48000, "odo": 61000})
+    # The change log is written before the call returns, not queued behind it
+    assert db["changes"].count_documents({"user_id": user_id}) == 3
+    changes = database.get_changes_log(user_id)
+    assert [(c["field"], c["old_value"], c["new_value"]) for c in changes] == [
+        ("last_service_odometer", 0, 50000), ("last_alignment_odometer", 0, 48000), ("odo", 0, 61000)
+    ]
+    assert database.get_user_by_id(user_id)["vehicle_data"] == {"s_odo": 50000, "a_odo": 48000, "odo": 61000}
+    assert not database.update_vehicle_fields("no-such-user", {"s_odo": 1})
+
+    values = list(range(51000, 51040))
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda v: database.update_service_odometer(user_id, v), values))
+
+    # Every write replaced exactly one value: the log forms a single unbroken chain
+    service = [c for c in database.get_changes_log(user_id) if c["field"] == "last_service_odometer"][1:]
+    replaced = {c["new_value"]: c["old_value"] for c in service}
+    assert sorted(replaced) == values
+    final = database.get_user_by_id(user_id)["vehicle_data"]["s_odo"]
+    assert set(replaced.values()) == ({50000} | set(values)) - {final}
+
+
+def test_write_behind_flushes_on_size_and_on_close(db, user_id, monkeypatch):
+    buffer = database.WriteBehindBuffer(batch_size=10, flush_interval=60)
+    monkeypatch.setattr(database, "write_behind", buffer)
+    for km in range(25):
+        assert database.add_trip_data(user_id, {"km": km, "road": [], "date": "2026-03-01"})
+
+    deadline = time.monotonic() + 5
+    while buffer.metrics()["written"] < 40 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    metrics = buffer.metrics()
+    assert metrics["written"] >= 40 and metrics["written"] + metrics["backlog"] == 50
+    assert metrics["flushes"] >= 4 and metrics["flush_ms_p50"] is not None
+
+    buffer.close()
+    assert buffer.metrics()["backlog"] == 0 and buffer.metrics()["written"] == 50
+    trips = list(db["trips"].find({"user_id": user_id}).sort([("timestamp", 1), ("_id", 1)]))
+    assert [t["km"] for t in trips] == list(range(25))
+    assert db["changes"].count_documents({"user_id": user_id, "field": "trip_added"}) == 25
+
+
+def test_write_behind_keeps_backlog_while_db_is_down_and_retries_without_duplicates(db, user_id, monkeypatch):
+    buffer = database.WriteBehindBuffer(batch_size=1000, flush_interval=60)
+    monkeypatch.setattr(database, "write_behind", buffer)
+    database.add_report(user_id, {"type": "structured"})
+    real_client = database.get_db_client
+
+    monkeypatch.setattr(database, "get_db_client", lambda: None)
+    assert buffer.flush() == 0 and buffer.metrics()["backlog"] == 2
+    monkeypatch.setattr(database, "get_db_client", real_client)
+
+    # A batch that partly reached the server before a failure is simply queued again
+    queued = list(buffer._queue)
+    db["reports"].insert_one(dict(queued[0][1]))
+    assert buffer.flush() == 2
+    assert db["reports"].count_documents({"user_id": user_id}) == 1
+    assert buffer.metrics()["failed"] == 0
+
+
+def test_reads_flush_only_the_requested_users_pending_events(db, user_id, monkeypatch):
+    buffer = database.WriteBehindBuffer(batch_size=1000, flush_interval=60)
+    monkeypatch.setattr(database, "write_behind", buffer)
+    other_id = database.get_or_create_user("Honda Fit", "Galle", "Galle")["user_id"]
+    database.add_trip_data(user_id, {"km": 10, "road": [], "date": "2026-03-01"})
+    database.add_trip_data(other_id, {"km": 20, "road": [], "date": "2026-03-01"})
+
+    assert [t["km"] for t in database.get_events_page("trips", user_id)["items"]] == [10]
+    assert buffer.metrics()["backlog"] == 3
+    assert not buffer.has_pending("trips", user_id) and buffer.has_pending("trips", other_id)
+
+    assert [c["field"] for c in database.get_changes_log(user_id)] == ["trip_added"]
+    assert buffer.metrics()["backlog"] == 2
+    buffer.close()
+    assert db["trips"].count_documents({}) == 2
+
+
+def test_write_behind_applies_backpressure_and_logs_rejected_events(db, user_id, monkeypatch, capsys):
+    buffer = database.WriteBehindBuffer(batch_size=100, flush_interval=60, max_backlog=3, submit_timeout=0.05)
+    monkeypatch.setattr(database, "write_behind", buffer)
+    write = buffer._write
+    monkeypatch.setattr(buffer, "_write", lambda batch: False)  # database down
+    assert buffer.submit("trips", [{"user_id": user_id, "km": km} for km in range(3)])
+
+    # Full backlog while the database is down: the new write is refused, nothing queued is dropped
+    assert not database._append_events("trips", user_id, [{"km": 3}])
+    assert buffer.metrics()["backlog"] == 3 and buffer.metrics()["rejected"] == 1
+    assert "refused 1 trips events" in capsys.readouterr().out
+
+    # A write waiting for room goes through as soon as a flush frees it
+    monkeypatch.setattr(buffer, "_write", write)
+    buffer.submit_timeout = 5
+    with ThreadPoolExecutor(1) as pool:
+        waiting = pool.submit(buffer.submit, "trips", [{"user_id": user_id, "km": 4}])
+        time.sleep(0.05)
+        assert not waiting.done()
+        buffer.flush()
+        assert waiting.result(timeout=5)
+    buffer.flush()
+    assert sorted(t["km"] for t in db["trips"].find({"user_id": user_id})) == [0, 1, 2, 4]
+
+    # Events the server rejects (other than duplicates) are logged with their document
+    def reject_second(self, requests, ordered=True):
+        raise pymongo.errors.BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "failed validation"}]})
+    monkeypatch.setattr(type(db["trips"]), "bulk_write", reject_second)
+    buffer.submit("trips", [{"user_id": user_id, "km": 5}, {"user_id": user_id, "km": 6}])
+    buffer.flush()
+    collection, doc, error = buffer.failed_events[-1]
+    assert (collection, doc["km"], error) == ("trips", 6, "failed validation")
+    assert buffer.metrics()["failed"] == 1 and "km': 6" in capsys.readouterr().out
@@ -0,0 +1,130 @@
+"""
+Async data access tests - the round-trip test needs a local mongod (MONGO_TEST_URI)
+Run with: python -m pytest test_database_async.py
+"""
+import asyncio
+import inspect
+import os
+
+import pymongo
+import pytest
+
+import database
+import database_async
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017")
+
+# database.py helpers that have nothing to await
+SYNC_ONLY = {"get_mongo_uri", "generate_user_id"}
+
+
+@pytest.fixture
+def mongod(monkeypatch):
+    probe = pymongo.MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=500)
+    try:
+        probe.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip(f"no mongod at {MONGO_TEST_URI}")
+    if database_async._client_factory is None:
+        pytest.skip("no async MongoDB driver installed")
+    probe.drop_database(database.DB_NAME)
+    monkeypatch.setattr(database, "_client_factory", pymongo.MongoClient)
+    database.reset_db_client()
+    monkeypatch.setattr(database, "_mongo_uri", MONGO_TEST_URI)
+    yield
+    database.write_behind.flush()
+    database.reset_db_client()
+    probe.drop_database(database.DB_NAME)
+    probe.close()
+
+
+def test_async_api_mirrors_sync_surface():
+    public = {
+        name for name, fn in inspect.getmembers(database, inspect.isfunction)
+        if not name.startswith("_") and fn.__module__ == "database"
+    } - SYNC_ONLY
+    for name in public:
+        assert inspect.iscoroutinefunction(getattr(database_async, name, None)), name
+
+
+def test_missing_driver_is_reported_once(monkeypatch, capsys):
+    monkeypatch.setattr(database_async, "_client_factory", None)
+    monkeypatch.setattr(database_async, "_warned_no_driver", False)
+    monkeypatch.setattr(database, "_mongo_uri", MONGO_TEST_URI)
+
+    async def twice():
+        return [await database_async.get_db_client(), await database_async.get_users_collection()]
+
+    assert asyncio.run(twice()) == [None, None]
+    assert capsys.readouterr().out.count("No async MongoDB driver") == 1
+
+
+class _UnreachableClient:
+    """Async client whose ping fails, recording whether it was closed"""
+
+    def __init__(self, attempts):
+        self.closed = False
+        attempts.append(self)
+
+    @property
+    def admin(self):
+        return self
+
+    async def command(self, name):
+        raise pymongo.errors.ServerSelectionTimeoutError("down")
+
+    async def close(self):
+        self.closed = True
+
+
+def test_failed_connections_back_off_and_are_closed(monkeypatch):
+    attempts = []
+    monkeypatch.setattr(database_async, "_client_factory", lambda *args, **kwargs: _UnreachableClient(attempts))
+    monkeypatch.setattr(database, "_mongo_uri", MONGO_TEST_URI)
+
+    async def scenario():
+        await database_async.reset_db_client()
+        results = [await database_async.get_all_users() for _ in range(3)]
+        monkeypatch.setattr(database, "MONGO_RETRY_BACKOFF", 0.0)
+        await database_async.get_db_client()
+        return results
+
+    monkeypatch.setattr(database, "MONGO_RETRY_BACKOFF", 5.0)
+    assert asyncio.run(scenario()) == [[], [], []]
+    assert len(attempts) == 2 and all(client.closed for client in attempts)
+
+
+def test_async_round_trip_against_mongod(mongod):
+    async def scenario():
+        user = await database_async.get_or_create_user("Toyota Axio", "Kandy", "Kandy")
+        user_id = user["user_id"]
+        client = await database_async.get_db_client()
+
+        # Concurrent writes on one shared client
+        await asyncio.gather(*(
+            database_async.add_trip_data(user_id, {"km": km, "road": ["City"], "date": "2026-03-01"}) for km in range(30)
+        ))
+        await asyncio.gather(*(database_async.update_service_odometer(user_id, odo) for odo in range(52000, 52020)))
+        await database_async.add_report(user_id, {"type": "structured"})
+        # Queued by the sync API's write-behind buffer; async reads flush it first
+        database.add_trip_data(user_id, {"km": 30, "road": [], "date": "2026-03-02"})
+
+        first = await database_async.get_trips(user_id, limit=20)
+        rest = await database_async.get_trips(user_id, limit=20, before=first["next"])
+        changes = await database_async.get_changes_log(user_id)
+        users = await database_async.get_all_users()
+        assert await database_async.get_db_client() is client
+        await database_async.reset_db_client()
+        return user_id, first, rest, changes, users
+
+    user_id, first, rest, changes, users = asyncio.run(scenario())
+
+    assert sorted(t["km"] for t in first["items"] + rest["items"]) == list(range(31))
+    assert rest["next"] is None
+    service = [c for c in changes if c["field"] == "last_service_odometer"]
+    replaced = {c["old_value"] for c in service}
+    assert len(service) == 20 and len(replaced) == 20
+    assert [u["user_id"] for u in users] == [user_id]
+    # Both APIs see the same documents
+    assert len(database.get_trips(user_id, limit=100)["items"]) == 31
+    assert database.get_user_by_id(user_id)["vehicle_data"]["s_odo"] in range(52000, 52020)
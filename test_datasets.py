@@ -0,0 +1,370 @@
+"""
+Dataset layer tests (parts catalog, caches, telemetry snapshot/index/aggregates, models)
+Run with: python -m pytest test_datasets.py
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import datasets
+
+REPO = Path(__file__).parent
+
+# Tables as hard-coded in DatasetHandler before the shared parts catalog
+LEGACY_PARTS = {
+    "bike": {
+        "Engine Oil (1L)": {"Price_LKR": 2800, "Interval_km": 3000, "Urgency": "CRITICAL"},
+        "Air Filter": {"Price_LKR": 1200, "Interval_km": 10000, "Urgency": "MEDIUM"},
+        "Spark Plug": {"Price_LKR": 850, "Interval_km": 5000, "Urgency": "HIGH"},
+        "Chain Sprocket Kit": {"Price_LKR": 8500, "Interval_km": 15000, "Urgency": "HIGH"},
+        "Brake Shoes (Rear)": {"Price_LKR": 1500, "Interval_km": 10000, "Urgency": "HIGH"},
+        "Tire Pressure Check": {"Price_LKR": 300, "Interval_km": 2000, "Urgency": "CRITICAL"},
+        "Clutch Cable": {"Price_LKR": 900, "Interval_km": 12000, "Urgency": "MEDIUM"},
+        "Brake Fluid": {"Price_LKR": 1500, "Interval_km": 15000, "Urgency": "MEDIUM"}
+    },
+    "tuk": {
+        "Engine Oil (RE)": {"Price_LKR": 3200, "Interval_km": 5000, "Urgency": "CRITICAL"},
+        "CV Joint (Axle)": {"Price_LKR": 12500, "Interval_km": 25000, "Urgency": "HIGH"},
+        "Canvas Hood": {"Price_LKR": 18000, "Interval_km": 50000, "Urgency": "LOW"},
+        "Clutch Cable": {"Price_LKR": 1200, "Interval_km": 10000, "Urgency": "MEDIUM"},
+        "Grease Nipple Service": {"Price_LKR": 500, "Interval_km": 1000, "Urgency": "CRITICAL"}
+    }
+}
+
+SPECIAL_PARTS = [
+    ("Motor Bicycle", "Engine Oil (1L)", 2800), ("Motor Bicycle", "Chain Sprocket Kit", 8500),
+    ("Motor Bicycle", "Brake Shoes (Rear)", 1500), ("Motor Bicycle", "Spark Plug", 850),
+    ("Three-Wheeler", "Engine Oil (RE)", 3200), ("Three-Wheeler", "CV Joint (Axle)", 12500),
+    ("Three-Wheeler", "Canvas Hood", 18000), ("Three-Wheeler", "Clutch Cable", 1200),
+    ("Three-Wheeler", "Grease Nipple Service", 500)
+]
+
+
+def legacy_obd_description(df, trouble_code):
+    """get_obd_description before the OBD index (full-table scan)"""
+    match = df[df["Code"].str.strip().str.upper() == trouble_code.upper()]
+    if not match.empty:
+        return f"**{trouble_code}**: {match.iloc[0]['Description']}"
+    return f"OBD Code: {trouble_code} (Not found in database)"
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    """DatasetHandler over a private copy of the datasets and a fresh process cache"""
+    shutil.copy(REPO / "obd-trouble-codes.csv", tmp_path / "obd-trouble-codes.csv")
+    pd.read_csv(REPO / "maintain_schdule.csv", nrows=600).to_csv(tmp_path / "maintain_schdule.csv", index=False)
+    monkeypatch.setattr(datasets, "dataset_cache", datasets.DatasetCache())
+    monkeypatch.setattr(datasets, "OBD_CHECK_INTERVAL", 0.0)
+    handler = datasets.DatasetHandler()
+    handler.base_path = tmp_path
+    return handler
+
+
+@pytest.fixture
+def telemetry_csv(tmp_path):
+    """The first 300 rows of maintain_schdule.csv"""
+    path = tmp_path / "telemetry.csv"
+    pd.read_csv(REPO / "maintain_schdule.csv", nrows=300).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def catalog_dir(tmp_path):
+    for name in ["parts_catalog.json", "parts_lifespan.json"]:
+        shutil.copy(REPO / name, tmp_path / name)
+    (tmp_path / "data").mkdir()
+    return tmp_path
+
+
+@pytest.mark.parametrize("special", [None, "with_vehicle_type", "legacy_without_vehicle_type"])
+def test_parts_catalog_matches_legacy_tables(catalog_dir, special):
+    if special:
+        frame = pd.DataFrame(SPECIAL_PARTS, columns=["Vehicle_Type", "Part_Name", "Base_Price_LKR"])
+        if special == "legacy_without_vehicle_type":
+            frame = frame.drop(columns="Vehicle_Type")
+        frame.to_csv(catalog_dir / "data" / "parts_db_special.csv", index=False)
+
+    catalog = datasets.PartsCatalog(catalog_dir)
+    for group, legacy in LEGACY_PARTS.items():
+        assert {name: dict(info) for name, info in catalog.as_dict(group).items()} == legacy
+
+
+def test_special_prices_only_apply_to_their_vehicle_group(catalog_dir):
+    pd.DataFrame([("Three-Wheeler", "Clutch Cable", 1500), ("Motor Bicycle", "Spark Plug", 999)],
+                 columns=["Vehicle_Type", "Part_Name", "Base_Price_LKR"]).to_csv(catalog_dir / "data" / "parts_db_special.csv", index=False)
+    catalog = datasets.PartsCatalog(catalog_dir)
+    assert catalog.as_dict("tuk")["Clutch Cable"]["Price_LKR"] == 1500
+    assert catalog.as_dict("bike")["Clutch Cable"]["Price_LKR"] == 900
+    assert catalog.as_dict("bike")["Spark Plug"]["Price_LKR"] == 999
+
+
+def test_parts_catalog_keeps_previous_version_on_bad_reload(catalog_dir):
+    catalog = datasets.PartsCatalog(catalog_dir, check_interval=0)
+    source = json.loads((catalog_dir / "parts_catalog.json").read_text())
+    assert catalog.check_for_updates() == 1 and catalog.catalog_version == source.get("version")
+
+    (catalog_dir / "parts_catalog.json").write_text("{not json")
+    assert catalog.reload() == 1 and catalog.last_error is not None
+    assert catalog.as_dict("bike")
+
+    source["version"] = "test-2"
+    (catalog_dir / "parts_catalog.json").write_text(json.dumps(source))
+    assert catalog.reload() == 2 and catalog.catalog_version == "test-2" and catalog.last_error is None
+
+
+def test_dataset_cache_views_do_not_write_through(tmp_path, monkeypatch):
+    path = tmp_path / "table.csv"
+    pd.DataFrame({"a": [1, 2, 3]}).to_csv(path, index=False)
+    cache = datasets.DatasetCache()
+
+    view = cache.get(path, pd.read_csv)
+    view.loc[0, "a"] = 100
+    view["b"] = 0
+    assert cache.get(path, pd.read_csv).to_dict("list") == {"a": [1, 2, 3]}
+
+    # Pre-copy-on-write pandas gets deep copies instead
+    monkeypatch.setattr(datasets, "COPY_ON_WRITE", False)
+    copy = cache.get(path, pd.read_csv)
+    copy.loc[1, "a"] = 200
+    assert cache.get(path, pd.read_csv)["a"].tolist() == [1, 2, 3]
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_obd_index_matches_the_table_scan(handler):
+    df = datasets._read_obd_codes(handler.base_path / "obd-trouble-codes.csv")
+    codes = list(df["Code"].iloc[::97]) + ["p0101", "P9999", "B1000", "U0001"]
+
+    expected = [legacy_obd_description(df, code) for code in codes]
+    assert [handler.get_obd_description(code) for code in codes] == expected
+    assert handler.get_obd_descriptions(codes) == expected
+    assert handler.lookup_obd_codes(["P0100", "P9999"]) == {"P0100": df["Description"][0], "P9999": None}
+
+    prefixed = sorted(set(c for c in df["Code"].str.strip().str.upper() if c.startswith("P01")))
+    assert [code for code, _ in handler.search_obd_codes("p01*")] == prefixed
+    assert handler.search_obd_codes("P01", limit=3) == [(c, handler.lookup_obd_codes([c])[c]) for c in prefixed[:3]]
+
+
+def test_obd_index_is_kept_until_the_file_changes(handler):
+    path = handler.base_path / "obd-trouble-codes.csv"
+    index = handler.get_obd_index()
+    assert handler.get_obd_index() is index
+
+    path.write_text(path.read_text().replace("Mass or Volume Air Flow Circuit Malfunction", "Replaced"))
+    assert handler.get_obd_description("P0100") == "**P0100**: Replaced"
+    assert handler.get_obd_index() is not index
+    assert datasets.dataset_cache.get_stats()["reloads"] == 1
+
+
+def test_telemetry_snapshot_round_trip_and_fallback(telemetry_csv, monkeypatch):
+    snapshot_dir = datasets.build_telemetry_snapshot(telemetry_csv)
+    assert not list(snapshot_dir.glob("*.tmp"))
+
+    calls = {"snapshot": 0, "digest": 0}
+    load_snapshot, digest = datasets.load_telemetry_snapshot, datasets.DatasetCache._file_digest
+    def counted(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(datasets, "load_telemetry_snapshot", counted("snapshot", load_snapshot))
+    monkeypatch.setattr(datasets.DatasetCache, "_file_digest", staticmethod(counted("digest", digest)))
+
+    def assert_loads_csv_contents():
+        # Deep copy: memory-mapped snapshot columns compare equal to in-memory ones
+        loaded = datasets.load_telemetry_frame(telemetry_csv).copy(deep=True)
+        pd.testing.assert_frame_equal(loaded, datasets.typed_telemetry_frame(pd.read_csv(telemetry_csv)))
+
+    # Unchanged CSV: served from the snapshot without hashing it
+    assert_loads_csv_contents()
+    assert calls == {"snapshot": 1, "digest": 0}
+
+    # Touched but identical: one hash confirms the snapshot is still valid
+    os.utime(telemetry_csv, ns=(0, os.stat(telemetry_csv).st_mtime_ns + 10**9))
+    assert_loads_csv_contents()
+    assert calls == {"snapshot": 2, "digest": 1}
+
+    # Stale snapshot: the CSV changed, so it is parsed instead
+    df = pd.read_csv(telemetry_csv)
+    df.loc[0, "engine_temp_c"] = 123.5
+    df.to_csv(telemetry_csv, index=False)
+    assert_loads_csv_contents()
+    assert calls["snapshot"] == 2
+
+    # Corrupt snapshot: falls back to the CSV
+    snapshot_dir = datasets.build_telemetry_snapshot(telemetry_csv)
+    (snapshot_dir / "003.npy").write_bytes(b"not a numpy file")
+    assert_loads_csv_contents()
+
+
+def test_failure_predictor_save_load_round_trip(telemetry_csv, tmp_path):
+    df = datasets.load_telemetry_frame(telemetry_csv)
+    model = datasets.load_failure_predictor(telemetry_csv, retrain=True)
+    model_path = datasets._model_path_for(telemetry_csv)
+    assert model_path.exists() and not list(tmp_path.glob("*.tmp"))
+
+    loaded = datasets.FailurePredictor.load(model_path)
+    np.testing.assert_array_equal(loaded.predict_proba(df), model.predict_proba(df))
+    assert (loaded.targets, loaded.failure_types, loaded.source) == (model.targets, model.failure_types, model.source)
+    # Reused while the CSV is unchanged
+    np.testing.assert_array_equal(datasets.load_failure_predictor(telemetry_csv).weights, model.weights)
+
+
+def test_lazy_telemetry_artifacts_are_built_once_under_concurrency(handler, monkeypatch):
+    builds = []
+    lock = threading.Lock()
+
+    class SlowIndex(datasets.TelemetryIndex):
+        def __init__(self, df):
+            with lock:
+                builds.append(self)
+            time.sleep(0.05)
+            super().__init__(df)
+
+    monkeypatch.setattr(datasets, "TelemetryIndex", SlowIndex)
+    with ThreadPoolExecutor(8) as pool:
+        indexes = list(pool.map(lambda _: handler.get_telemetry_index(), range(16)))
+    assert len(builds) == 1 and all(index is builds[0] for index in indexes)
+
+    with ThreadPoolExecutor(4) as pool:
+        stores = list(pool.map(lambda _: handler.get_telemetry_aggregates(), range(8)))
+    assert len({id(store) for store in stores}) == 1
+
+
+def test_fleet_recommendations_match_the_per_vehicle_version():
+    rng = np.random.default_rng(5)
+    n = 400
+    fleet = pd.DataFrame({
+        "vehicle_type": rng.choice(["Petrol/Diesel Car", "Hybrid", "EV", "Motorbike", "Three-Wheeler", "Van", None], n),
+        "fuel_type": rng.choice(["Petrol", "Diesel", "Hybrid", "Electric", None], n),
+        "service_odo": rng.integers(0, 80_000, n),
+    })
+    fleet["current_odo"] = fleet["service_odo"] + rng.integers(0, 60_000, n)
+    handler = datasets.DatasetHandler()
+
+    rows = fleet.astype(object).where(fleet.notna(), None).itertuples(index=False)
+    expected = [
+        handler.get_maintenance_recommendations(v.vehicle_type, v.current_odo, v.service_odo, v.fuel_type)
+        for v in rows
+    ]
+    assert handler.get_fleet_maintenance_recommendations(fleet, as_lists=True) == expected
+
+    long = handler.get_fleet_maintenance_recommendations(fleet)
+    assert len(long) == sum(len(recs) for recs in expected)
+    assert long.groupby("vehicle")["estimated_cost_lkr"].sum().to_dict() == {
+        i: sum(r["estimated_cost_lkr"] for r in recs) for i, recs in enumerate(expected) if recs
+    }
+
+
+def test_aggregate_store_matches_pandas_groupby(telemetry_csv):
+    df = datasets.load_telemetry_frame(telemetry_csv).copy()
+    df.loc[df.index[::7], "engine_temp_c"] = np.nan  # NaN readings are skipped per sensor
+    columns = datasets.TELEMETRY_SENSOR_COLUMNS
+    grouped = df.sort_values("timestamp", kind="stable").groupby("vehicle_id", observed=True)[columns]
+    expected = {
+        "count": grouped.count(), "mean": grouped.mean(), "std": grouped.std(ddof=0),
+        "min": grouped.min(), "max": grouped.max(), "last": grouped.last()
+    }
+
+    # One batch, chunked batches and single readings all agree. `last` follows the
+    # vehicle's newest reading, so only time-ordered feeds are compared on it.
+    in_order = df.sort_values("timestamp", kind="stable")
+    whole = datasets.TelemetryAggregateStore.from_frame(df)
+    chunked = datasets.TelemetryAggregateStore(capacity=2)
+    for start in range(0, len(in_order), 64):
+        chunked.update_batch(in_order.iloc[start:start + 64])
+    single = datasets.TelemetryAggregateStore()
+    for row in in_order.to_dict("records"):
+        single.update(row["vehicle_id"], row, row["timestamp"])
+    shuffled = datasets.TelemetryAggregateStore(capacity=2)
+    rows = df.sample(frac=1, random_state=0)
+    for start in range(0, len(rows), 64):
+        shuffled.update_batch(rows.iloc[start:start + 64])
+
+    for store in (whole, chunked, single, shuffled):
+        for stat, frame in expected.items():
+            if stat == "last" and store is shuffled:
+                continue
+            summary = store.summary(stat).sort_index()
+            np.testing.assert_allclose(summary.to_numpy(dtype=float), frame.sort_index().to_numpy(dtype=float),
+                                       rtol=1e-5, atol=1e-3, err_msg=stat)
+    vehicle = df["vehicle_id"].iloc[0]
+    assert whole.get(vehicle)["last_timestamp"] == df.loc[df["vehicle_id"] == vehicle, "timestamp"].max()
+    assert whole.get("no-such-vehicle") is None
+
+
+def test_chunked_ingestion_validates_and_downcasts(telemetry_csv):
+    raw = pd.read_csv(telemetry_csv).astype({"engine_rpm": object})
+    raw.loc[3, "vehicle_id"] = None
+    raw.loc[5, "timestamp"] = "not a time"
+    raw.loc[8, "engine_rpm"] = 99_999            # outside TELEMETRY_VALID_RANGES
+    raw.loc[9, "engine_rpm"] = "sensor fault"    # not a number
+    raw.loc[10, "battery_charge_percent"] = -5
+    raw.to_csv(telemetry_csv, index=False)
+
+    seen = []
+    def chunks(chunk_rows):
+        return datasets.read_telemetry_chunks(telemetry_csv, chunk_rows)
+    def typed(chunk_rows):
+        stats = {"rejected_rows": 0, "invalid_values": 0}
+        for chunk in datasets.downcast_telemetry_chunks(datasets.validate_telemetry_chunks(chunks(chunk_rows), stats)):
+            seen.append(chunk)
+        return stats
+
+    assert typed(64) == {"rejected_rows": 2, "invalid_values": 3}
+    assert sum(len(chunk) for chunk in seen) == len(raw) - 2 and max(len(chunk) for chunk in seen) <= 64
+    chunk = seen[0]
+    assert chunk["engine_temp_c"].dtype == np.float32 and chunk["abs_fault_indicator"].dtype == np.int8
+    assert isinstance(chunk["vehicle_id"].dtype, pd.CategoricalDtype)
+    assert chunk["timestamp"].dtype == "datetime64[ns]"
+    assert np.isnan(chunk.loc[[8, 9], "engine_rpm"]).all() and np.isnan(chunk.loc[10, "battery_charge_percent"])
+
+    # The chunk size changes nothing but memory: same counts and aggregates
+    small, large = datasets.TelemetryAggregateStore(), datasets.TelemetryAggregateStore()
+    stats_small = datasets.ingest_telemetry(chunks(17), small)
+    stats_large = datasets.ingest_telemetry(chunks(1000), large)
+    assert stats_small["rows"] == stats_large["rows"] == len(raw) - 2
+    assert (stats_small["chunks"], stats_large["chunks"]) == (18, 1)
+    assert stats_small["invalid_values"] == stats_large["invalid_values"] == 3
+    pd.testing.assert_frame_equal(small.summary("mean").sort_index(), large.summary("mean").sort_index(), rtol=1e-6)
+
+
+@pytest.mark.parametrize("op", ["<", "<=", ">", ">="])
+def test_telemetry_index_where_matches_boolean_masks(telemetry_csv, op):
+    df = datasets.load_telemetry_frame(telemetry_csv).copy()
+    df.loc[df.index[::11], "brake_temp_c"] = np.nan
+    index = datasets.TelemetryIndex(df)
+    frame = index.frame
+    vehicles = sorted(frame["vehicle_id"].astype(str).unique())
+    start, end = frame["timestamp"].quantile(0.25), frame["timestamp"].quantile(0.75)
+    compare = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}[op]
+    in_window = frame["timestamp"].between(start, end).to_numpy()
+    for_vehicles = frame["vehicle_id"].astype(str).isin(vehicles[:3]).to_numpy()
+
+    for column in ["brake_temp_c", "engine_rpm", "abs_fault_indicator"]:
+        value = frame[column].median()
+        mask = compare(frame[column].to_numpy(), frame[column].to_numpy().dtype.type(value))
+
+        cases = [
+            (index.where(column, op, value), mask),
+            (index.where(column, op, value, start=start, end=end), mask & in_window),
+            (index.where(column, op, value, start=start), mask & (frame["timestamp"] >= start).to_numpy()),
+            (index.where(column, op, value, vehicle_ids=vehicles[:3] + ["no-such-vehicle"]), mask & for_vehicles),
+            (index.where(column, op, value, start, end, vehicles[:3]), mask & in_window & for_vehicles)
+        ]
+        for result, expected in cases:
+            pd.testing.assert_frame_equal(result, frame[expected])
+
+    vehicle = vehicles[0]
+    readings = index.readings(vehicle, start, end)
+    assert readings["timestamp"].is_monotonic_increasing
+    pd.testing.assert_frame_equal(
+        readings, frame[(frame["vehicle_id"].astype(str) == vehicle).to_numpy() & in_window]
+    )
@@ -0,0 +1,451 @@
+"""
+Report pipeline tests against local stub weather (wttr.in format) and Groq-compatible LLM servers
+Run with: python -m pytest test_report_pipeline.py
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import logic
+from latency import percentile
+
+WEATHER_DELAY = 0.4
+LLM_DELAY = 0.3
+
+AI_ANALYSIS = {
+    "critical_issues": ["Brake pads worn"],
+    "accident_risk_analysis": {"base_risk": 20, "critical_parts_impact": [], "total_estimated_risk": 35},
+    "maintenance_tips": ["Check tyre pressure weekly"],
+    "road_specific_warnings": [],
+    "weather_advisories": ["Wet roads - brake early"]
+}
+
+
+class StubServer:
+    """Threaded HTTP server on a free localhost port with a configurable response delay"""
+
+    def __init__(self, handler_cls, delay, status=200):
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        server = self
+
+        class Handler(handler_cls):
+            stub = server
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.stub.requests.append(self.path)
+        time.sleep(self.stub.delay)
+        if self.stub.status != 200:
+            self.send_response(self.stub.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"current_condition": [{
+            "temp_C": "29",
+            "weatherDesc": [{"value": "Light rain"}],
+            "humidity": "84",
+            "windspeedKmph": "12"
+        }]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LLMHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-style /chat/completions endpoint as used by the Groq SDK"""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.stub.requests.append(payload)
+        time.sleep(self.stub.delay)
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(AI_ANALYSIS)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def weather_server(monkeypatch):
+    with StubServer(WeatherHandler, WEATHER_DELAY) as server:
+        monkeypatch.setattr(logic, "WEATHER_API_URL", server.url)
+        monkeypatch.setattr(logic, "weather_cache", logic.WeatherCache())
+        yield server
+
+
+@pytest.fixture
+def llm_server(monkeypatch):
+    with StubServer(LLMHandler, LLM_DELAY) as server:
+        monkeypatch.setenv("GROQ_API_BASE", server.url)
+        monkeypatch.setenv("GROQ_API_KEY", "test-key")
+        monkeypatch.setattr(logic, "llm_response_cache", logic.LLMResponseCache())
+        yield server
+
+
+def _report():
+    trips = [{"km": 120, "road": ["Mountain", "City"], "date": "2026-01-20"}]
+    return logic.get_structured_report(
+        "Petrol/Diesel Car", "Toyota Axio", 2016, 62000, "Kandy", "Kandy",
+        0, 50000, 52000, trips, ["Brake Pads"], "Squeaking brakes", {"Brake Pads": 60000}, "Petrol"
+    )
+
+
+def test_report_uses_stubbed_weather_and_llm(weather_server, llm_server):
+    report = _report()
+
+    assert report["weather"]["condition"] == "Light rain"
+    assert report["structured_data"]["critical_issues"] == AI_ANALYSIS["critical_issues"]
+    assert report["structured_data"]["spare_parts_shops"]
+    assert any("Rainy conditions" in f for f in report["accident_risk"]["factors"])
+
+    # The prompt was built with the weather result
+    prompt = llm_server.requests[0]["messages"][-1]["content"]
+    assert "Light rain" in prompt
+
+
+def test_stage_timings_recorded_and_stages_overlap(weather_server, llm_server):
+    report = _report()
+    timings = report["metadata"]["timings_ms"]
+
+    assert {"weather", "maintenance", "shops", "llm", "total"} <= set(timings)
+    assert timings["weather"] >= WEATHER_DELAY * 1000 * 0.9
+    assert timings["llm"] >= LLM_DELAY * 1000 * 0.9
+    # Only weather -> LLM is on the critical path; the local stages hide behind the weather call
+    assert timings["total"] < (WEATHER_DELAY + LLM_DELAY) * 1000 + 500
+
+
+def test_llm_failure_falls_back_to_default_analysis(weather_server, monkeypatch):
+    monkeypatch.setenv("GROQ_API_BASE", "http://127.0.0.1:9")
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(logic, "llm_manager", logic.LLMClientManager(backoff_base=0.01))
+
+    report = _report()
+
+    assert report["structured_data"]["maintenance_tips"] == ["Consult with a professional mechanic"]
+    assert report["weather"]["condition"] == "Light rain"
+
+
+# --- Weather cache ---
+def test_weather_cache_hit_skips_upstream(weather_server):
+    first = logic.get_weather_data("Colombo")
+    start = time.perf_counter()
+    second = logic.get_weather_data(" colombo ")
+
+    assert first == second
+    assert time.perf_counter() - start < WEATHER_DELAY / 2
+    assert len(weather_server.requests) == 1
+    assert logic.get_weather_metrics()["hits"] == 1
+
+
+def test_concurrent_misses_are_coalesced(weather_server):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(logic.get_weather_data("Colombo"))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(weather_server.requests) == 1
+    assert all(r["condition"] == "Light rain" for r in results) and len(results) == 10
+    metrics = logic.get_weather_metrics()
+    assert metrics["misses"] == 1 and metrics["coalesced"] == 9
+    assert metrics["upstream_latency_ms"]["last"] >= WEATHER_DELAY * 1000 * 0.9
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(20, 0, -1))
+    assert percentile(samples, 0.5) == 10
+    assert percentile(samples, 0.95) == 19
+    assert percentile([7.0], 0.95) == 7.0
+    assert percentile([], 0.5) is None
+
+
+def test_stale_value_served_while_revalidating(weather_server, monkeypatch):
+    monkeypatch.setattr(logic, "weather_cache", logic.WeatherCache(ttl=0.05, stale_ttl=60))
+    logic.get_weather_data("Galle")
+    time.sleep(0.1)
+
+    start = time.perf_counter()
+    stale = logic.get_weather_data("Galle")
+    assert stale["condition"] == "Light rain"
+    assert time.perf_counter() - start < WEATHER_DELAY / 2
+
+    # One background refresh went upstream
+    time.sleep(WEATHER_DELAY + 0.2)
+    assert len(weather_server.requests) == 2
+    assert logic.get_weather_metrics()["stale_hits"] == 1
+
+
+def test_failures_are_negatively_cached(monkeypatch):
+    with StubServer(WeatherHandler, 0, status=503) as server:
+        monkeypatch.setattr(logic, "WEATHER_API_URL", server.url)
+        monkeypatch.setattr(logic, "weather_cache", logic.WeatherCache(negative_ttl=60))
+
+        assert logic.get_weather_data("Jaffna") is None
+        assert logic.get_weather_data("Jaffna") is None
+        assert len(server.requests) == 1
+        metrics = logic.get_weather_metrics()
+        assert metrics["negative_hits"] == 1 and metrics["upstream_errors"] == 1
+
+
+# --- LLM response cache ---
+def test_repeat_report_reuses_cached_llm_answer(weather_server, llm_server):
+    first = _report()
+    second = _report()
+
+    assert len(llm_server.requests) == 1
+    assert second["structured_data"]["critical_issues"] == first["structured_data"]["critical_issues"]
+    assert second["metadata"]["timings_ms"]["llm"] < LLM_DELAY * 1000 / 2
+
+
+def test_cache_key_buckets_odometer_but_not_due_parts():
+    args = dict(v_type="Hybrid", model="Toyota Aqua", m_year=2015, service_odo=40000, fuel_type="Hybrid",
+                district="Colombo", parts_replaced=[], road_conditions=["City"],
+                weather={"condition": "Sunny", "temp": "31", "wind_speed": "10"}, additional_notes="")
+    due = [{"name": "Engine Oil (5L)"}]
+
+    same = logic.report_analysis_cache_key(odo=48100, parts_to_replace=due, **args)
+    assert same == logic.report_analysis_cache_key(odo=48900, parts_to_replace=due, **args)
+    assert same != logic.report_analysis_cache_key(odo=48900, parts_to_replace=due + [{"name": "Brake Pads"}], **args)
+
+
+def test_cache_key_covers_city_and_bucketed_parts_mileage():
+    args = dict(v_type="Hybrid", model="Toyota Aqua", m_year=2015, odo=48500, service_odo=40000, fuel_type="Hybrid",
+                district="Colombo", parts_to_replace=[], parts_replaced=["Brake Pads"], road_conditions=["City"],
+                weather=None, additional_notes="")
+    key = logic.report_analysis_cache_key(city="Dehiwala", parts_mileage={"Brake Pads": 45100}, **args)
+
+    assert key != logic.report_analysis_cache_key(city="Moratuwa", parts_mileage={"Brake Pads": 45100}, **args)
+    assert key == logic.report_analysis_cache_key(city=" dehiwala", parts_mileage={"Brake Pads": 45300}, **args)
+    assert key != logic.report_analysis_cache_key(city="Dehiwala", parts_mileage={"Brake Pads": 41000}, **args)
+    # Mileage of parts that were not replaced never reaches the prompt
+    assert key == logic.report_analysis_cache_key(
+        city="Dehiwala", parts_mileage={"Brake Pads": 45100, "Spark Plugs": 30000}, **args
+    )
+
+
+def test_sqlite_backend_is_shared_and_lru_bounded(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    writer = logic.LLMResponseCache(max_entries=2, sqlite_path=path)
+    reader = logic.LLMResponseCache(max_entries=2, sqlite_path=path)
+
+    writer.set("a", {"v": 1})
+    writer.set("b", {"v": 2})
+    assert reader.get("a") == {"v": 1}
+    writer.set("c", {"v": 3})
+
+    # "a" was read by the other worker, so "b" is the least recently used shared entry
+    assert logic.LLMResponseCache(sqlite_path=path).get("b") is None
+    assert logic.LLMResponseCache(sqlite_path=path).get("c") == {"v": 3}
+
+
+# --- LLM client manager ---
+class FakeStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = None
+
+
+class FakeLLM:
+    """Stands in for ChatGroq: fails with the queued status codes, then answers"""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if self.failures:
+            raise FakeStatusError(self.failures.pop(0))
+        return type("Message", (), {"content": f"echo: {prompt}"})()
+
+    def stream(self, prompt):
+        self.calls += 1
+        if self.failures:
+            raise FakeStatusError(self.failures.pop(0))
+        for token in ["Check ", "the ", "brake ", "pads."]:
+            time.sleep(0.01)
+            yield type("Chunk", (), {"content": token})()
+
+
+def test_llm_client_reused_across_calls(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    created = []
+    manager = logic.LLMClientManager(client_factory=lambda model, key: created.append(FakeLLM()) or created[-1])
+
+    assert manager.invoke("one") == "echo: one"
+    assert manager.invoke("two") == "echo: two"
+    assert len(created) == 1 and created[0].calls == 2
+
+
+def test_llm_retries_429_and_5xx_but_not_4xx(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    flaky = FakeLLM(failures=[429, 503])
+    manager = logic.LLMClientManager(backoff_base=0.001, client_factory=lambda model, key: flaky)
+    assert manager.invoke("hi") == "echo: hi"
+    assert flaky.calls == 3 and manager.stats["retries"] == 2
+
+    bad_request = FakeLLM(failures=[400])
+    manager = logic.LLMClientManager(backoff_base=0.001, client_factory=lambda model, key: bad_request)
+    with pytest.raises(FakeStatusError):
+        manager.invoke("hi")
+    assert bad_request.calls == 1
+
+
+def test_chat_streams_tokens_with_latency_stats(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    fake = FakeLLM(failures=[503])
+    monkeypatch.setattr(logic, "llm_manager", logic.LLMClientManager(backoff_base=0.001, client_factory=lambda m, k: fake))
+    stats = {}
+
+    chunks = list(logic.stream_chat_with_mechanic("Squeaky brakes?", "Honda Fit in Colombo", stats))
+
+    assert chunks == ["Check ", "the ", "brake ", "pads."]
+    assert 0 < stats["ttft_ms"] <= stats["total_ms"]
+    assert stats["chunks"] == 4
+    assert stats["error"] is False
+
+
+def test_chat_errors_are_flagged(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    broken = FakeLLM(failures=[400])
+    monkeypatch.setattr(logic, "llm_manager", logic.LLMClientManager(backoff_base=0.001, client_factory=lambda m, k: broken))
+    stats = {}
+
+    reply = "".join(logic.stream_chat_with_mechanic("Squeaky brakes?", "Honda Fit in Colombo", stats))
+    assert stats["error"] is True and reply
+
+    broken.failures = [400]
+    logic.chat_with_mechanic("Squeaky brakes?", "Honda Fit in Colombo", stats=stats)
+    assert stats["error"] is True
+
+    monkeypatch.setattr(logic, "llm_manager", logic.LLMClientManager(client_factory=lambda m, k: FakeLLM()))
+    assert logic.chat_with_mechanic("Squeaky brakes?", "Honda Fit in Colombo", stats=stats).startswith("echo:")
+    assert stats["error"] is False
+
+
+# --- Conversation memory ---
+def test_conversation_memory_stays_within_token_budget():
+    memory = logic.ConversationMemory(recent_turns=4, token_budget=600, summary_budget=150)
+    sizes = []
+    for i in range(200):
+        memory.add_turn(f"Question {i}: why do my brakes squeal on wet mornings?", f"Answer {i}. " + "Check the pads and rotors. " * 15)
+        sizes.append(memory.token_count())
+
+    assert max(sizes) <= 600 + 20  # budget plus section headers
+    context = memory.build_context()
+    assert "Question 199" in context and "Answer 199." in context  # newest turn verbatim
+    assert "EARLIER CONVERSATION" in context and "Question 0:" not in context
+    assert memory.total_turns == 200
+
+
+def test_chat_prompt_includes_history():
+    memory = logic.ConversationMemory()
+    memory.add_turn("My car is a 2012 Vitz", "Noted - a Toyota Vitz.")
+
+    prompt = logic._mechanic_chat_prompt("When should I change the oil?", "Vitz in Galle", memory)
+
+    assert "User: My car is a 2012 Vitz" in prompt
+    assert prompt.index("RECENT CONVERSATION") < prompt.index("USER QUESTION")
+
+
+# --- Sensor anomalies in the risk score ---
+def test_wheel_speed_divergence_raises_risk():
+    import datasets
+
+    detector = datasets.SensorAnomalyDetector(warmup=5)
+    steady = {"wheel_speed_fl_kph": 60.0, "wheel_speed_fr_kph": 60.5, "engine_temp_c": 90.0}
+    for i in range(20):
+        detector.update("VEH1", {**steady, "engine_temp_c": 90.0 + (i % 3) * 0.5, "wheel_speed_fr_kph": 60.0 + (i % 2)})
+    assert detector.findings("VEH1") == []
+
+    findings = detector.update("VEH1", {**steady, "wheel_speed_fr_kph": 35.0})
+    assert [f["sensor"] for f in findings] == ["wheel_speed_front_divergence_kph"]
+
+    condition = {"service_overdue": False, "tyre_wear_high": False, "brake_wear_high": False}
+    baseline = logic.calculate_accident_risk(condition, None, ["City"])
+    risk = logic.calculate_accident_risk(condition, None, ["City"], sensor_anomalies=findings)
+    assert risk["score"] == baseline["score"] + 10
+    assert any("wheel speed front divergence" in f for f in risk["factors"])
+
+
+def test_batch_risk_scores_match_scalar_rules():
+    condition = {"service_overdue": True, "tyre_wear_high": False, "brake_wear_high": True}
+    scenarios = [
+        (condition, {"condition": "Thunderstorm with heavy rain", "wind_speed": 40, "temp": 37}, ["Mountain", "Expressway"], ["Tyres", "Brake Pads", "Wiper Blades"]),
+        (condition, None, ["City"], ["Engine Oil", "Battery", "Shock Absorbers", "Brake Pads", "Tyres"]),
+        ({}, {"condition": "Clear", "wind_speed": 55, "temp": 30}, [], None),
+    ]
+    weather = [logic.encode_weather(w) for _, w, _, _ in scenarios]
+    counts = [[0] * len(logic.PART_CATEGORIES) for _ in scenarios]
+    for row, (_, _, _, parts) in zip(counts, scenarios):
+        for part in parts or []:
+            row[list(logic.PART_CATEGORIES).index(logic.classify_replaced_part(part))] += 1
+
+    batch = logic.score_risk_batch(
+        [logic.encode_conditions(c) for c, _, _, _ in scenarios],
+        [logic.encode_roads(r) for _, _, r, _ in scenarios],
+        counts, **{k: [w[k] for w in weather] for k in ["rain", "storm", "wind_speed", "temp"]}
+    )
+    scalar = [logic.calculate_accident_risk(*s) for s in scenarios]
+    assert batch["score"].tolist() == [r["score"] for r in scalar] == [80, 10, 12]
+    assert [logic.RISK_LEVELS[i][1] for i in batch["level"]] == [r["level"] for r in scalar]
+    assert batch["fired"]["moderate_wind"].tolist() == [True, False, False]
+    assert "✅ Wiper Blades recently replaced" in scalar[0]["factors"]
+
+
+def test_what_if_grid_matches_scalar_risk_without_network(monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("simulator must not call out")
+
+    monkeypatch.setattr(logic, "get_weather_data", no_network)
+    monkeypatch.setattr(logic.llm_manager, "invoke", no_network)
+    sim = logic.simulate_risk("Petrol/Diesel Car", 60000, 55000, "Petrol", ["Tyres"], distances=[0, 2000, 4000],
+                              weather_scenarios=["Clear", "Monsoon storm"], road_mixes=["City", "Mountain + Rough"])
+
+    assert sim["score"].shape == (3, 2, 2)
+    for i, odo in enumerate(sim["odometer"]):
+        condition = logic.assess_vehicle_condition(odo - 55000)
+        for w, weather in enumerate(sim["weather"]):
+            for r, roads in enumerate(sim["roads"]):
+                risk = logic.calculate_accident_risk(condition, logic.WHAT_IF_WEATHER[weather], logic.WHAT_IF_ROADS[roads], ["Tyres"])
+                assert sim["score"][i, w, r] == risk["score"]
+    assert sim["score"][2, 1, 1] > sim["score"][0, 0, 0]
+    assert len(sim["due_parts"][2]) >= len(sim["due_parts"][0])
+    assert len(logic.what_if_frame(sim)) == 12